@@ -1,10 +1,54 @@
+import asyncio
+from types import FrameType
 from typing import Dict, Optional, Any
 
 import uvicorn
 
 from .app import create_app
 from .auth import AuthBackend
+from .cache import Cache
+from .capture import CaptureConfig
+from .deadline import TimeoutConfig
+from .exposition import MetricsEndpointConfig
+from .health import HealthConfig, HealthMonitor
+from .idempotency import IdempotencyConfig
+from .jobs import JobQueueConfig
+from .log import LogConfig
+from .memory import MemoryConfig
+from .offload import ProcessPoolConfig
+from .pagination import PaginationConfig
+from .priority import PriorityConfig
+from .profiling import ProfilingConfig
 from .security import CORSConfig
+from .startup import WarmupConfig
+from .subscriptions import SubscriptionConfig
+from .tracing import TracingConfig
+
+class _DrainingServer(uvicorn.Server):
+	def __init__(self, config: uvicorn.Config, health_monitor: HealthMonitor) -> None:
+		super().__init__(config)
+		self.health_monitor = health_monitor
+		# kept so the task isn't garbage collected mid-drain
+		self._drain_task: Optional['asyncio.Task[None]'] = None
+
+	def handle_exit(self, sig: int, frame: Optional[FrameType]) -> None:
+		# a second signal skips the drain and falls back to uvicorn's own handling
+		if self.health_monitor.draining:
+			super().handle_exit(sig, frame)
+			return
+
+		# stop taking new work and report unready, then only let uvicorn shut down
+		# once in-flight requests have finished or the drain deadline has passed
+		self.health_monitor.begin_drain()
+		loop = asyncio.get_event_loop()
+		loop.call_soon_threadsafe(self._start_drain, sig, frame)
+
+	def _start_drain(self, sig: int, frame: Optional[FrameType]) -> None:
+		self._drain_task = asyncio.get_event_loop().create_task(self._drain_then_exit(sig, frame))
+
+	async def _drain_then_exit(self, sig: int, frame: Optional[FrameType]) -> None:
+		await self.health_monitor.wait_for_drain()
+		super().handle_exit(sig, frame)
 
 def run(
 		srv: Any,
@@ -12,9 +56,51 @@ def run(
 		auth_backend: Optional[AuthBackend] = None,
 		cors_config: Optional[CORSConfig] = None,
 		port: int = 80,
-		metrics_port: int = 5000,
+		metrics_port: Optional[int] = 5000,
 		host: str = "0.0.0.0",
 		uvicorn_kwargs: Dict[str, Any] = {},
+		process_pool_config: Optional[ProcessPoolConfig] = None,
+		timeout_config: Optional[TimeoutConfig] = None,
+		health_config: Optional[HealthConfig] = None,
+		pagination_config: Optional[PaginationConfig] = None,
+		max_body_bytes: Optional[int] = None,
+		job_queue_config: Optional[JobQueueConfig] = None,
+		log_config: Optional[LogConfig] = None,
+		tracing_config: Optional[TracingConfig] = None,
+		profiling_config: Optional[ProfilingConfig] = None,
+		memory_config: Optional[MemoryConfig] = None,
+		subscription_config: Optional[SubscriptionConfig] = None,
+		metrics_endpoint_config: Optional[MetricsEndpointConfig] = None,
+		idempotency_config: Optional[IdempotencyConfig] = None,
+		response_cache: Optional[Cache] = None,
+		capture_config: Optional[CaptureConfig] = None,
+		warmup_config: Optional[WarmupConfig] = None,
+		priority_config: Optional[PriorityConfig] = None,
 	) -> None:
-	app = create_app(srv, name, auth_backend, cors_config, metrics_port)
-	uvicorn.run(app, host = host, port = port, **uvicorn_kwargs)
+	# uvicorn can only reload or fork workers from an import string, and run() is given the service itself
+	if uvicorn_kwargs.get('reload') or (uvicorn_kwargs.get('workers') or 1) > 1:
+		raise Exception('reload and workers need the app as an import string: serve a create_app factory with the uvicorn CLI instead')
+
+	app = create_app(
+		srv, name, auth_backend, cors_config, metrics_port,
+		process_pool_config = process_pool_config,
+		timeout_config = timeout_config,
+		health_config = health_config,
+		pagination_config = pagination_config,
+		max_body_bytes = max_body_bytes,
+		job_queue_config = job_queue_config,
+		log_config = log_config,
+		tracing_config = tracing_config,
+		profiling_config = profiling_config,
+		memory_config = memory_config,
+		subscription_config = subscription_config,
+		metrics_endpoint_config = metrics_endpoint_config,
+		idempotency_config = idempotency_config,
+		response_cache = response_cache,
+		capture_config = capture_config,
+		warmup_config = warmup_config,
+		priority_config = priority_config,
+	)
+
+	config = uvicorn.Config(app, host = host, port = port, **uvicorn_kwargs)
+	_DrainingServer(config, getattr(app, 'state').health_monitor).run()
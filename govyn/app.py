@@ -1,19 +1,48 @@
-from typing import Any, Optional
+from typing import Any, List, Optional, Sequence
 
 from starlette.applications import Starlette
 from starlette.middleware import Middleware
-from starlette.responses import JSONResponse
-from starlette.routing import Mount, Route
-from starlette.types import ASGIApp
+from starlette.routing import BaseRoute, Mount, Route
 
 from .auth import AuthBackend, AuthMiddleware
-from .endpoint import make_endpoint
+from .batching import attach_batch_metrics
+from .body import BodyReader
+from .cache import Cache, InMemoryCache
+from .capture import CaptureConfig, CaptureMiddleware, CaptureRecorder
+from .deadline import DeadlinePolicy, TimeoutConfig, default_timeout_config
+from .endpoint import make_endpoint, query_string_parser
 from .errors import JSONErrorMiddleware
+from .etag import ResponseCache
+from .exposition import MetricsEndpointConfig, MetricsExposition
+from .health import (HealthConfig, HealthMonitor, InFlightMiddleware,
+                     default_health_config, health_app)
+from .idempotency import (IdempotencyConfig, IdempotencyGuard,
+                          default_idempotency_config)
+from .jobs import JobQueue, JobQueueConfig, default_job_queue_config
+from .log import (AccessLogMiddleware, LogConfig, StructuredLogger,
+                  default_log_config)
+from .memory import (MemoryConfig, MemoryDebugAPI, MemoryTracker,
+                     PayloadSizeMiddleware)
 from .metrics import MetricsMiddleware, MetricsRegistry
+from .offload import ProcessPool, ProcessPoolConfig, default_process_pool_config
 from .openapi import openapi_app
+from .pagination import (PAGINATION_SECRET_ENV, PaginationConfig, Paginator,
+                         configured_pagination_secret,
+                         default_pagination_config)
+from .priority import (PriorityConfig, PriorityScheduler,
+                       default_priority_config)
+from .profiling import (DebugAPI, Profiler, ProfilingConfig,
+                        default_profiling_config)
+from .resources import ResourceRegistry
 from .route_def import make_route_def
+from .startup import (StartupGraph, Warmup, WarmupConfig,
+                      argless_warmup_requests, startup_dependencies)
 from .security import (CORSConfig, cors_middleware_from_config,
                        permissive_cors_config)
+from .subscriptions import (SubscriptionConfig, SubscriptionHub,
+                            default_subscription_config, subscription_routes)
+from .tracing import (Tracer, TracingConfig, TracingMiddleware,
+                      default_tracing_config)
 
 
 def create_app(
@@ -22,13 +51,35 @@ def create_app(
 		auth_backend: Optional[AuthBackend] = None,
 		cors_config: Optional[CORSConfig] = None,
 		metrics_port: Optional[int] = None,
-	) -> ASGIApp:
+		process_pool_config: Optional[ProcessPoolConfig] = None,
+		timeout_config: Optional[TimeoutConfig] = None,
+		health_config: Optional[HealthConfig] = None,
+		pagination_config: Optional[PaginationConfig] = None,
+		max_body_bytes: Optional[int] = None,
+		job_queue_config: Optional[JobQueueConfig] = None,
+		log_config: Optional[LogConfig] = None,
+		tracing_config: Optional[TracingConfig] = None,
+		profiling_config: Optional[ProfilingConfig] = None,
+		memory_config: Optional[MemoryConfig] = None,
+		subscription_config: Optional[SubscriptionConfig] = None,
+		metrics_endpoint_config: Optional[MetricsEndpointConfig] = None,
+		idempotency_config: Optional[IdempotencyConfig] = None,
+		response_cache: Optional[Cache] = None,
+		capture_config: Optional[CaptureConfig] = None,
+		warmup_config: Optional[WarmupConfig] = None,
+		priority_config: Optional[PriorityConfig] = None,
+	) -> Starlette:
 	name = name or type(srv).__name__
 	cors_config = cors_config or permissive_cors_config()
 
-	http_methods = [ 'get', 'post' ]
+	resource_registry = getattr(srv, 'resources', None)
+	if not isinstance(resource_registry, ResourceRegistry):
+		resource_registry = None
+	resource_names = resource_registry.names() if resource_registry else []
+
+	http_methods = [ 'get', 'post', 'sub' ]
 	method_prefixes = tuple([ m + '_' for m in http_methods ])
-	route_defs = [ make_route_def(getattr(srv, m)) for m in dir(srv) if m in http_methods or m.startswith(method_prefixes) ]
+	route_defs = [ make_route_def(getattr(srv, m), resource_names) for m in dir(srv) if m in http_methods or m.startswith(method_prefixes) ]
 
 	metrics_registry = getattr(srv, 'metrics', None)
 	if not metrics_registry or not isinstance(metrics_registry, MetricsRegistry):
@@ -41,46 +92,191 @@ def create_app(
 		if metrics_port:
 			await prom_service.start(addr = '0.0.0.0', port = metrics_port)
 
-	startup_funcs = [ metrics_async_init ]
-	shutdown_funcs = []
+	log_config = log_config or default_log_config()
+	logger = StructuredLogger(log_config, metrics_registry)
+	tracer = Tracer(tracing_config or default_tracing_config(), metrics_registry)
+	health_monitor = HealthMonitor(health_config or default_health_config(), metrics_registry)
+
+	# startup hooks run concurrently, each one once the hooks it lists as dependencies are done
+	startup_graph = StartupGraph(metrics_registry, logger)
+	startup_graph.add('logger', logger.startup)
+	startup_graph.add('tracer', tracer.startup)
+	startup_graph.add('metrics', metrics_async_init)
+	startup_graph.add('health', health_monitor.startup)
+	core_hooks = [ 'logger', 'tracer', 'metrics', 'health' ]
+	# built-in components come up once the service has, as they did when startup ran in sequence
+	builtin_after = list(core_hooks)
+	# drain in-flight requests before anything they might depend on is torn down
+	shutdown_funcs = [ health_monitor.shutdown ]
 
-	def _attach_lifecyle_methods(obj: Any) -> None:
+	def _attach_lifecyle_methods(obj: Any, hook_name: str, after: Sequence[str] = ()) -> None:
 		if startup_func := getattr(obj, 'startup', None):
-			startup_funcs.append(startup_func)
+			startup_graph.add(hook_name, startup_func, startup_dependencies(startup_func, after or builtin_after))
 		if shutdown_func := getattr(obj, 'shutdown', None):
 			shutdown_funcs.append(shutdown_func)
 
-	_attach_lifecyle_methods(srv)
+	# resources come up before the service so its startup hooks can use them, and go down after it
+	resource_hooks = [ f'resource:{r}' for r in resource_names ]
+	if resource_registry:
+		resource_registry._attach_metrics(metrics_registry)
+		for resource_name, hook_name in zip(resource_names, resource_hooks):
+			startup_graph.add(hook_name, resource_registry.get(resource_name).startup, core_hooks)
+
+	service_after = [ *core_hooks, *resource_hooks ]
+	service_hooks = [ 'service' ] if getattr(srv, 'startup', None) else []
+	_attach_lifecyle_methods(srv, 'service', service_after)
+	for m in dir(srv):
+		if m.startswith('startup_'):
+			startup_func = getattr(srv, m)
+			service_hooks.append(m[len('startup_'):])
+			startup_graph.add(service_hooks[-1], startup_func, startup_dependencies(startup_func, service_after))
+	builtin_after += [ *resource_hooks, *service_hooks ]
+	attach_batch_metrics(srv, metrics_registry)
+
+	if resource_registry:
+		shutdown_funcs.append(resource_registry.shutdown)
+
+	process_pool = None
+	if any(r.offload for r in route_defs):
+		process_pool = ProcessPool(process_pool_config or default_process_pool_config(), metrics_registry)
+		_attach_lifecyle_methods(process_pool, 'process_pool')
+
+	job_queue = None
+	job_route_defs = [ r for r in route_defs if r.background_job ]
+	if job_route_defs:
+		job_queue = JobQueue(job_queue_config or default_job_queue_config(), metrics_registry, logger)
+		_attach_lifecyle_methods(job_queue, 'jobs')
+		route_defs += [
+			make_route_def(handler)
+			for r in job_route_defs
+			for handler in job_queue.route_handlers(r.path, r.return_type, r.requires_privilege)
+		]
+
+	idempotency_guard = None
+	if any(r.idempotency for r in route_defs):
+		idempotency_guard = IdempotencyGuard(idempotency_config or default_idempotency_config(), metrics_registry)
+		_attach_lifecyle_methods(idempotency_guard, 'idempotency')
+
+	server_cache = None
+	if any(r.cache and r.cache.server_ttl_secs is not None for r in route_defs):
+		server_cache = ResponseCache(response_cache or InMemoryCache(), metrics_registry)
+		_attach_lifecyle_methods(server_cache, 'response_cache')
 
-	middleware = [ Middleware(JSONErrorMiddleware) ]
+	# handlers only queue for a slot when asked to, either by a config or by a route's own priority
+	priority_scheduler = None
+	if priority_config or any(r.priority for r in route_defs):
+		priority_config = priority_config or default_priority_config()
+		for r in route_defs:
+			if r.priority is not None:
+				PriorityScheduler.check_class(r.priority, priority_config)
+		priority_scheduler = PriorityScheduler(priority_config, metrics_registry)
+
+	deadline_policy = DeadlinePolicy(timeout_config or default_timeout_config(), metrics_registry)
+	# a random secret only verifies cursors in the process that made it, so behind several workers a
+	# follow-up request that lands elsewhere would be rejected
+	if any(r.pagination for r in route_defs) and pagination_config is None and configured_pagination_secret() is None:
+		logger.log('warning', 'pagination_secret_not_configured', detail = f'cursors only verify in this process: pass a pagination_config or set {PAGINATION_SECRET_ENV}')
+	paginator = Paginator(pagination_config or default_pagination_config())
+	body_reader = BodyReader(max_body_bytes, metrics_registry)
+
+	middleware = [ Middleware(JSONErrorMiddleware, logger = logger) ]
 	if auth_backend:
 		middleware.append(Middleware(AuthMiddleware, auth_backend = auth_backend, metrics_registry = metrics_registry))
-		_attach_lifecyle_methods(auth_backend)
+		_attach_lifecyle_methods(auth_backend, 'auth')
+
+	profiler = Profiler(profiling_config or default_profiling_config(), metrics_registry)
+	_attach_lifecyle_methods(profiler, 'profiler')
+	# handlers are only wrapped for CPU stats when they're asked for, so the default costs nothing per request
+	route_profiler = profiler if profiler.config.route_cpu_stats else None
+
+	subscription_hub = None
+	sub_route_defs = [ r for r in route_defs if r.http_method == 'sub' ]
+	if sub_route_defs:
+		subscription_hub = SubscriptionHub(subscription_config or default_subscription_config(), metrics_registry)
+		_attach_lifecyle_methods(subscription_hub, 'subscriptions')
+		# open subscriptions would otherwise hold up draining until it times out
+		health_monitor.on_drain(subscription_hub.close_all)
+
+	# memory instrumentation is opt-in, and costs nothing unless a config is passed
+	memory_tracker = None
+	if memory_config:
+		memory_tracker = MemoryTracker(memory_config, metrics_registry)
+		_attach_lifecyle_methods(memory_tracker, 'memory')
+
+	capture_recorder = None
+	if capture_config:
+		capture_recorder = CaptureRecorder(capture_config, metrics_registry)
+		_attach_lifecyle_methods(capture_recorder, 'capture')
+
+	# debug routes go through the same auth as everything else, but stay out of the schema and route stats
+	debug_apis: List[Any] = [ DebugAPI(profiler) ]
+	if memory_tracker:
+		debug_apis.append(MemoryDebugAPI(memory_tracker))
+	debug_route_defs = [ make_route_def(getattr(api, m)) for api in debug_apis for m in dir(api) if m.startswith('get_') ]
+
+	core_routes: List[BaseRoute] = [
+		Route(r.path, make_endpoint(r, deadline_policy, process_pool, paginator, body_reader, resource_registry, job_queue, route_profiler, memory_tracker, idempotency_guard, server_cache, priority_scheduler), methods = [ r.http_method.upper() ])
+		for r in route_defs if r.http_method != 'sub'
+	]
+	if subscription_hub:
+		for r in sub_route_defs:
+			core_routes += subscription_routes(r, subscription_hub, query_string_parser, auth_backend)
 
 	core_app = Starlette(
-		routes = [
-			Route(r.path, make_endpoint(r), methods = [ r.http_method.upper() ])
-			for r in route_defs
+		routes = core_routes + [
+			Route('/debug' + r.path, make_endpoint(r, deadline_policy), methods = [ r.http_method.upper() ])
+			for r in debug_route_defs
 		],
 		middleware = middleware,
 	)
 
-	health_app = Starlette(
-		routes = [
-			Route('/check', lambda _: JSONResponse({}))
-		]
-	)
+	# validated here rather than at startup, so a bad dependency fails as soon as the app is built
+	startup_graph.ordered()
+	startup_funcs = [ startup_graph.run ]
+	if warmup_config:
+		warmup_requests = list(warmup_config.requests)
+		# without credentials, routes behind auth would only ever warm up the 401 path
+		if warmup_config.argless_routes and (not auth_backend or warmup_config.headers):
+			warmup_requests += argless_warmup_requests(route_defs)
+		warmup = Warmup(warmup_config, warmup_requests, metrics_registry, logger)
+		startup_funcs.append(warmup.run)
+	startup_funcs.append(health_monitor.mark_started)
+	# flushed last, so anything traced or logged by the other shutdown hooks still gets written
+	shutdown_funcs += [ tracer.shutdown, logger.shutdown ]
 
-	return Starlette(
-		routes = [
-			Mount('/openapi', openapi_app(name, route_defs, auth_backend)),
-			Mount('/health', health_app),
-			Mount('/', core_app),
-		],
+	# scrapes and probes keep being served while draining, and stay out of traces and access logs
+	exempt_prefixes = ( '/health', '/metrics' )
+	app_middleware = [
+		Middleware(TracingMiddleware, tracer = tracer, exempt_prefix = exempt_prefixes),
+		Middleware(InFlightMiddleware, health_monitor = health_monitor, exempt_prefix = exempt_prefixes),
+		Middleware(MetricsMiddleware, metrics_registry = metrics_registry),
+		cors_middleware_from_config(cors_config),
+	]
+	if log_config.access_log:
+		app_middleware.insert(1, Middleware(AccessLogMiddleware, logger = logger, exempt_prefix = exempt_prefixes))
+	if memory_tracker:
+		route_paths = [ r.path for r in route_defs ] + [ '/debug' + r.path for r in debug_route_defs ]
+		app_middleware.append(Middleware(PayloadSizeMiddleware, memory_tracker = memory_tracker, route_paths = route_paths, exempt_prefix = exempt_prefixes + ( '/openapi', )))
+	if capture_recorder:
+		# only application traffic is worth replaying
+		app_middleware.append(Middleware(CaptureMiddleware, recorder = capture_recorder, exempt_prefix = exempt_prefixes + ( '/openapi', '/debug' )))
+
+	outer_routes: List[BaseRoute] = [
+		Mount('/openapi', openapi_app(name, route_defs, auth_backend)),
+		Mount('/health', health_app(health_monitor)),
+	]
+	if metrics_endpoint_config:
+		exposition = MetricsExposition(metrics_endpoint_config, metrics_registry)
+		outer_routes.append(Route('/metrics', exposition.endpoint, methods = [ 'GET' ]))
+
+	app = Starlette(
+		routes = outer_routes + [ Mount('/', core_app) ],
 		on_startup = startup_funcs,
 		on_shutdown = shutdown_funcs,
-		middleware = [
-			Middleware(MetricsMiddleware, metrics_registry = metrics_registry),
-			cors_middleware_from_config(cors_config),
-		],
+		middleware = app_middleware,
 	)
+	getattr(app, 'state').health_monitor = health_monitor
+	getattr(app, 'state').startup_graph = startup_graph
+	if warmup_config:
+		warmup.app = app
+	return app
@@ -0,0 +1,95 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from starlette.types import ASGIApp, Message
+
+# runs an app's startup and shutdown hooks when there's no server around to do it
+class ASGILifespan:
+	def __init__(self, app: ASGIApp) -> None:
+		self.app = app
+		self._task: Optional['asyncio.Task[None]'] = None
+		self._queue: Optional['asyncio.Queue[Message]'] = None
+		self._events: Optional['asyncio.Queue[Message]'] = None
+
+	async def _send(self, event: str) -> None:
+		assert self._queue and self._events
+		await self._queue.put({ 'type': f'lifespan.{event}' })
+		message = await self._events.get()
+		if message['type'] != f'lifespan.{event}.complete':
+			raise Exception(f'app {event} failed: {message.get("message", "")}')
+
+	async def startup(self) -> None:
+		self._queue = asyncio.Queue()
+		self._events = asyncio.Queue()
+		self._task = asyncio.ensure_future(self.app(
+			{ 'type': 'lifespan', 'asgi': { 'version': '3.0' } },
+			self._queue.get,
+			self._events.put,
+		))
+		await self._send('startup')
+
+	async def shutdown(self) -> None:
+		await self._send('shutdown')
+		if self._task:
+			await self._task
+
+# sends a single request straight into an ASGI app, without a server or a socket in between
+async def asgi_exchange(
+		app: ASGIApp,
+		method: str,
+		path: str,
+		query: str = '',
+		headers: Dict[str, str] = {},
+		body: bytes = b'',
+	) -> Tuple[int, Dict[str, str], bytes]:
+	request_sent = False
+	response_done = asyncio.Event()
+	status = 500
+	response_headers: Dict[str, str] = {}
+	chunks: List[bytes] = []
+
+	async def receive() -> Message:
+		nonlocal request_sent
+		if not request_sent:
+			request_sent = True
+			return { 'type': 'http.request', 'body': body, 'more_body': False }
+		# streaming responses listen for a disconnect, which only comes once they've finished
+		await response_done.wait()
+		return { 'type': 'http.disconnect' }
+
+	async def send(message: Message) -> None:
+		nonlocal status
+		if message['type'] == 'http.response.start':
+			status = message['status']
+			response_headers.update({ k.decode('latin-1'): v.decode('latin-1') for k, v in message.get('headers', []) })
+		elif message['type'] == 'http.response.body':
+			chunks.append(message.get('body', b''))
+			if not message.get('more_body', False):
+				response_done.set()
+
+	await app({
+		'type': 'http',
+		'asgi': { 'version': '3.0' },
+		'http_version': '1.1',
+		'method': method,
+		'scheme': 'http',
+		'path': path,
+		'raw_path': path.encode('utf-8'),
+		'query_string': query.encode('latin-1'),
+		'root_path': '',
+		'headers': [ (k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers.items() ],
+		'client': ( '127.0.0.1', 0 ),
+		'server': ( 'localhost', 80 ),
+	}, receive, send)
+	return status, response_headers, b''.join(chunks)
+
+async def asgi_request(
+		app: ASGIApp,
+		method: str,
+		path: str,
+		query: str = '',
+		headers: Dict[str, str] = {},
+		body: bytes = b'',
+	) -> Tuple[int, bytes]:
+	status, _, response_body = await asgi_exchange(app, method, path, query, headers, body)
+	return status, response_body
@@ -9,11 +9,14 @@ from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoin
 
 from .errors import Unauthorised
 from .metrics import MetricsRegistry
+from .tracing import span
 
 _REQUIRES_PRIVILEGE_ATTR = '_requires_privilege'
 
 @dataclass
 class Principal:
+	# auth backends build one per request, so they're slotted rather than carrying a __dict__ each
+	__slots__ = ( 'id', 'privileges' )
 	id: str
 	privileges: Set[str]
 
@@ -38,7 +41,7 @@ class AuthMiddleware(BaseHTTPMiddleware):
 		self.principal_resolution_histogram = metrics_registry.histogram('api_auth_principal_resolution_seconds')
 
 	async def dispatch(self, req: Request, call_next: RequestResponseEndpoint) -> Response:
-		with self.principal_resolution_histogram.observe_time():
+		with self.principal_resolution_histogram.observe_time(), span('auth'):
 			principal = await self.auth_backend.resolve_principal(req)
 
 		if principal is None:
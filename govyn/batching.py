@@ -0,0 +1,109 @@
+import asyncio
+from time import perf_counter
+from typing import (Any, Awaitable, Callable, Dict, Generic, Hashable, List,
+                    Optional, Sequence, Set, TypeVar)
+
+from .metrics import MetricsRegistry
+
+K = TypeVar('K', bound = Hashable)
+V = TypeVar('V')
+
+BatchFunc = Callable[[ List[K] ], Awaitable[Sequence[V]]]
+
+_BATCH_SIZE_BUCKETS = [ 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000 ]
+
+class _BatchMetrics:
+	def __init__(self, metrics_registry: MetricsRegistry) -> None:
+		self.size_histogram = metrics_registry.histogram('api_batch_size', buckets = _BATCH_SIZE_BUCKETS)
+		self.wait_histogram = metrics_registry.histogram('api_batch_wait_seconds')
+		self.load_histogram = metrics_registry.histogram('api_batch_load_seconds')
+
+# collects the keys requested by concurrent callers and fetches them with one call to load_batch,
+# which must return a value for every key, in the same order. declared on the service object, so
+# create_app can find it and attach metrics
+class BatchLoader(Generic[K, V]):
+	def __init__(
+			self,
+			name: str,
+			load_batch: BatchFunc[K, V],
+			max_batch_size: int = 100,
+			max_wait_secs: float = 0.002,
+		) -> None:
+		self.name = name
+		self.load_batch = load_batch
+		self.max_batch_size = max_batch_size
+		self.max_wait_secs = max_wait_secs
+		self._metrics: Optional[_BatchMetrics] = None
+		# keys waiting for the next batch; the same key requested twice shares one slot
+		self._batch: Dict[K, 'asyncio.Future[V]'] = {}
+		self._batch_started = 0.0
+		self._timer: Optional[asyncio.TimerHandle] = None
+		self._running: Set['asyncio.Task[None]'] = set()
+
+	async def load(self, key: K) -> V:
+		future = self._batch.get(key)
+		if future is None:
+			loop = asyncio.get_running_loop()
+			future = loop.create_future()
+			if not self._batch:
+				self._batch_started = perf_counter()
+				self._timer = loop.call_later(self.max_wait_secs, self._dispatch)
+			self._batch[key] = future
+			if len(self._batch) >= self.max_batch_size:
+				self._dispatch()
+
+		# one caller giving up mustn't cancel the result for everyone else waiting on the same key
+		return await asyncio.shield(future)
+
+	async def load_many(self, keys: Sequence[K]) -> List[V]:
+		return list(await asyncio.gather(*[ self.load(k) for k in keys ]))
+
+	def _dispatch(self) -> None:
+		if self._timer:
+			self._timer.cancel()
+			self._timer = None
+
+		batch, self._batch = self._batch, {}
+		if not batch:
+			return
+
+		if self._metrics:
+			self._metrics.size_histogram.observe(len(batch), loader = self.name)
+			self._metrics.wait_histogram.observe(perf_counter() - self._batch_started, loader = self.name)
+
+		task = asyncio.ensure_future(self._run(batch))
+		self._running.add(task)
+		task.add_done_callback(self._running.discard)
+
+	async def _run(self, batch: Dict[K, 'asyncio.Future[V]']) -> None:
+		keys = list(batch)
+		start_time = perf_counter()
+		try:
+			values = await self.load_batch(keys)
+			if len(values) != len(keys):
+				raise ValueError(f'batch loader {self.name} returned {len(values)} values for {len(keys)} keys')
+		except asyncio.CancelledError:
+			for future in batch.values():
+				future.cancel()
+			raise
+		except Exception as e:
+			for future in batch.values():
+				if not future.done():
+					future.set_exception(e)
+			return
+		finally:
+			if self._metrics:
+				self._metrics.load_histogram.observe(perf_counter() - start_time, loader = self.name)
+
+		for future, value in zip(batch.values(), values):
+			if not future.done():
+				future.set_result(value)
+
+def attach_batch_metrics(srv: Any, metrics_registry: MetricsRegistry) -> None:
+	loaders = [ v for v in getattr(srv, '__dict__', {}).values() if isinstance(v, BatchLoader) ]
+	if not loaders:
+		return
+
+	metrics = _BatchMetrics(metrics_registry)
+	for loader in loaders:
+		loader._metrics = metrics
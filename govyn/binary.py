@@ -0,0 +1,156 @@
+import mmap
+import os
+from dataclasses import dataclass
+from email.utils import formatdate
+from typing import IO, Dict, Optional, Tuple
+from urllib.parse import quote
+
+from starlette.concurrency import run_in_threadpool, run_until_first_complete
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from .errors import NotFound
+from .etag import etag_matches
+
+BINARY_MEDIA_TYPE = 'application/octet-stream'
+BINARY_SCHEMA = { 'type': 'string', 'format': 'binary' }
+
+# the ways a route can take or return raw bytes instead of a dataclass
+BINARY_BYTES = 'bytes'
+BINARY_STREAM = 'stream'
+BINARY_FILE = 'file'
+
+_CHUNK_BYTES = 256 * 1024
+
+@dataclass
+class File:
+	path: str
+	media_type: str = BINARY_MEDIA_TYPE
+	# when set, the file is sent as a download with this name rather than shown inline
+	filename: Optional[str] = None
+
+def _open_file(path: str) -> Tuple[IO[bytes], os.stat_result]:
+	f = open(path, 'rb')
+	try:
+		return f, os.fstat(f.fileno())
+	except BaseException:
+		f.close()
+		raise
+
+class _Unsatisfiable(Exception):
+	pass
+
+# a single byte range as (start, end), end exclusive. a missing, malformed or multi-range header
+# gets the whole file, which clients have to accept; a range entirely past the end can't be served
+def parse_range(value: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+	if not value or not value.startswith('bytes='):
+		return None
+	spec = value[len('bytes='):].strip()
+	if ',' in spec:
+		return None
+	first, sep, last = spec.partition('-')
+	if not sep or not (first or last):
+		return None
+	try:
+		if not first:
+			suffix = int(last)
+			if suffix <= 0:
+				raise _Unsatisfiable()
+			return max(0, size - suffix), size
+		start = int(first)
+		end = int(last) + 1 if last else size
+	except ValueError:
+		return None
+
+	if start < 0 or end <= start < size:
+		return None
+	if start >= size:
+		raise _Unsatisfiable()
+	return start, min(end, size)
+
+# the plain filename has quotes and backslashes escaped and anything outside printable ASCII replaced,
+# so it can't break out of the header; names that lost something that way also get the RFC 5987 form
+def content_disposition(filename: str) -> str:
+	printable = ''.join(c if ' ' <= c < '\x7f' else '_' for c in filename)
+	escaped = printable.replace('\\', '\\\\').replace('"', '\\"')
+	value = f'attachment; filename="{escaped}"'
+	if printable != filename:
+		value += f"; filename*=UTF-8''{quote(filename, safe = '')}"
+	return value
+
+class FileStreamResponse(Response):
+	def __init__(self, file: IO[bytes], offset: int, count: int, status_code: int, headers: Dict[str, str], media_type: str) -> None:
+		super().__init__(status_code = status_code, headers = { **headers, 'content-length': str(count) }, media_type = media_type)
+		self.file = file
+		self.offset = offset
+		self.count = count
+
+	async def _send_chunks(self, send: Send) -> None:
+		# the file is mapped once and sliced a chunk at a time, with page faults taken off the event loop
+		with mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ) as mapped:
+			position = self.offset
+			end = self.offset + self.count
+			while position < end:
+				chunk_end = min(position + _CHUNK_BYTES, end)
+				chunk = await run_in_threadpool(mapped.__getitem__, slice(position, chunk_end))
+				position = chunk_end
+				await send({ 'type': 'http.response.body', 'body': chunk, 'more_body': position < end })
+
+	async def _wait_for_disconnect(self, receive: Receive) -> None:
+		while True:
+			message = await receive()
+			if message['type'] == 'http.disconnect':
+				break
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+		try:
+			await send({ 'type': 'http.response.start', 'status': self.status_code, 'headers': self.raw_headers })
+			if scope['method'] == 'HEAD' or self.count == 0:
+				await send({ 'type': 'http.response.body', 'body': b'' })
+				return
+			# a client that goes away stops the reads, rather than the whole file being read for nobody
+			await run_until_first_complete(
+				(self._send_chunks, { 'send': send }),
+				(self._wait_for_disconnect, { 'receive': receive }),
+			)
+		finally:
+			self.file.close()
+
+async def file_response(req: Request, file: File) -> Response:
+	try:
+		f, stat = await run_in_threadpool(_open_file, file.path)
+	except (FileNotFoundError, IsADirectoryError):
+		raise NotFound('file not found')
+
+	size = stat.st_size
+	etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+	last_modified = formatdate(stat.st_mtime, usegmt = True)
+	headers = {
+		'accept-ranges': 'bytes',
+		'etag': etag,
+		'last-modified': last_modified,
+	}
+	if file.filename:
+		headers['content-disposition'] = content_disposition(file.filename)
+
+	if etag_matches(req, etag):
+		f.close()
+		return Response(status_code = 304, headers = { 'etag': etag })
+
+	byte_range: Optional[Tuple[int, int]] = None
+	# a range only applies to the version of the file the client already has part of
+	if_range = req.headers.get('if-range')
+	if if_range is None or if_range in (etag, last_modified):
+		try:
+			byte_range = parse_range(req.headers.get('range'), size)
+		except _Unsatisfiable:
+			f.close()
+			return Response(status_code = 416, headers = { 'content-range': f'bytes */{size}' })
+
+	if byte_range is None:
+		return FileStreamResponse(f, 0, size, 200, headers, file.media_type)
+
+	start, end = byte_range
+	headers['content-range'] = f'bytes {start}-{end - 1}/{size}'
+	return FileStreamResponse(f, start, end - start, 206, headers, file.media_type)
@@ -0,0 +1,74 @@
+from typing import AsyncIterator, Callable, List, Optional
+
+from starlette.requests import Request
+
+from .auth import TFunc
+from .errors import BadRequest, PayloadTooLarge
+from .metrics import MetricsRegistry
+
+_MAX_BODY_BYTES_ATTR = '_max_body_bytes'
+
+# a reasonable limit to pass as max_body_bytes; bodies are only limited when asked to, so upgrading never starts rejecting requests
+RECOMMENDED_MAX_BODY_BYTES = 1024 * 1024
+
+def max_body_size(max_bytes: int) -> Callable[[ TFunc ], TFunc]:
+	def _decorator(func: TFunc) -> TFunc:
+		setattr(func, _MAX_BODY_BYTES_ATTR, max_bytes)
+		return func
+	return _decorator
+
+class BodyReader:
+	def __init__(self, default_max_bytes: Optional[int], metrics_registry: MetricsRegistry) -> None:
+		self.default_max_bytes = default_max_bytes
+		self.rejected_counter = metrics_registry.counter('api_rejected_bodies')
+		self.rejected_bytes_counter = metrics_registry.counter('api_rejected_body_bytes')
+
+	def _reject(self, path: str, num_bytes: int, max_bytes: int) -> PayloadTooLarge:
+		self.rejected_counter.inc(path = path)
+		self.rejected_bytes_counter.add(num_bytes, path = path)
+		return PayloadTooLarge(f'request body exceeds the limit of {max_bytes} bytes')
+
+	def _check_declared_length(self, req: Request, path: str, max_bytes: int) -> None:
+		# honest clients tell us up front, so we can refuse before buffering anything
+		content_length = req.headers.get('content-length')
+		if content_length is not None:
+			try:
+				declared_bytes = int(content_length)
+			except ValueError:
+				raise BadRequest('invalid Content-Length header')
+			if declared_bytes > max_bytes:
+				raise self._reject(path, declared_bytes, max_bytes)
+
+	async def _limited_stream(self, req: Request, path: str, max_bytes: int) -> AsyncIterator[bytes]:
+		# everyone else (chunked uploads, or lying about the length) is cut off as soon as they cross the limit
+		received_bytes = 0
+		async for chunk in req.stream():
+			received_bytes += len(chunk)
+			if received_bytes > max_bytes:
+				raise self._reject(path, received_bytes, max_bytes)
+			yield chunk
+
+	# the body as it arrives, for handlers that take an AsyncIterator[bytes] and never hold all of it
+	def stream(self, req: Request, path: str, max_bytes: Optional[int] = None) -> AsyncIterator[bytes]:
+		if max_bytes is None:
+			max_bytes = self.default_max_bytes
+		if max_bytes is None:
+			return req.stream()
+
+		self._check_declared_length(req, path, max_bytes)
+		return self._limited_stream(req, path, max_bytes)
+
+	async def read(self, req: Request, path: str, max_bytes: Optional[int] = None) -> bytes:
+		if max_bytes is None:
+			max_bytes = self.default_max_bytes
+		if max_bytes is None:
+			return await req.body()
+
+		self._check_declared_length(req, path, max_bytes)
+		chunks: List[bytes] = [ chunk async for chunk in self._limited_stream(req, path, max_bytes) ]
+
+		# a body that arrived in one piece is returned as is, since joining a single chunk doesn't copy it
+		body = chunks[0] if len(chunks) == 1 else b''.join(chunks)
+		# same cache Request.body() uses, so anything reading the body later doesn't hit the exhausted stream
+		setattr(req, '_body', body)
+		return body
@@ -0,0 +1,287 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from starlette.requests import Request
+
+from .auth import AuthBackend, HeaderAuthBackend, Principal
+
+# values are opaque bytes, so the same backend can hold principals, rendered responses or anything else
+class Cache(ABC):
+	async def startup(self) -> None:
+		pass
+
+	async def shutdown(self) -> None:
+		pass
+
+	@abstractmethod
+	async def get(self, key: str) -> Optional[bytes]:
+		...
+
+	@abstractmethod
+	async def set(self, key: str, value: bytes, ttl_secs: Optional[float] = None) -> None:
+		...
+
+	@abstractmethod
+	async def delete(self, key: str) -> None:
+		...
+
+class InMemoryCache(Cache):
+	def __init__(self, max_entries: int = 10000) -> None:
+		self.max_entries = max_entries
+		# least recently used first, with an optional monotonic expiry per entry
+		self._entries: 'OrderedDict[str, Tuple[Optional[float], bytes]]' = OrderedDict()
+
+	async def get(self, key: str) -> Optional[bytes]:
+		entry = self._entries.get(key)
+		if entry is None:
+			return None
+		expires_at, value = entry
+		if expires_at is not None and expires_at <= time.monotonic():
+			del self._entries[key]
+			return None
+		self._entries.move_to_end(key)
+		return value
+
+	async def set(self, key: str, value: bytes, ttl_secs: Optional[float] = None) -> None:
+		expires_at = time.monotonic() + ttl_secs if ttl_secs is not None else None
+		self._entries[key] = (expires_at, value)
+		self._entries.move_to_end(key)
+		while len(self._entries) > self.max_entries:
+			self._entries.popitem(last = False)
+
+	async def delete(self, key: str) -> None:
+		self._entries.pop(key, None)
+
+# advisory locks on a single byte of a file, blocking until they're held. checked per platform so type
+# checkers targeting Windows, which has no fcntl, still see every name defined
+if sys.platform != 'win32':
+	import fcntl
+	_has_fcntl = True
+
+	def _lock_byte(fd: int, offset: int) -> None:
+		fcntl.lockf(fd, fcntl.LOCK_EX, 1, offset)
+
+	def _unlock_byte(fd: int, offset: int) -> None:
+		fcntl.lockf(fd, fcntl.LOCK_UN, 1, offset)
+else: # pragma: no cover
+	_has_fcntl = False
+
+	def _lock_byte(fd: int, offset: int) -> None:
+		raise Exception('byte-range locks require fcntl, which is not available on Windows')
+
+	def _unlock_byte(fd: int, offset: int) -> None:
+		raise Exception('byte-range locks require fcntl, which is not available on Windows')
+
+_MAGIC = b'GOVYNCH1'
+# magic, slots, slot value bytes, ways
+_HEADER = struct.Struct('<8sIII')
+_HEADER_BYTES = 64
+# state, value length, key hash, expiry (0 for none), last used
+_SLOT_HEADER = struct.Struct('<B3xI16sdd')
+_SLOT_USED = 1
+
+# a fixed-size, set-associative hash table in an mmap'd file, shared by every process that opens the
+# same path (put it under /dev/shm to keep it off disk). each key hashes to a bucket of `ways` slots,
+# with the least recently used slot in the bucket evicted to make room; buckets are guarded by byte-range
+# locks on the file, so workers only contend when they touch the same bucket. expiry uses the monotonic
+# clock, which is shared by all processes on a host. values bigger than slot_bytes aren't cached
+class SharedMemoryCache(Cache):
+	def __init__(self, path: str, slots: int = 4096, slot_bytes: int = 1024, ways: int = 8) -> None:
+		if not _has_fcntl:
+			raise Exception('SharedMemoryCache requires fcntl, which is not available on Windows') # pragma: no cover
+		if slots % ways != 0:
+			raise ValueError('slots must be a multiple of ways')
+
+		self.path = path
+		self.slots = slots
+		self.slot_bytes = slot_bytes
+		self.ways = ways
+		self.buckets = slots // ways
+		self._slot_size = _SLOT_HEADER.size + slot_bytes
+		self._size = _HEADER_BYTES + slots * self._slot_size
+		# record locks are held per process, so threads in this one need excluding separately
+		self._thread_lock = threading.Lock()
+
+		self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+		try:
+			self._init_file()
+			self._map = mmap.mmap(self._fd, self._size)
+		except BaseException:
+			os.close(self._fd)
+			raise
+
+	def _init_file(self) -> None:
+		# byte 0 of the file guards initialisation; bucket locks live past the header
+		_lock_byte(self._fd, 0)
+		try:
+			# the descriptor is only ever positioned here, before the file is mapped
+			os.lseek(self._fd, 0, os.SEEK_SET)
+			if os.fstat(self._fd).st_size == 0:
+				os.ftruncate(self._fd, self._size)
+				os.write(self._fd, _HEADER.pack(_MAGIC, self.slots, self.slot_bytes, self.ways))
+				return
+
+			magic, slots, slot_bytes, ways = _HEADER.unpack(os.read(self._fd, _HEADER.size))
+			if magic != _MAGIC or (slots, slot_bytes, ways) != (self.slots, self.slot_bytes, self.ways):
+				raise ValueError(f'{self.path} holds a cache with a different layout')
+		finally:
+			_unlock_byte(self._fd, 0)
+
+	def close(self) -> None:
+		if self._fd >= 0:
+			self._map.close()
+			os.close(self._fd)
+			self._fd = -1
+
+	async def shutdown(self) -> None:
+		self.close()
+
+	def _locate(self, key: str) -> Tuple[int, bytes]:
+		digest = hashlib.blake2b(key.encode('utf-8'), digest_size = 16).digest()
+		return int.from_bytes(digest[:8], 'little') % self.buckets, digest
+
+	def _lock(self, bucket: int) -> None:
+		_lock_byte(self._fd, _HEADER_BYTES + bucket)
+
+	def _unlock(self, bucket: int) -> None:
+		_unlock_byte(self._fd, _HEADER_BYTES + bucket)
+
+	def _slot_offset(self, bucket: int, way: int) -> int:
+		return _HEADER_BYTES + (bucket * self.ways + way) * self._slot_size
+
+	def _find(self, bucket: int, digest: bytes) -> Optional[int]:
+		for way in range(self.ways):
+			offset = self._slot_offset(bucket, way)
+			state, _, key_hash, _, _ = _SLOT_HEADER.unpack_from(self._map, offset)
+			if state == _SLOT_USED and key_hash == digest:
+				return offset
+		return None
+
+	def get_sync(self, key: str) -> Optional[bytes]:
+		bucket, digest = self._locate(key)
+		with self._thread_lock:
+			self._lock(bucket)
+			try:
+				offset = self._find(bucket, digest)
+				if offset is None:
+					return None
+
+				now = time.monotonic()
+				_, length, _, expires_at, _ = _SLOT_HEADER.unpack_from(self._map, offset)
+				if expires_at and expires_at <= now:
+					_SLOT_HEADER.pack_into(self._map, offset, 0, 0, b'', 0.0, 0.0)
+					return None
+
+				_SLOT_HEADER.pack_into(self._map, offset, _SLOT_USED, length, digest, expires_at, now)
+				start = offset + _SLOT_HEADER.size
+				return bytes(self._map[start:start + length])
+			finally:
+				self._unlock(bucket)
+
+	def set_sync(self, key: str, value: bytes, ttl_secs: Optional[float] = None) -> None:
+		if len(value) > self.slot_bytes:
+			return
+
+		bucket, digest = self._locate(key)
+		now = time.monotonic()
+		expires_at = now + ttl_secs if ttl_secs is not None else 0.0
+		with self._thread_lock:
+			self._lock(bucket)
+			try:
+				offset = self._find(bucket, digest)
+				if offset is None:
+					# an empty or expired slot if there is one, otherwise the least recently used
+					victim: Optional[Tuple[float, int]] = None
+					for way in range(self.ways):
+						candidate = self._slot_offset(bucket, way)
+						state, _, _, slot_expires_at, last_used = _SLOT_HEADER.unpack_from(self._map, candidate)
+						if state != _SLOT_USED or (slot_expires_at and slot_expires_at <= now):
+							victim = (-1.0, candidate)
+							break
+						if victim is None or last_used < victim[0]:
+							victim = (last_used, candidate)
+					assert victim
+					offset = victim[1]
+
+				start = offset + _SLOT_HEADER.size
+				self._map[start:start + len(value)] = value
+				_SLOT_HEADER.pack_into(self._map, offset, _SLOT_USED, len(value), digest, expires_at, now)
+			finally:
+				self._unlock(bucket)
+
+	def delete_sync(self, key: str) -> None:
+		bucket, digest = self._locate(key)
+		with self._thread_lock:
+			self._lock(bucket)
+			try:
+				offset = self._find(bucket, digest)
+				if offset is not None:
+					_SLOT_HEADER.pack_into(self._map, offset, 0, 0, b'', 0.0, 0.0)
+			finally:
+				self._unlock(bucket)
+
+	# each operation touches one bucket for a few microseconds, so it's done inline rather than in a thread
+	async def get(self, key: str) -> Optional[bytes]:
+		return self.get_sync(key)
+
+	async def set(self, key: str, value: bytes, ttl_secs: Optional[float] = None) -> None:
+		self.set_sync(key, value, ttl_secs)
+
+	async def delete(self, key: str) -> None:
+		self.delete_sync(key)
+
+def _encode_principal(principal: Principal) -> bytes:
+	return json.dumps({ 'id': principal.id, 'privileges': sorted(principal.privileges) }).encode('utf-8')
+
+def _decode_principal(value: bytes) -> Principal:
+	raw = json.loads(value)
+	return Principal(raw['id'], set(raw['privileges']))
+
+# remembers which principal a header value resolved to, so repeat requests skip the backend's lookup.
+# failed lookups aren't cached, and a revoked token keeps working until its entry expires
+class CachedAuthBackend(AuthBackend):
+	def __init__(self, backend: HeaderAuthBackend, cache: Cache, ttl_secs: float) -> None:
+		self.backend = backend
+		self.cache = cache
+		self.ttl_secs = ttl_secs
+
+	async def startup(self) -> None:
+		await self.cache.startup()
+		if startup := getattr(self.backend, 'startup', None):
+			await startup()
+
+	async def shutdown(self) -> None:
+		if shutdown := getattr(self.backend, 'shutdown', None):
+			await shutdown()
+		await self.cache.shutdown()
+
+	async def resolve_principal(self, req: Request) -> Optional[Principal]:
+		token = req.headers.get(self.backend.header)
+		if not token:
+			return None
+
+		# tokens are credentials, so only a hash of them is kept
+		key = 'principal:' + hashlib.blake2b(token.encode('utf-8'), digest_size = 16).hexdigest()
+		cached = await self.cache.get(key)
+		if cached is not None:
+			return _decode_principal(cached)
+
+		principal = await self.backend.principal_from_header(token)
+		if principal is not None:
+			await self.cache.set(key, _encode_principal(principal), self.ttl_secs)
+		return principal
+
+	def openapi_spec(self) -> Tuple[str, Dict[str, Any]]:
+		return self.backend.openapi_spec()
+
+	def principal_metric_labels(self, principal: Principal) -> Dict[str, str]:
+		return self.backend.principal_metric_labels(principal)
@@ -0,0 +1,173 @@
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Deque, Dict, Iterator, List, Optional, Tuple, Union
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .metrics import MetricsRegistry
+
+# request headers worth replaying; credentials are deliberately left out
+_CAPTURED_HEADERS = ( 'accept', 'content-type', 'request-timeout' )
+
+@dataclass
+class CaptureConfig:
+	# gzipped JSON lines, appended to across restarts
+	path: str
+	sample_rate: float
+	# requests with bigger bodies aren't captured
+	max_body_bytes: int
+	queue_size: int
+	flush_interval_secs: float
+
+def default_capture_config(path: str) -> CaptureConfig:
+	return CaptureConfig(
+		path = path,
+		sample_rate = 0.01,
+		max_body_bytes = 64 * 1024,
+		queue_size = 10000,
+		flush_interval_secs = 1.0,
+	)
+
+@dataclass
+class CapturedRequest:
+	# unix time the request arrived, used to reproduce the original spacing between requests
+	time: float
+	method: str
+	path: str
+	query: str
+	headers: Dict[str, str]
+	# base64, so binary codecs survive the round trip
+	body: Optional[str]
+	principal: Optional[str]
+	status: int
+	duration_secs: float
+	# lets a replay tell whether a route still returns the same thing, without storing every response
+	response_digest: str
+
+	def body_bytes(self) -> bytes:
+		return base64.b64decode(self.body) if self.body else b''
+
+def read_capture(path: str) -> Iterator[CapturedRequest]:
+	with gzip.open(path, 'rt', encoding = 'utf-8') as f:
+		for line in f:
+			if line.strip():
+				yield CapturedRequest(**json.loads(line))
+
+class CaptureRecorder:
+	def __init__(self, config: CaptureConfig, metrics_registry: MetricsRegistry) -> None:
+		self.config = config
+		self._records: Deque[CapturedRequest] = deque()
+		self._writer_task: Optional['asyncio.Task[None]'] = None
+		# one thread keeps appends ordered, and compression never runs on the event loop
+		self._executor = ThreadPoolExecutor(max_workers = 1)
+		self.captured_counter = metrics_registry.counter('api_captured_requests')
+		self.dropped_counter = metrics_registry.counter('api_capture_dropped_requests')
+
+	async def startup(self) -> None:
+		self._writer_task = asyncio.get_running_loop().create_task(self._write_batches())
+
+	async def shutdown(self) -> None:
+		if self._writer_task:
+			self._writer_task.cancel()
+			await asyncio.gather(self._writer_task, return_exceptions = True)
+			self._writer_task = None
+
+		await self._write_batch()
+		self._executor.shutdown(wait = True)
+
+	def should_capture(self) -> bool:
+		return random.random() < self.config.sample_rate
+
+	def record(self, record: CapturedRequest) -> None:
+		if len(self._records) >= self.config.queue_size:
+			self.dropped_counter.inc(reason = 'queue_full')
+			return
+		self._records.append(record)
+		self.captured_counter.inc(path = record.path)
+
+	async def _write_batch(self) -> None:
+		batch: List[CapturedRequest] = []
+		while self._records:
+			batch.append(self._records.popleft())
+		if not batch:
+			return
+
+		def _write() -> None:
+			# each batch is its own gzip member, which readers see as one continuous stream
+			data = ''.join([ json.dumps(asdict(r), separators = (',', ':')) + '\n' for r in batch ])
+			with open(self.config.path, 'ab') as f:
+				f.write(gzip.compress(data.encode('utf-8')))
+
+		await asyncio.get_running_loop().run_in_executor(self._executor, _write)
+
+	async def _write_batches(self) -> None:
+		while True:
+			await asyncio.sleep(self.config.flush_interval_secs)
+			await self._write_batch()
+
+class CaptureMiddleware:
+	def __init__(self, app: ASGIApp, recorder: CaptureRecorder, exempt_prefix: Union[str, Tuple[str, ...]]) -> None:
+		self.app = app
+		self.recorder = recorder
+		self.exempt_prefix = exempt_prefix
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+		if scope['type'] != 'http' or scope['path'].startswith(self.exempt_prefix) or not self.recorder.should_capture():
+			await self.app(scope, receive, send)
+			return
+
+		start_time = time.time()
+		path = scope['path']
+		max_body_bytes = self.recorder.config.max_body_bytes
+		body_chunks: List[bytes] = []
+		body_bytes = 0
+		status = 500
+		digest = hashlib.blake2b(digest_size = 16)
+
+		async def _receive() -> Message:
+			nonlocal body_bytes
+			message = await receive()
+			if message['type'] == 'http.request':
+				chunk = message.get('body', b'')
+				body_bytes += len(chunk)
+				if body_bytes <= max_body_bytes:
+					body_chunks.append(chunk)
+			return message
+
+		async def _send(message: Message) -> None:
+			nonlocal status
+			if message['type'] == 'http.response.start':
+				status = message['status']
+			elif message['type'] == 'http.response.body':
+				digest.update(message.get('body', b''))
+			await send(message)
+
+		try:
+			await self.app(scope, _receive, _send)
+		finally:
+			if body_bytes > max_body_bytes:
+				self.recorder.dropped_counter.inc(reason = 'body_too_large')
+			else:
+				headers = { k.decode('latin-1'): v.decode('latin-1') for k, v in scope['headers'] }
+				principal = getattr(scope.get('state', {}).get('principal'), 'id', None)
+				body = b''.join(body_chunks)
+				self.recorder.record(CapturedRequest(
+					time = start_time,
+					method = scope['method'],
+					path = path,
+					query = scope['query_string'].decode('latin-1'),
+					headers = { k: headers[k] for k in _CAPTURED_HEADERS if k in headers },
+					body = base64.b64encode(body).decode('ascii') if body else None,
+					principal = principal,
+					status = status,
+					duration_secs = time.time() - start_time,
+					response_digest = digest.hexdigest(),
+				))
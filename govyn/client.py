@@ -0,0 +1,442 @@
+import asyncio
+import inspect
+import json
+import random
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import date, datetime
+from enum import Enum, EnumMeta
+from time import monotonic, perf_counter
+from typing import (Any, AsyncIterator, Callable, Dict, List, Literal,
+                    Optional, Set, Tuple, Type, TypeVar, Union)
+from urllib.parse import urlencode
+
+from starlette.types import ASGIApp
+
+from .asgi import ASGILifespan, asgi_exchange
+from .binary import BINARY_MEDIA_TYPE, BINARY_STREAM
+from .codecs import codec_for_content_type, json_codec, to_plain
+from .endpoint import decode_record
+from .errors import HTTPError
+from .idempotency import IDEMPOTENCY_HEADER
+from .jobs import JobAccepted
+from .metrics import MetricsRegistry
+from .pagination import STREAM_PARAM, Page, is_page_type
+from .records import is_record_type
+from .resources import ResourceRegistry
+from .route_def import RouteDef, make_route_def
+
+# statuses meaning the request didn't get as far as the handler, or the server asked us to come back later
+_RETRYABLE_STATUSES = { 502, 503, 504 }
+
+_ERRORS_BY_CODE: Dict[int, Type[HTTPError]] = { cls.code: cls for cls in HTTPError.__subclasses__() }
+
+@dataclass
+class ClientConfig:
+	max_connections: int
+	keepalive_secs: float
+	# per attempt, and sent as Request-Timeout so the server stops working on it at the same time
+	timeout_secs: Optional[float]
+	max_attempts: int
+	backoff_secs: float
+	# retries are allowed as this fraction of requests, on top of min_retries_per_sec, so an
+	# outage gets a bounded amount of extra traffic rather than every caller retrying at once
+	retry_budget_ratio: float
+	min_retries_per_sec: float
+	# concurrent calls to the same GET with the same arguments share a single request
+	coalesce_gets: bool
+	# bodies are sent, and responses asked for, in this media type
+	media_type: str
+
+def default_client_config() -> ClientConfig:
+	return ClientConfig(
+		max_connections = 100,
+		keepalive_secs = 30.0,
+		timeout_secs = None,
+		max_attempts = 3,
+		backoff_secs = 0.05,
+		retry_budget_ratio = 0.2,
+		min_retries_per_sec = 10.0,
+		coalesce_gets = True,
+		media_type = json_codec.media_type,
+	)
+
+# raised for error statuses with no matching HTTPError class, e.g. from a proxy in front of the service
+@dataclass
+class UnexpectedResponse(Exception):
+	status: int
+	body: bytes
+
+class RetryBudget:
+	def __init__(self, ratio: float, min_per_sec: float) -> None:
+		self.ratio = ratio
+		self.min_per_sec = min_per_sec
+		# at most ten seconds' worth of the floor can be saved up for a burst of retries
+		self.capacity = max(1.0, min_per_sec * 10)
+		self.balance = self.capacity
+		self._last_refill = monotonic()
+
+	def _refill(self) -> None:
+		now = monotonic()
+		self.balance = min(self.capacity, self.balance + (now - self._last_refill) * self.min_per_sec)
+		self._last_refill = now
+
+	def deposit(self) -> None:
+		self._refill()
+		self.balance = min(self.capacity, self.balance + self.ratio)
+
+	def try_withdraw(self) -> bool:
+		self._refill()
+		if self.balance < 1:
+			return False
+		self.balance -= 1
+		return True
+
+RawResponse = Tuple[int, Dict[str, str], bytes]
+RequestBody = Union[bytes, AsyncIterator[bytes]]
+
+class _Transport(ABC):
+	# failures that mean there's no response to look at
+	errors: Tuple[Type[BaseException], ...] = ( asyncio.TimeoutError, )
+
+	async def startup(self) -> None:
+		pass
+
+	async def shutdown(self) -> None:
+		pass
+
+	@abstractmethod
+	async def request(self, method: str, path: str, query: str, headers: Dict[str, str], body: RequestBody, timeout_secs: Optional[float]) -> RawResponse:
+		...
+
+class _HTTPTransport(_Transport):
+	def __init__(self, base_url: str, config: ClientConfig) -> None:
+		import aiohttp
+		self.errors = ( asyncio.TimeoutError, aiohttp.ClientError, OSError )
+		self.base_url = base_url.rstrip('/')
+		self.config = config
+		self._session: Any = None
+
+	async def startup(self) -> None:
+		import aiohttp
+		# one session per client, so connections are kept alive and shared across every call
+		self._session = aiohttp.ClientSession(connector = aiohttp.TCPConnector(
+			limit = self.config.max_connections,
+			keepalive_timeout = self.config.keepalive_secs,
+		))
+
+	async def shutdown(self) -> None:
+		if self._session:
+			await self._session.close()
+			self._session = None
+
+	async def request(self, method: str, path: str, query: str, headers: Dict[str, str], body: RequestBody, timeout_secs: Optional[float]) -> RawResponse:
+		import aiohttp
+		if self._session is None:
+			raise Exception('client used outside of startup and shutdown')
+
+		url = self.base_url + path + (f'?{query}' if query else '')
+		async with self._session.request(method, url, data = body, headers = headers, timeout = aiohttp.ClientTimeout(total = timeout_secs)) as res:
+			return res.status, { k.lower(): v for k, v in res.headers.items() }, await res.read()
+
+class _ASGITransport(_Transport):
+	def __init__(self, app: ASGIApp, run_lifespan: bool) -> None:
+		self.app = app
+		self.lifespan = ASGILifespan(app) if run_lifespan else None
+
+	async def startup(self) -> None:
+		if self.lifespan:
+			await self.lifespan.startup()
+
+	async def shutdown(self) -> None:
+		if self.lifespan:
+			await self.lifespan.shutdown()
+
+	async def request(self, method: str, path: str, query: str, headers: Dict[str, str], body: RequestBody, timeout_secs: Optional[float]) -> RawResponse:
+		if not isinstance(body, bytes):
+			body = b''.join([ chunk async for chunk in body ])
+		return await asyncio.wait_for(asgi_exchange(self.app, method, path, query, headers, body), timeout_secs)
+
+class _ClientMetrics:
+	def __init__(self, metrics_registry: MetricsRegistry) -> None:
+		self.requests_counter = metrics_registry.counter('api_client_requests')
+		self.latency_histogram = metrics_registry.histogram('api_client_request_seconds')
+		self.retries_counter = metrics_registry.counter('api_client_retries')
+		self.budget_exhausted_counter = metrics_registry.counter('api_client_retry_budget_exhausted')
+		self.coalesced_counter = metrics_registry.counter('api_client_coalesced_requests')
+
+def _query_value(value: Any) -> str:
+	if isinstance(value, bool):
+		return 'true' if value else 'false'
+	if isinstance(value, Enum):
+		return str(value.value)
+	if isinstance(value, (datetime, date)):
+		return value.isoformat()
+	return str(value)
+
+def encode_query(args: Dict[str, Any]) -> str:
+	pairs = []
+	for name, value in args.items():
+		if value is None:
+			continue
+		for v in (value if isinstance(value, (list, tuple)) else [ value ]):
+			pairs.append((name, _query_value(v)))
+	return urlencode(pairs)
+
+def from_plain(py_type: Any, raw: Any) -> Any:
+	if raw is None:
+		return None
+
+	origin = getattr(py_type, '__origin__', None)
+	generic_types: Tuple[Any, ...] = getattr(py_type, '__args__', ())
+	if origin is Union:
+		non_null = [ t for t in generic_types if t is not type(None) ]
+		return from_plain(non_null[0], raw) if len(non_null) == 1 else raw
+	if origin is list:
+		return [ from_plain(generic_types[0], v) for v in raw ]
+	if origin is dict:
+		return { k: from_plain(generic_types[1], v) for k, v in raw.items() }
+	if is_page_type(py_type):
+		# the next cursor is passed straight back as the cursor argument for the following page
+		return Page([ from_plain(generic_types[0], v) for v in raw['items'] ], raw.get('next_cursor'))
+	if is_record_type(py_type):
+		return decode_record(py_type, raw)
+	if py_type in (datetime, date):
+		return py_type.fromisoformat(raw)
+	if isinstance(py_type, EnumMeta):
+		return py_type(raw)
+	return raw
+
+def _error_for(status: int, body: bytes) -> Exception:
+	error_class = _ERRORS_BY_CODE.get(status)
+	try:
+		error = json.loads(body)
+		desc, data = error['error_description'], error['error_data']
+	except (ValueError, KeyError, TypeError):
+		error_class = None
+
+	if error_class is None:
+		return UnexpectedResponse(status, body)
+	return error_class(desc, data)
+
+TClient = TypeVar('TClient', bound = 'GovynClient')
+
+class GovynClient:
+	def __init__(
+			self,
+			target: Union[str, ASGIApp],
+			config: Optional[ClientConfig] = None,
+			headers: Dict[str, str] = {},
+			metrics_registry: Optional[MetricsRegistry] = None,
+			run_lifespan: bool = True,
+		) -> None:
+		self.config = config or default_client_config()
+		self.headers = headers
+		self.codec = codec_for_content_type(self.config.media_type)
+		self._transport = _HTTPTransport(target, self.config) if isinstance(target, str) else _ASGITransport(target, run_lifespan)
+		self._retry_budget = RetryBudget(self.config.retry_budget_ratio, self.config.min_retries_per_sec)
+		self._metrics = _ClientMetrics(metrics_registry) if metrics_registry else None
+		self._in_flight: Dict[Tuple[str, str], 'asyncio.Future[RawResponse]'] = {}
+
+	async def startup(self) -> None:
+		await self._transport.startup()
+
+	async def shutdown(self) -> None:
+		await self._transport.shutdown()
+
+	async def __aenter__(self: TClient) -> TClient:
+		await self.startup()
+		return self
+
+	async def __aexit__(self, *_: Any) -> None:
+		await self.shutdown()
+
+	async def _send(self, route: RouteDef, query: str, headers: Dict[str, str], body: RequestBody, retryable: bool) -> RawResponse:
+		self._retry_budget.deposit()
+		attempt = 1
+		while True:
+			start_time = perf_counter()
+			error: Optional[BaseException] = None
+			try:
+				status, response_headers, data = await self._transport.request(
+					route.http_method.upper(), route.path, query, headers, body, self.config.timeout_secs,
+				)
+			except self._transport.errors as ex:
+				status, response_headers, data = 0, {}, b''
+				error = ex
+
+			if self._metrics:
+				self._metrics.requests_counter.inc(route = route.path, status = str(status) if status else 'error')
+				self._metrics.latency_histogram.observe(perf_counter() - start_time, route = route.path)
+
+			if (error is None and status not in _RETRYABLE_STATUSES) or not retryable or attempt >= self.config.max_attempts:
+				break
+			if not self._retry_budget.try_withdraw():
+				if self._metrics:
+					self._metrics.budget_exhausted_counter.inc(route = route.path)
+				break
+
+			if self._metrics:
+				self._metrics.retries_counter.inc(route = route.path)
+			# jittered, so callers that failed together don't all come back together
+			await asyncio.sleep(self.config.backoff_secs * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+			attempt += 1
+
+		if error is not None:
+			raise error
+		return status, response_headers, data
+
+	async def _coalesced_send(self, route: RouteDef, query: str, headers: Dict[str, str]) -> RawResponse:
+		key = (route.path, query)
+		pending = self._in_flight.get(key)
+		if pending is not None:
+			if self._metrics:
+				self._metrics.coalesced_counter.inc(route = route.path)
+		else:
+			pending = asyncio.ensure_future(self._send(route, query, headers, b'', True))
+			self._in_flight[key] = pending
+			pending.add_done_callback(lambda _: self._in_flight.pop(key, None))
+		# one caller giving up doesn't cancel the request for everyone else sharing it
+		return await asyncio.shield(pending)
+
+	async def call(self, route: RouteDef, args: Dict[str, Any]) -> Any:
+		headers = { **self.headers, 'accept': self.codec.media_type }
+		if self.config.timeout_secs is not None:
+			headers['request-timeout'] = str(self.config.timeout_secs)
+
+		if route.http_method == 'get':
+			query = encode_query(args)
+			if self.config.coalesce_gets:
+				status, response_headers, data = await self._coalesced_send(route, query, headers)
+			else:
+				status, response_headers, data = await self._send(route, query, headers, b'', True)
+		else:
+			value = next(iter(args.values()))
+			body: RequestBody
+			if route.binary_body:
+				body = value
+				headers['content-type'] = BINARY_MEDIA_TYPE
+			else:
+				body = self.codec.encode(to_plain(value))
+				headers['content-type'] = self.codec.media_type
+			# one key for every attempt, so the server runs the call at most once however many times it's sent
+			if route.idempotency:
+				headers[IDEMPOTENCY_HEADER] = uuid.uuid4().hex
+			retryable = route.idempotency is not None and route.binary_body != BINARY_STREAM
+			status, response_headers, data = await self._send(route, '', headers, body, retryable)
+
+		if status >= 400:
+			raise _error_for(status, data)
+		if route.binary_response:
+			return data
+
+		raw = codec_for_content_type(response_headers.get('content-type')).decode(data)
+		return from_plain(JobAccepted if route.background_job else route.return_type, raw)
+
+def _client_signature(route: RouteDef) -> inspect.Signature:
+	params = [ inspect.Parameter('self', inspect.Parameter.POSITIONAL_OR_KEYWORD) ]
+	arg_items = [ (name, arg) for name, arg in route.args.items() if name != STREAM_PARAM ]
+	if route.http_method == 'post':
+		name, arg = arg_items[0]
+		params.append(inspect.Parameter(name, inspect.Parameter.POSITIONAL_OR_KEYWORD, annotation = arg.original_type))
+	else:
+		params += [
+			inspect.Parameter(name, inspect.Parameter.KEYWORD_ONLY, default = None if arg.optional else inspect.Parameter.empty, annotation = arg.original_type)
+			for name, arg in arg_items
+		]
+
+	return_type: Any = route.return_type
+	if route.binary_response:
+		return_type = bytes
+	elif route.background_job:
+		return_type = JobAccepted
+	return inspect.Signature(params, return_annotation = return_type)
+
+def _client_method(route: RouteDef) -> Callable[..., Any]:
+	signature = _client_signature(route)
+
+	async def method(self: GovynClient, *args: Any, **kwargs: Any) -> Any:
+		bound = signature.bind(self, *args, **kwargs)
+		bound.apply_defaults()
+		return await self.call(route, { k: v for k, v in bound.arguments.items() if k != 'self' })
+
+	impl_name = getattr(route.impl, '__name__')
+	method.__name__ = method.__qualname__ = impl_name
+	method.__doc__ = route.doc
+	setattr(method, '__signature__', signature)
+	method.__annotations__ = { **{ p.name: p.annotation for p in list(signature.parameters.values())[1:] }, 'return': signature.return_annotation }
+	return method
+
+def _client_route_defs(srv: Any) -> List[RouteDef]:
+	resource_registry = getattr(srv, 'resources', None)
+	resource_names = resource_registry.names() if isinstance(resource_registry, ResourceRegistry) else []
+
+	http_methods = [ 'get', 'post' ]
+	method_prefixes = tuple([ m + '_' for m in http_methods ])
+	return [
+		make_route_def(getattr(srv, m), resource_names)
+		for m in dir(srv) if m in http_methods or m.startswith(method_prefixes)
+	]
+
+def _default_client_name(srv: Any) -> str:
+	srv_name = srv.__name__ if isinstance(srv, type) else type(srv).__name__
+	return f'{srv_name}Client'
+
+# builds a client class with one async method per route, named and typed like the handler it calls.
+# takes the service (or its class, if its resources don't need to be known) that create_app would be given
+def generate_client(srv: Any, name: Optional[str] = None) -> Type[GovynClient]:
+	methods = { getattr(r.impl, '__name__'): _client_method(r) for r in _client_route_defs(srv) }
+	return type(name or _default_client_name(srv), ( GovynClient, ), methods)
+
+# annotations as source, fully qualified so the stub only needs plain imports of the modules collected
+def _annotation_source(annotation: Any, modules: Set[str]) -> str:
+	if annotation is None or annotation is type(None):
+		return 'None'
+
+	origin = getattr(annotation, '__origin__', None)
+	generic_types: Tuple[Any, ...] = getattr(annotation, '__args__', ())
+	if origin is Literal:
+		modules.add('typing')
+		return repr(annotation)
+	if origin is not None and generic_types:
+		# Optional[T] is written out as the Union it really is, since its repr drops the None
+		head = 'typing.Union' if origin is Union else repr(annotation).partition('[')[0]
+		module = head.rpartition('.')[0]
+		if module:
+			modules.add(module)
+		return f'{head}[{", ".join(_annotation_source(t, modules) for t in generic_types)}]'
+	if isinstance(annotation, type):
+		if annotation.__module__ == 'builtins':
+			return annotation.__qualname__
+		if '<locals>' in annotation.__qualname__:
+			raise Exception(f'{annotation.__qualname__} is defined inside a function, so client stubs cannot refer to it')
+		modules.add(annotation.__module__)
+		return f'{annotation.__module__}.{annotation.__qualname__}'
+
+	# typing's special forms, e.g. Any
+	source = repr(annotation)
+	module = source.rpartition('.')[0]
+	if module:
+		modules.add(module)
+	return source
+
+def _stub_method(name: str, signature: inspect.Signature, modules: Set[str]) -> str:
+	params = [ 'self' ]
+	for param in list(signature.parameters.values())[1:]:
+		if param.kind == inspect.Parameter.KEYWORD_ONLY and '*' not in params:
+			params.append('*')
+		default = '' if param.default is inspect.Parameter.empty else ' = ...'
+		params.append(f'{param.name}: {_annotation_source(param.annotation, modules)}{default}')
+	return f'\tasync def {name}({", ".join(params)}) -> {_annotation_source(signature.return_annotation, modules)}: ...\n'
+
+# the client generate_client builds, as a .pyi stub, so type checkers know its methods. saved next to
+# the module that assigns generate_client(srv) to `name`, it stands in for that whole module
+def client_stub(srv: Any, name: Optional[str] = None) -> str:
+	modules = { 'govyn.client' }
+	methods = [ _stub_method(getattr(r.impl, '__name__'), _client_signature(r), modules) for r in _client_route_defs(srv) ]
+	imports = ''.join(f'import {m}\n' for m in sorted(modules))
+	return (
+		f'# generated by govyn.client.client_stub, regenerate rather than edit\n{imports}\n'
+		f'class {name or _default_client_name(srv)}(govyn.client.GovynClient):\n{"".join(methods)}'
+	)
@@ -0,0 +1,164 @@
+import json
+from dataclasses import asdict, dataclass, is_dataclass
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+	import msgpack
+	_has_msgpack = True
+except ImportError: # pragma: no cover
+	_has_msgpack = False
+
+try:
+	import cbor2
+	_has_cbor2 = True
+except ImportError: # pragma: no cover
+	_has_cbor2 = False
+
+from starlette.responses import Response
+
+from .errors import UnsupportedMediaType
+
+def default_json_ser(obj: Any) -> Any:
+	if isinstance(obj, (datetime, date)):
+		return obj.isoformat()
+	if isinstance(obj, Enum):
+		return obj.value
+	if is_dataclass(obj) and not isinstance(obj, type):
+		return asdict(obj)
+
+	raise TypeError(f'type {type(obj)} is not serializable')
+
+# recursively applies default_json_ser, for encoders that would otherwise handle dates natively
+def to_plain(obj: Any) -> Any:
+	if isinstance(obj, dict):
+		return { k: to_plain(v) for k, v in obj.items() }
+	if isinstance(obj, tuple) and hasattr(obj, '_fields'):
+		return { k: to_plain(v) for k, v in zip(getattr(obj, '_fields'), obj) }
+	if isinstance(obj, (list, tuple)):
+		return [ to_plain(v) for v in obj ]
+	if isinstance(obj, (datetime, date, Enum)):
+		return default_json_ser(obj)
+	if is_dataclass(obj) and not isinstance(obj, type):
+		return to_plain(asdict(obj))
+	return obj
+
+@dataclass
+class Codec:
+	name: str
+	media_type: str
+	encode: Callable[[ Any ], bytes]
+	decode: Callable[[ bytes ], Any]
+
+def encode_json(content: Any) -> bytes:
+	return json.dumps(
+		content,
+		ensure_ascii = False,
+		allow_nan = False,
+		indent = None,
+		separators = (',', ':'),
+		default = default_json_ser,
+	).encode('utf-8')
+
+json_codec = Codec('JSON', 'application/json', encode_json, json.loads)
+
+# media types we know about, even if the library backing them isn't installed
+_binary_media_types = {
+	'application/msgpack': 'msgpack',
+	'application/x-msgpack': 'msgpack',
+	'application/vnd.msgpack': 'msgpack',
+	'application/cbor': 'cbor',
+}
+
+_codecs: Dict[str, Codec] = {}
+
+if _has_msgpack:
+	_codecs['msgpack'] = Codec(
+		'MessagePack',
+		'application/msgpack',
+		lambda content: msgpack.packb(content, default = default_json_ser, use_bin_type = True),
+		lambda data: msgpack.unpackb(data, raw = False),
+	)
+
+def _decode_cbor(data: bytes) -> Any:
+	# decode errors stopped being ValueErrors in cbor2 6, so they're converted to match the other codecs
+	try:
+		return cbor2.loads(data)
+	except cbor2.CBORDecodeError as ex:
+		raise ValueError(str(ex)) from ex
+
+if _has_cbor2:
+	_codecs['cbor'] = Codec(
+		'CBOR',
+		'application/cbor',
+		lambda content: cbor2.dumps(to_plain(content)),
+		_decode_cbor,
+	)
+
+def available_codecs() -> List[Codec]:
+	return [ json_codec, *_codecs.values() ]
+
+def _split_media_type(value: str) -> Tuple[str, Dict[str, str]]:
+	media_type, *raw_params = value.split(';')
+	params = {}
+	for param in raw_params:
+		key, _, param_value = param.partition('=')
+		params[key.strip().lower()] = param_value.strip()
+	return media_type.strip().lower(), params
+
+def codec_for_content_type(content_type: Optional[str]) -> Codec:
+	if not content_type:
+		return json_codec
+
+	media_type, _ = _split_media_type(content_type)
+	codec_key = _binary_media_types.get(media_type)
+	if codec_key is None:
+		return json_codec
+
+	codec = _codecs.get(codec_key)
+	if codec is None:
+		raise UnsupportedMediaType(f'{media_type} bodies are not supported by this server')
+	return codec
+
+# returns the media types in an Accept header, most preferred first
+def parse_accept(accept: str) -> List[str]:
+	weighted = []
+	for i, entry in enumerate(accept.split(',')):
+		if not entry.strip():
+			continue
+
+		media_type, params = _split_media_type(entry)
+		try:
+			q = float(params.get('q', 1))
+		except ValueError:
+			q = 0
+
+		if q > 0:
+			weighted.append((-q, i, media_type))
+
+	return [ media_type for _, _, media_type in sorted(weighted) ]
+
+def codec_for_accept(accept: Optional[str]) -> Codec:
+	# unlike request bodies, we never reject based on Accept; JSON is always a reasonable answer
+	if not accept:
+		return json_codec
+
+	for media_type in parse_accept(accept):
+		if media_type == json_codec.media_type:
+			return json_codec
+
+		codec_key = _binary_media_types.get(media_type)
+		if codec_key in _codecs:
+			return _codecs[codec_key]
+
+	return json_codec
+
+class EncodedResponse(Response):
+	def __init__(self, content: Any, codec: Codec, status_code: int = 200) -> None:
+		self.codec = codec
+		self.media_type = codec.media_type
+		super().__init__(content, status_code, headers = { 'vary': 'Accept' })
+
+	def render(self, content: Any) -> bytes:
+		return self.codec.encode(content)
@@ -0,0 +1,83 @@
+import json
+from dataclasses import asdict, fields, is_dataclass
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+try:
+	import pyarrow
+	import pyarrow.ipc
+	_has_pyarrow = True
+except ImportError: # pragma: no cover
+	_has_pyarrow = False
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .codecs import (Codec, EncodedResponse, available_codecs,
+                     codec_for_accept, encode_json, parse_accept)
+from .records import is_namedtuple_type, is_typeddict_type, record_fields
+
+COLUMNAR_JSON_MEDIA_TYPE = 'application/vnd.govyn.columnar+json'
+ARROW_STREAM_MEDIA_TYPE = 'application/vnd.apache.arrow.stream'
+COLUMNAR_QUERY_FLAG = '_columnar'
+
+columnar_json_codec = Codec('JSON', COLUMNAR_JSON_MEDIA_TYPE, encode_json, json.loads)
+
+def arrow_available() -> bool:
+	return _has_pyarrow
+
+# the field names for List[SomeRecord] return types, None for anything that can't be laid out as columns
+def columnar_fields(return_type: type) -> Optional[List[str]]:
+	if getattr(return_type, '__origin__', None) != list:
+		return None
+
+	row_type = getattr(return_type, '__args__')[0]
+	if is_dataclass(row_type):
+		return [ f.name for f in fields(row_type) ]
+	if is_namedtuple_type(row_type) or is_typeddict_type(row_type):
+		return list(record_fields(row_type))
+	return None
+
+def to_columns(rows: List[Any], field_names: List[str]) -> Dict[str, List[Any]]:
+	# TypedDict rows are plain dicts, where optional keys may be missing altogether
+	if rows and isinstance(rows[0], dict):
+		return { name: [ row.get(name) for row in rows ] for name in field_names }
+	return { name: [ getattr(row, name) for row in rows ] for name in field_names }
+
+def _arrow_value(value: Any) -> Any:
+	# arrow understands dates natively, but not our enums or nested records
+	if isinstance(value, Enum):
+		return value.value
+	if is_dataclass(value) and not isinstance(value, type):
+		return asdict(value)
+	if isinstance(value, tuple) and hasattr(value, '_asdict'):
+		return value._asdict()
+	return value
+
+def encode_arrow_stream(columns: Dict[str, List[Any]]) -> bytes:
+	table = pyarrow.table({ name: [ _arrow_value(v) for v in values ] for name, values in columns.items() })
+	sink = pyarrow.BufferOutputStream()
+	with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+		writer.write_table(table)
+	return bytes(sink.getvalue().to_pybytes())
+
+def columnar_response(req: Request, rows: List[Any], field_names: List[str]) -> Optional[Response]:
+	accept = req.headers.get('accept')
+	if accept:
+		row_media_types = { codec.media_type for codec in available_codecs() }
+		for media_type in parse_accept(accept):
+			if media_type == ARROW_STREAM_MEDIA_TYPE and _has_pyarrow:
+				return Response(
+					encode_arrow_stream(to_columns(rows, field_names)),
+					media_type = ARROW_STREAM_MEDIA_TYPE,
+					headers = { 'vary': 'Accept' },
+				)
+			if media_type == COLUMNAR_JSON_MEDIA_TYPE:
+				return EncodedResponse(to_columns(rows, field_names), columnar_json_codec)
+			if media_type in row_media_types:
+				break
+
+	if req.query_params.get(COLUMNAR_QUERY_FLAG, 'false').lower() in ('true', '1'):
+		return EncodedResponse(to_columns(rows, field_names), codec_for_accept(accept))
+
+	return None
@@ -0,0 +1,77 @@
+import asyncio
+import math
+from dataclasses import dataclass
+from time import monotonic
+from typing import Any, Awaitable, Callable, Optional
+
+from starlette.requests import Request
+
+from .auth import TFunc
+from .errors import BadRequest, GatewayTimeout
+from .metrics import MetricsRegistry
+
+_TIMEOUT_ATTR = '_timeout_secs'
+
+def timeout(secs: float) -> Callable[[ TFunc ], TFunc]:
+	def _decorator(func: TFunc) -> TFunc:
+		setattr(func, _TIMEOUT_ATTR, secs)
+		return func
+	return _decorator
+
+@dataclass
+class Deadline:
+	__slots__ = ( 'expires_at', )
+	expires_at: float
+
+	def remaining(self) -> float:
+		return max(0.0, self.expires_at - monotonic())
+
+	def expired(self) -> bool:
+		return self.remaining() <= 0
+
+@dataclass
+class TimeoutConfig:
+	default_secs: Optional[float]
+	header: str
+
+def default_timeout_config() -> TimeoutConfig:
+	return TimeoutConfig(
+		default_secs = None,
+		header = 'Request-Timeout',
+	)
+
+class DeadlinePolicy:
+	def __init__(self, config: TimeoutConfig, metrics_registry: MetricsRegistry) -> None:
+		self.config = config
+		self.timeout_counter = metrics_registry.counter('api_route_timeouts')
+
+	def for_request(self, req: Request, route_timeout_secs: Optional[float]) -> Deadline:
+		budget = route_timeout_secs if route_timeout_secs is not None else self.config.default_secs
+
+		# clients may only ever shorten the budget the server is willing to give them
+		header_value = req.headers.get(self.config.header)
+		if header_value is not None:
+			try:
+				requested = float(header_value)
+			except ValueError:
+				raise BadRequest(f'invalid value for header {self.config.header}: expected a number of seconds')
+
+			if math.isnan(requested) or requested < 0:
+				raise BadRequest(f'invalid value for header {self.config.header}: expected a number of seconds')
+
+			budget = requested if budget is None else min(budget, requested)
+
+		if budget is None:
+			return Deadline(math.inf)
+
+		return Deadline(monotonic() + budget)
+
+	async def run(self, awaitable: Awaitable[Any], deadline: Deadline, path: str) -> Any:
+		if deadline.expires_at == math.inf:
+			return await awaitable
+
+		try:
+			return await asyncio.wait_for(awaitable, deadline.remaining())
+		except asyncio.TimeoutError:
+			self.timeout_counter.inc(path = path)
+			raise GatewayTimeout('request deadline exceeded')
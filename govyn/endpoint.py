@@ -1,40 +1,49 @@
-import json
+import inspect
+from contextlib import AsyncExitStack
 from dataclasses import asdict, is_dataclass
+from functools import partial
 from datetime import date, datetime
 from enum import Enum, EnumMeta
-from typing import Any, Awaitable, Callable, Dict, Optional, Union, cast
+from typing import (Any, AsyncIterator, Awaitable, Callable, Dict, Optional,
+                    Union, cast)
 
 from dacite.config import Config
 from dacite.core import from_dict
 from dacite.exceptions import DaciteError
 from starlette.requests import Request
-from starlette.responses import Response
+from starlette.responses import Response, StreamingResponse
 
 from .auth import Principal
+from .binary import (BINARY_BYTES, BINARY_FILE, BINARY_MEDIA_TYPE,
+                     BINARY_STREAM, file_response)
+from .body import BodyReader
+from .codecs import (EncodedResponse, codec_for_accept,
+                     codec_for_content_type, default_json_ser, encode_json,
+                     json_codec, to_plain)
+from .columnar import columnar_response
+from .deadline import Deadline, DeadlinePolicy
 from .errors import BadRequest, Forbidden
+from .etag import (ResponseCache, Versioned, apply_cache_headers,
+                   etag_matches, not_modified_response, version_etag)
+from .idempotency import IDEMPOTENCY_HEADER, IdempotencyGuard
+from .jobs import JobAccepted, JobQueue
+from .memory import MemoryTracker
+from .offload import ProcessPool
+from .pagination import (CURSOR_PARAM, LIMIT_PARAM, STREAM_PARAM, Cursor,
+                         Page, Paginator)
+from .priority import PriorityScheduler
+from .profiling import Profiler
+from .records import contains_namedtuple, decode_value, needs_record_decoder
+from .resources import ResourceRegistry
 from .route_def import ArgDef, RouteDef
+from .tracing import span
 
 
-def default_json_ser(obj: Any) -> Any:
-	if isinstance(obj, (datetime, date)):
-		return obj.isoformat()
-	if isinstance(obj, Enum):
-		return obj.value
-
-	raise TypeError(f'type {type(obj)} is not serializable')
-
 class GovynJSONResponse(Response):
-	media_type = 'application/json'
+	media_type = json_codec.media_type
 
 	def render(self, content: Any) -> bytes:
-		return json.dumps(
-			content,
-			ensure_ascii = False,
-			allow_nan = False,
-			indent = None,
-			separators = (',', ':'),
-			default = default_json_ser,
-		).encode('utf-8')
+		return encode_json(content)
 
 def parse_value(arg: ArgDef, var_name: str, str_value: str) -> Any:
 	try:
@@ -65,35 +74,144 @@ def _isoformat(t: str, conv_func: Callable[[str], Union[datetime, date]], d: Opt
 		raise ValueError(f'{d} is an invalid value for {t} type field. Must be a valid {t} string')
 	return conv_func(d)
 
-async def json_body_parser(req: Request, args: Dict[str, ArgDef]) -> Dict[str, Any]:
+_dacite_config = Config(type_hooks = {
+	datetime: lambda d: _isoformat('datetime', datetime.fromisoformat, d),
+	date: lambda d: _isoformat('date', date.fromisoformat, d),
+}, cast=[Enum])
+
+# builds a dataclass, NamedTuple or TypedDict from decoded JSON (or msgpack/CBOR), raising DaciteError or ValueError if it doesn't fit
+def decode_record(record_type: type, raw: Any) -> Any:
+	if needs_record_decoder(record_type):
+		return decode_value(record_type, raw)
+	return from_dict(record_type, raw, _dacite_config)
+
+_ParserType = Callable[[ Request, Dict[str, ArgDef] ], Awaitable[Dict[str, Any]]]
+
+async def body_parser(
+		req: Request,
+		args: Dict[str, ArgDef],
+		read_body: Optional[Callable[[ Request ], Awaitable[bytes]]] = None,
+	) -> Dict[str, Any]:
+	codec = codec_for_content_type(req.headers.get('content-type'))
+	body_bytes = await read_body(req) if read_body else await req.body()
 	try:
-		json_body = await req.json()
-	except json.JSONDecodeError:
-		raise BadRequest('Request body is not valid JSON')
+		raw_body = codec.decode(body_bytes)
+	except ValueError:
+		raise BadRequest(f'Request body is not valid {codec.name}')
 
 	name = list(args)[0]
 	arg_def = args[name]
 
 	try:
-		body: Any = from_dict(arg_def.element_type, json_body, Config(type_hooks = {
-			datetime: lambda d: _isoformat('datetime', datetime.fromisoformat, d),
-			date: lambda d: _isoformat('date', date.fromisoformat, d),
-		}, cast=[Enum]))
+		body = decode_record(arg_def.element_type, raw_body)
 	except (DaciteError, ValueError) as e:
 		raise BadRequest(str(e))
 
 	return { name: body }
 
-_parser_dict = {
+async def bytes_body_parser(
+		req: Request,
+		args: Dict[str, ArgDef],
+		read_body: Optional[Callable[[ Request ], Awaitable[bytes]]] = None,
+	) -> Dict[str, Any]:
+	name = list(args)[0]
+	return { name: await read_body(req) if read_body else await req.body() }
+
+async def stream_body_parser(
+		req: Request,
+		args: Dict[str, ArgDef],
+		open_stream: Optional[Callable[[ Request ], AsyncIterator[bytes]]] = None,
+	) -> Dict[str, Any]:
+	name = list(args)[0]
+	return { name: open_stream(req) if open_stream else req.stream() }
+
+_parser_dict: Dict[str, _ParserType] = {
 	'get': query_string_parser,
-	'post': json_body_parser,
+	'post': body_parser,
 }
 
-def make_endpoint(route: RouteDef) -> Callable[[ Request ], Awaitable[Response]]:
+def make_endpoint(
+		route: RouteDef,
+		deadline_policy: DeadlinePolicy,
+		process_pool: Optional[ProcessPool] = None,
+		paginator: Optional[Paginator] = None,
+		body_reader: Optional[BodyReader] = None,
+		resource_registry: Optional[ResourceRegistry] = None,
+		job_queue: Optional[JobQueue] = None,
+		profiler: Optional[Profiler] = None,
+		memory_tracker: Optional[MemoryTracker] = None,
+		idempotency_guard: Optional[IdempotencyGuard] = None,
+		response_cache: Optional[ResponseCache] = None,
+		priority_scheduler: Optional[PriorityScheduler] = None,
+	) -> Callable[[ Request ], Awaitable[Response]]:
 	parser = _parser_dict[route.http_method]
+	if route.binary_body == BINARY_BYTES:
+		parser = bytes_body_parser
+	elif route.binary_body == BINARY_STREAM:
+		parser = stream_body_parser
+
+	if route.binary_body == BINARY_STREAM and body_reader:
+		parser = partial(stream_body_parser, open_stream = partial(body_reader.stream, path = route.path, max_bytes = route.max_body_bytes))
+	elif route.http_method == 'post' and body_reader:
+		read_body = partial(body_reader.read, path = route.path, max_bytes = route.max_body_bytes)
+		parser = partial(bytes_body_parser if route.binary_body == BINARY_BYTES else body_parser, read_body = read_body)
+
+	if route.offload and not process_pool:
+		raise Exception(f'{route.path} is cpu_bound but no process pool is available')
+
+	if route.pagination and not paginator:
+		raise Exception(f'{route.path} is paginated but no paginator is available')
+
+	if route.resources and not resource_registry:
+		raise Exception(f'{route.path} uses resources but no resource registry is available')
+
+	if route.background_job and not job_queue:
+		raise Exception(f'{route.path} is a background job but no job queue is available')
+
+	if route.idempotency and not idempotency_guard:
+		raise Exception(f'{route.path} is idempotent but no idempotency guard is available')
+
+	# NamedTuples would otherwise be encoded as arrays, so responses that can contain them are converted up front
+	plain_response = contains_namedtuple(route.return_type)
+
+	async def invoke(args: Dict[str, Any]) -> Any:
+		if route.offload and process_pool:
+			return await process_pool.run(route.impl, args, route.path, route.offload.timeout_secs)
+
+		if not route.resources or not resource_registry:
+			res = route.impl(**args)
+			# handlers streaming bytes can be async generators, which are iterated rather than awaited
+			return res if inspect.isasyncgen(res) else await res
+
+		# resources are only held for the duration of the handler itself, not parsing or rendering
+		async with AsyncExitStack() as stack:
+			for name in route.resources:
+				args[name] = await stack.enter_async_context(resource_registry.checkout(name))
+			return await route.impl(**args)
+
+	def render(req: Request, res: Any) -> Response:
+		if route.binary_response == BINARY_BYTES:
+			return Response(res, media_type = BINARY_MEDIA_TYPE)
+		if route.binary_response == BINARY_STREAM:
+			return StreamingResponse(res, media_type = BINARY_MEDIA_TYPE)
+
+		if isinstance(res, Page) and paginator:
+			res = paginator.render_page(route.path, res)
+		if route.columnar_fields is not None:
+			columnar_res = columnar_response(req, res, route.columnar_fields)
+			if columnar_res is not None:
+				return columnar_res
+
+		if plain_response:
+			res = to_plain(res)
+		elif is_dataclass(res):
+			res = asdict(res)
+		return EncodedResponse(res, codec_for_accept(req.headers.get('accept')))
 
 	async def endpoint(req: Request) -> Response:
-		args = await parser(req, route.args)
+		deadline = deadline_policy.for_request(req, route.timeout_secs)
+		with span('parse'):
+			args = await parser(req, route.args)
 
 		principal = None
 		try:
@@ -108,9 +226,82 @@ def make_endpoint(route: RouteDef) -> Callable[[ Request ], Awaitable[Response]]
 			if not principal or route.requires_privilege not in principal.privileges:
 				raise Forbidden('insufficient privileges')
 
-		res = await route.impl(**args)
-		if is_dataclass(res):
-			res = asdict(res)
-		return GovynJSONResponse(res)
+		if route.requires_deadline:
+			args['deadline'] = deadline
+
+		if priority_scheduler:
+			# admission happens after auth, so callers who'd be turned away anyway never take up a slot
+			async with priority_scheduler.admit(priority_scheduler.class_for(route.priority, principal), deadline):
+				return await dispatch(req, args, principal, deadline)
+		return await dispatch(req, args, principal, deadline)
+
+	async def dispatch(req: Request, args: Dict[str, Any], principal: Optional[Principal], deadline: Deadline) -> Response:
+		if route.idempotency and idempotency_guard:
+			key = req.headers.get(IDEMPOTENCY_HEADER)
+			if key is not None:
+				return await idempotency_guard.run(req, route.path, key, principal, partial(respond, req, args, principal, deadline))
+			if route.idempotency.required:
+				raise BadRequest(f'missing required header: {IDEMPOTENCY_HEADER}')
+
+		return await respond(req, args, principal, deadline)
+
+	async def respond(req: Request, args: Dict[str, Any], principal: Optional[Principal], deadline: Deadline) -> Response:
+		if route.background_job and job_queue:
+			record = await job_queue.submit(route.path, partial(invoke, args), principal)
+			return EncodedResponse(asdict(JobAccepted(record.id)), codec_for_accept(req.headers.get('accept')), 202)
+
+		if route.cursor_arg is not None and route.pagination and paginator:
+			cursor = paginator.make_cursor(route.path, route.pagination, args.pop(CURSOR_PARAM), args.pop(LIMIT_PARAM))
+			if args.pop(STREAM_PARAM, None):
+				cursor_arg = route.cursor_arg
+				async def fetch_page(page_cursor: Cursor) -> Page[Any]:
+					return cast(Page[Any], await invoke({ **args, cursor_arg: page_cursor }))
+
+				# bulk consumers get every page as newline-delimited JSON, without the per-request deadline
+				return StreamingResponse(paginator.stream_all(cursor, fetch_page), media_type = 'application/x-ndjson')
+
+			args[route.cursor_arg] = cursor
+
+		cache_key = None
+		if route.cache and route.cache.server_ttl_secs is not None and response_cache:
+			cache_key = response_cache.key(req, route.path, principal)
+			cached = await response_cache.get(cache_key, route.path)
+			if cached is not None:
+				return apply_cache_headers(req, cached, route.cache, None)
+
+		with span('handler', route = route.path):
+			res = await deadline_policy.run(invoke(args), deadline, route.path)
+
+		etag = None
+		if route.cache and isinstance(res, Versioned):
+			etag = version_etag(req, res.version)
+			if etag_matches(req, etag):
+				return not_modified_response(route.cache, etag)
+			res = res.value
+
+		if route.binary_response == BINARY_FILE:
+			return await file_response(req, res)
+
+		# responses render their body up front, so this covers encoding as well
+		with span('serialize'):
+			response = render(req, res)
+
+		if cache_key and route.cache and route.cache.server_ttl_secs is not None and response_cache:
+			await response_cache.put(cache_key, response, route.cache.server_ttl_secs)
+
+		if route.cache:
+			return apply_cache_headers(req, response, route.cache, etag)
+		return response
+
+	if not profiler and not memory_tracker:
+		return endpoint
+
+	async def measured_endpoint(req: Request) -> Response:
+		coro = endpoint(req)
+		if memory_tracker:
+			coro = memory_tracker.measure(route.path, coro)
+		if profiler:
+			coro = profiler.measure(route.path, coro)
+		return await coro
 
-	return endpoint
+	return measured_endpoint
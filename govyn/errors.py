@@ -1,4 +1,3 @@
-import traceback
 from dataclasses import dataclass
 from http import HTTPStatus
 from typing import Any, ClassVar, Optional
@@ -8,6 +7,9 @@ from starlette.middleware.base import (BaseHTTPMiddleware,
                                        RequestResponseEndpoint)
 from starlette.requests import Request
 from starlette.responses import JSONResponse, Response
+from starlette.types import ASGIApp
+
+from .log import StructuredLogger
 
 
 @dataclass
@@ -36,6 +38,14 @@ class NotFound(HTTPError):
 class Conflict(HTTPError):
 	code = 409
 
+@dataclass
+class PayloadTooLarge(HTTPError):
+	code = 413
+
+@dataclass
+class UnsupportedMediaType(HTTPError):
+	code = 415
+
 @dataclass
 class TooManyRequests(HTTPError):
 	code = 429
@@ -44,6 +54,14 @@ class TooManyRequests(HTTPError):
 class InternalServerError(HTTPError):
 	code = 500
 
+@dataclass
+class ServiceUnavailable(HTTPError):
+	code = 503
+
+@dataclass
+class GatewayTimeout(HTTPError):
+	code = 504
+
 def error_response(code: int, desc: Optional[str], data: Optional[Any]) -> JSONResponse:
 	return JSONResponse({
 		'error_type': HTTPStatus(code).phrase,
@@ -52,6 +70,10 @@ def error_response(code: int, desc: Optional[str], data: Optional[Any]) -> JSONR
 	}, code)
 
 class JSONErrorMiddleware(BaseHTTPMiddleware):
+	def __init__(self, app: ASGIApp, logger: StructuredLogger) -> None:
+		super().__init__(app)
+		self.logger = logger
+
 	async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
 		try:
 			response = await call_next(request)
@@ -59,6 +81,5 @@ class JSONErrorMiddleware(BaseHTTPMiddleware):
 		except HTTPError as ex:
 			return error_response(ex.code, ex.desc, ex.data)
 		except Exception as ex:
-			print("Internal Error")
-			traceback.print_exc()
+			self.logger.exception('internal_error', ex, method = request.method, path = request.url.path)
 			return error_response(500, None, None)
@@ -0,0 +1,130 @@
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, Generic, Optional, TypeVar
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .auth import Principal, TFunc
+from .cache import Cache
+from .columnar import COLUMNAR_QUERY_FLAG
+from .metrics import MetricsRegistry
+
+T = TypeVar('T')
+
+_CACHE_ATTR = '_cache'
+
+# characters allowed inside a quoted entity tag
+_ETAG_CHARS_RE = re.compile(r'^[\x21\x23-\x7e]+$')
+
+@dataclass
+class CacheSpec:
+	cache_control: Optional[str]
+	etag: bool
+	# rendered responses are also kept server-side for this long, in the app's response cache
+	server_ttl_secs: Optional[float] = None
+
+def cache_control(value: Optional[str] = None, etag: bool = True, server_ttl_secs: Optional[float] = None) -> Callable[[ TFunc ], TFunc]:
+	def _decorator(func: TFunc) -> TFunc:
+		setattr(func, _CACHE_ATTR, CacheSpec(value, etag, server_ttl_secs))
+		return func
+	return _decorator
+
+# returned by handlers that already know whether their result changed, e.g. from a row version;
+# matching requests get a 304 without the value ever being serialised
+@dataclass
+class Versioned(Generic[T]):
+	value: T
+	version: str
+
+def is_versioned_type(py_type: type) -> bool:
+	return getattr(py_type, '__origin__', None) is Versioned
+
+def _quote(tag: str) -> str:
+	return f'"{tag}"'
+
+def body_etag(body: bytes) -> str:
+	return _quote(hashlib.blake2b(body, digest_size = 16).hexdigest())
+
+def version_etag(req: Request, version: str) -> str:
+	# the same version renders differently depending on the negotiated encoding, so that's part of the tag
+	variant = f'{req.headers.get("accept", "")}\0{req.query_params.get(COLUMNAR_QUERY_FLAG, "")}'
+	digest = hashlib.blake2b(variant.encode('utf-8'), digest_size = 4).hexdigest()
+	if _ETAG_CHARS_RE.match(version):
+		return _quote(f'{version}-{digest}')
+	return _quote(hashlib.blake2b(f'{version}\0{variant}'.encode('utf-8'), digest_size = 16).hexdigest())
+
+def etag_matches(req: Request, etag: str) -> bool:
+	header = req.headers.get('if-none-match')
+	if not header:
+		return False
+
+	for candidate in header.split(','):
+		candidate = candidate.strip()
+		# If-None-Match uses weak comparison, so W/ prefixes are ignored
+		if candidate.startswith('W/'):
+			candidate = candidate[2:]
+		if candidate == '*' or candidate == etag:
+			return True
+	return False
+
+def _cache_headers(spec: CacheSpec, etag: Optional[str]) -> Dict[str, str]:
+	headers = { 'vary': 'Accept' }
+	if etag:
+		headers['etag'] = etag
+	if spec.cache_control:
+		headers['cache-control'] = spec.cache_control
+	return headers
+
+def not_modified_response(spec: CacheSpec, etag: str) -> Response:
+	return Response(status_code = 304, headers = _cache_headers(spec, etag))
+
+# tags the rendered response, swapping it for a 304 if the client already has it
+def apply_cache_headers(req: Request, res: Response, spec: CacheSpec, etag: Optional[str]) -> Response:
+	if res.status_code != 200:
+		return res
+
+	if etag is None and spec.etag:
+		etag = body_etag(res.body)
+
+	if etag and etag_matches(req, etag):
+		return not_modified_response(spec, etag)
+
+	for k, v in _cache_headers(spec, etag).items():
+		res.headers[k] = v
+	return res
+
+class ResponseCache:
+	def __init__(self, cache: Cache, metrics_registry: MetricsRegistry) -> None:
+		self.cache = cache
+		self.hits_counter = metrics_registry.counter('api_response_cache_hits')
+		self.misses_counter = metrics_registry.counter('api_response_cache_misses')
+
+	async def startup(self) -> None:
+		await self.cache.startup()
+
+	async def shutdown(self) -> None:
+		await self.cache.shutdown()
+
+	# responses can depend on the arguments, the negotiated encoding and who's asking
+	def key(self, req: Request, path: str, principal: Optional[Principal]) -> str:
+		query = '&'.join(sorted(req.url.query.split('&')))
+		variant = f'{path}\0{query}\0{req.headers.get("accept", "")}\0{principal.id if principal else ""}'
+		return 'response:' + hashlib.blake2b(variant.encode('utf-8'), digest_size = 16).hexdigest()
+
+	async def get(self, key: str, path: str) -> Optional[Response]:
+		cached = await self.cache.get(key)
+		if cached is None:
+			self.misses_counter.inc(path = path)
+			return None
+
+		self.hits_counter.inc(path = path)
+		content_type, _, body = cached.partition(b'\n')
+		return Response(body, headers = { 'content-type': content_type.decode('latin-1') })
+
+	async def put(self, key: str, res: Response, ttl_secs: float) -> None:
+		if res.status_code != 200 or not hasattr(res, 'body'):
+			return
+		content_type = res.headers.get('content-type', '')
+		await self.cache.set(key, content_type.encode('latin-1') + b'\n' + res.body, ttl_secs)
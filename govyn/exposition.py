@@ -0,0 +1,162 @@
+import asyncio
+import gzip
+import math
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .memory import _BYTES_BUCKETS
+from .metrics import MetricsRegistry
+
+# starlette appends the charset to text/ types itself
+TEXT_CONTENT_TYPE = 'text/plain; version=0.0.4'
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+@dataclass
+class MetricsEndpointConfig:
+	# scrapes inside this window share one rendering, so a burst of scrapers costs the same as one
+	cache_secs: float
+	# smaller bodies aren't worth the CPU to compress
+	gzip_min_bytes: int
+	# collectors copied between yields to the event loop while taking a snapshot
+	collectors_per_step: int
+
+def default_metrics_endpoint_config() -> MetricsEndpointConfig:
+	return MetricsEndpointConfig(
+		cache_secs = 1.0,
+		gzip_min_bytes = 1024,
+		collectors_per_step = 20,
+	)
+
+@dataclass
+class _Family:
+	name: str
+	doc: str
+	kind: str
+	samples: List[Tuple[Dict[str, str], Any]]
+
+def _escape_label(value: str) -> str:
+	return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _escape_help(value: str) -> str:
+	return value.replace('\\', '\\\\').replace('\n', '\\n')
+
+def _format_value(value: Any) -> str:
+	if isinstance(value, float):
+		if math.isnan(value):
+			return 'NaN'
+		if math.isinf(value):
+			return '+Inf' if value > 0 else '-Inf'
+		return repr(value)
+	return str(int(value))
+
+def _sample_line(name: str, labels: Dict[str, str], value: Any) -> str:
+	if not labels:
+		return f'{name} {_format_value(value)}'
+	label_str = ','.join([ f'{k}="{_escape_label(str(v))}"' for k, v in labels.items() ])
+	return f'{name}{{{label_str}}} {_format_value(value)}'
+
+def render_families(families: List[_Family], openmetrics: bool) -> bytes:
+	lines: List[str] = []
+	for family in families:
+		name = family.name
+		kind = family.kind
+		if openmetrics:
+			# OpenMetrics names counter families without the suffix its samples carry
+			if kind == 'counter' and name.endswith('_total'):
+				name = name[:-len('_total')]
+			if kind == 'untyped':
+				kind = 'unknown'
+
+		if family.doc:
+			lines.append(f'# HELP {name} {_escape_help(family.doc)}')
+		lines.append(f'# TYPE {name} {kind}')
+
+		for labels, value in family.samples:
+			if isinstance(value, dict):
+				# histograms carry their buckets and summaries their quantiles, keyed by bound
+				bound_label = 'le' if kind == 'histogram' else 'quantile'
+				bound_suffix = '_bucket' if kind == 'histogram' else ''
+				for bound, bound_value in value.items():
+					if isinstance(bound, str):
+						lines.append(_sample_line(f'{name}_{bound}', labels, bound_value))
+					else:
+						lines.append(_sample_line(name + bound_suffix, { **labels, bound_label: _format_value(float(bound)) }, bound_value))
+			elif openmetrics and kind == 'counter':
+				lines.append(_sample_line(name + '_total', labels, value))
+			else:
+				lines.append(_sample_line(name, labels, value))
+
+	if openmetrics:
+		lines.append('# EOF')
+	lines.append('')
+	return '\n'.join(lines).encode('utf-8')
+
+def _encode(families: List[_Family], openmetrics: bool, compress: bool, gzip_min_bytes: int) -> Tuple[bytes, bool]:
+	body = render_families(families, openmetrics)
+	if compress and len(body) >= gzip_min_bytes:
+		return gzip.compress(body, compresslevel = 6), True
+	return body, False
+
+class MetricsExposition:
+	def __init__(self, config: MetricsEndpointConfig, metrics_registry: MetricsRegistry) -> None:
+		self.config = config
+		self.metrics_registry = metrics_registry
+		# keyed by (openmetrics, gzip accepted), holding (expiry, body, gzipped)
+		self._cache: Dict[Tuple[bool, bool], Tuple[float, bytes, bool]] = {}
+		self._renders: Dict[Tuple[bool, bool], 'asyncio.Future[Tuple[bytes, bool]]'] = {}
+		self.scrape_histogram = metrics_registry.histogram('api_metrics_scrape_seconds')
+		self.size_histogram = metrics_registry.histogram('api_metrics_scrape_bytes', buckets = _BYTES_BUCKETS)
+
+	# copies the collectors' values a few at a time, so a large registry doesn't stall live requests
+	async def _snapshot(self) -> List[_Family]:
+		collectors = self.metrics_registry._prom_svc.registry.get_all()
+		families = []
+		for i, collector in enumerate(collectors):
+			if i and i % self.config.collectors_per_step == 0:
+				await asyncio.sleep(0)
+			samples = [ ({ **collector.const_labels, **labels }, value) for labels, value in collector.get_all() ]
+			families.append(_Family(collector.name, collector.doc, collector.kind.name, samples))
+		return families
+
+	async def _render(self, key: Tuple[bool, bool]) -> Tuple[bytes, bool]:
+		families = await self._snapshot()
+		openmetrics, compress = key
+		# formatting and compression only touch the copies, so they can run off the loop
+		body, gzipped = await asyncio.get_running_loop().run_in_executor(
+			None, _encode, families, openmetrics, compress, self.config.gzip_min_bytes,
+		)
+		self._cache[key] = (time.monotonic() + self.config.cache_secs, body, gzipped)
+		return body, gzipped
+
+	async def body(self, openmetrics: bool, compress: bool) -> Tuple[bytes, bool, bool]:
+		key = (openmetrics, compress)
+		cached = self._cache.get(key)
+		if cached and cached[0] > time.monotonic():
+			return cached[1], cached[2], True
+
+		# concurrent scrapes of an expired entry wait on the same render
+		render = self._renders.get(key)
+		if render is None:
+			render = self._renders[key] = asyncio.ensure_future(self._render(key))
+			render.add_done_callback(lambda _: self._renders.pop(key, None))
+		body, gzipped = await asyncio.shield(render)
+		return body, gzipped, False
+
+	async def endpoint(self, req: Request) -> Response:
+		openmetrics = 'application/openmetrics-text' in req.headers.get('accept', '')
+		compress = 'gzip' in req.headers.get('accept-encoding', '')
+		fmt = 'openmetrics' if openmetrics else 'text'
+
+		with self.scrape_histogram.observe_time(format = fmt) as labels:
+			body, gzipped, hit = await self.body(openmetrics, compress)
+			labels.update(cache = 'hit' if hit else 'miss')
+		self.size_histogram.observe(len(body), format = fmt)
+
+		headers = { 'vary': 'Accept, Accept-Encoding' }
+		if gzipped:
+			headers['content-encoding'] = 'gzip'
+		return Response(body, headers = headers, media_type = OPENMETRICS_CONTENT_TYPE if openmetrics else TEXT_CONTENT_TYPE)
@@ -0,0 +1,160 @@
+import asyncio
+from dataclasses import asdict, dataclass
+from typing import Callable, List, Optional, Tuple, Union
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .errors import error_response
+from .metrics import MetricsRegistry
+
+@dataclass
+class HealthConfig:
+	max_in_flight: Optional[int]
+	max_loop_lag_secs: Optional[float]
+	loop_lag_interval_secs: float
+	drain_timeout_secs: float
+
+def default_health_config() -> HealthConfig:
+	return HealthConfig(
+		max_in_flight = None,
+		max_loop_lag_secs = 0.5,
+		loop_lag_interval_secs = 0.5,
+		drain_timeout_secs = 30.0,
+	)
+
+@dataclass
+class Readiness:
+	ready: bool
+	reasons: List[str]
+	in_flight: int
+	loop_lag_secs: float
+
+class HealthMonitor:
+	def __init__(self, config: HealthConfig, metrics_registry: MetricsRegistry) -> None:
+		self.config = config
+		self.started = False
+		self.draining = False
+		self.in_flight = 0
+		self.loop_lag_secs = 0.0
+		self._idle = asyncio.Event()
+		self._idle.set()
+		self._lag_task: Optional['asyncio.Task[None]'] = None
+		self._drain_callbacks: List[Callable[[], None]] = []
+		self.in_flight_gauge = metrics_registry.gauge('api_in_flight_requests')
+		self.loop_lag_gauge = metrics_registry.gauge('api_event_loop_lag_seconds')
+		self.rejected_counter = metrics_registry.counter('api_drain_rejected_requests')
+
+	async def startup(self) -> None:
+		self._idle = asyncio.Event()
+		self._idle.set()
+		self._lag_task = asyncio.get_running_loop().create_task(self._measure_loop_lag())
+
+	# registered after every other startup hook, so readiness only flips once they've all succeeded
+	async def mark_started(self) -> None:
+		self.started = True
+
+	async def shutdown(self) -> None:
+		self.begin_drain()
+		await self.wait_for_drain()
+
+		if self._lag_task:
+			self._lag_task.cancel()
+			self._lag_task = None
+
+	async def _measure_loop_lag(self) -> None:
+		loop = asyncio.get_running_loop()
+		interval = self.config.loop_lag_interval_secs
+		while True:
+			start_time = loop.time()
+			await asyncio.sleep(interval)
+			self.loop_lag_secs = max(0.0, loop.time() - start_time - interval)
+			self.loop_lag_gauge.set(self.loop_lag_secs)
+
+	# for long-lived connections, which would otherwise hold up the drain until it times out
+	def on_drain(self, callback: Callable[[], None]) -> None:
+		self._drain_callbacks.append(callback)
+
+	def begin_drain(self) -> None:
+		if self.draining:
+			return
+
+		self.draining = True
+		for callback in self._drain_callbacks:
+			callback()
+
+	async def wait_for_drain(self) -> bool:
+		try:
+			await asyncio.wait_for(self._idle.wait(), self.config.drain_timeout_secs)
+			return True
+		except asyncio.TimeoutError:
+			return False
+
+	def request_started(self) -> None:
+		self.in_flight += 1
+		self.in_flight_gauge.set(self.in_flight)
+		self._idle.clear()
+
+	def request_finished(self) -> None:
+		self.in_flight -= 1
+		self.in_flight_gauge.set(self.in_flight)
+		if self.in_flight == 0:
+			self._idle.set()
+
+	def readiness(self) -> Readiness:
+		reasons = []
+		if not self.started:
+			reasons.append('starting up')
+		if self.draining:
+			reasons.append('draining')
+		if self.config.max_in_flight is not None and self.in_flight >= self.config.max_in_flight:
+			reasons.append('too many requests in flight')
+		if self.config.max_loop_lag_secs is not None and self.loop_lag_secs > self.config.max_loop_lag_secs:
+			reasons.append('event loop is lagging')
+
+		return Readiness(
+			ready = not reasons,
+			reasons = reasons,
+			in_flight = self.in_flight,
+			loop_lag_secs = self.loop_lag_secs,
+		)
+
+class InFlightMiddleware:
+	def __init__(self, app: ASGIApp, health_monitor: HealthMonitor, exempt_prefix: Union[str, Tuple[str, ...]]) -> None:
+		self.app = app
+		self.health_monitor = health_monitor
+		self.exempt_prefix = exempt_prefix
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+		if scope['type'] != 'http' or scope['path'].startswith(self.exempt_prefix):
+			await self.app(scope, receive, send)
+			return
+
+		monitor = self.health_monitor
+		if monitor.draining:
+			monitor.rejected_counter.inc()
+			response = error_response(503, 'server is shutting down', None)
+			await response(scope, receive, send)
+			return
+
+		monitor.request_started()
+		try:
+			await self.app(scope, receive, send)
+		finally:
+			monitor.request_finished()
+
+def health_app(health_monitor: HealthMonitor) -> Starlette:
+	def ready(_: Request) -> JSONResponse:
+		readiness = health_monitor.readiness()
+		return JSONResponse(asdict(readiness), 200 if readiness.ready else 503)
+
+	return Starlette(
+		routes = [
+			Route('/check', lambda _: JSONResponse({})),
+			Route('/live', lambda _: JSONResponse({})),
+			Route('/ready', ready),
+		]
+	)
@@ -0,0 +1,179 @@
+import asyncio
+import hashlib
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .auth import Principal, TFunc
+from .errors import BadRequest, Conflict, HTTPError, error_response
+from .metrics import MetricsRegistry
+
+_IDEMPOTENT_ATTR = '_idempotent'
+
+IDEMPOTENCY_HEADER = 'idempotency-key'
+REPLAYED_HEADER = 'idempotent-replayed'
+
+_MAX_KEY_LENGTH = 255
+
+@dataclass
+class IdempotencySpec:
+	# when set, requests without an Idempotency-Key header are rejected rather than run unprotected
+	required: bool
+
+def idempotent(required: bool = False) -> Callable[[ TFunc ], TFunc]:
+	def _decorator(func: TFunc) -> TFunc:
+		setattr(func, _IDEMPOTENT_ATTR, IdempotencySpec(required))
+		return func
+	return _decorator
+
+@dataclass
+class StoredResponse:
+	# hash of the request the response was produced for, so a reused key with a different body can be spotted
+	fingerprint: str
+	status_code: int
+	headers: List[Tuple[bytes, bytes]]
+	body: bytes
+
+class IdempotencyStore(ABC):
+	async def startup(self) -> None:
+		pass
+
+	async def shutdown(self) -> None:
+		pass
+
+	@abstractmethod
+	async def get(self, key: str) -> Optional[StoredResponse]:
+		...
+
+	@abstractmethod
+	async def save(self, key: str, response: StoredResponse, ttl_secs: float) -> None:
+		...
+
+class InMemoryIdempotencyStore(IdempotencyStore):
+	def __init__(self, max_entries: int = 10000) -> None:
+		self.max_entries = max_entries
+		self._entries: 'OrderedDict[str, Tuple[float, StoredResponse]]' = OrderedDict()
+
+	def _evict_expired(self, now: float) -> None:
+		# entries mostly share a TTL, so the oldest are also the first to expire
+		while self._entries:
+			key, (expires_at, _) = next(iter(self._entries.items()))
+			if expires_at > now:
+				break
+			del self._entries[key]
+
+	async def get(self, key: str) -> Optional[StoredResponse]:
+		entry = self._entries.get(key)
+		if entry is None:
+			return None
+		expires_at, response = entry
+		if expires_at <= time.monotonic():
+			del self._entries[key]
+			return None
+		return response
+
+	async def save(self, key: str, response: StoredResponse, ttl_secs: float) -> None:
+		now = time.monotonic()
+		self._evict_expired(now)
+		self._entries.pop(key, None)
+		self._entries[key] = (now + ttl_secs, response)
+		while len(self._entries) > self.max_entries:
+			self._entries.popitem(last = False)
+
+@dataclass
+class IdempotencyConfig:
+	store: IdempotencyStore
+	ttl_secs: float
+
+def default_idempotency_config() -> IdempotencyConfig:
+	return IdempotencyConfig(
+		store = InMemoryIdempotencyStore(),
+		ttl_secs = 24 * 60 * 60.0,
+	)
+
+def _replay(stored: StoredResponse) -> Response:
+	res = Response(stored.body, stored.status_code)
+	res.raw_headers += [ *stored.headers, (REPLAYED_HEADER.encode('latin-1'), b'true') ]
+	return res
+
+class IdempotencyGuard:
+	def __init__(self, config: IdempotencyConfig, metrics_registry: MetricsRegistry) -> None:
+		self.config = config
+		self.store = config.store
+		# executions in progress in this process, by scoped key, with the fingerprint they're running for
+		self._pending: Dict[str, Tuple[str, 'asyncio.Future[None]']] = {}
+		self.replayed_counter = metrics_registry.counter('api_idempotent_replays')
+		self.conflict_counter = metrics_registry.counter('api_idempotency_conflicts')
+
+	async def startup(self) -> None:
+		await self.store.startup()
+
+	async def shutdown(self) -> None:
+		await self.store.shutdown()
+
+	def _check(self, path: str, fingerprint: str, stored_fingerprint: str) -> None:
+		if fingerprint != stored_fingerprint:
+			self.conflict_counter.inc(path = path)
+			raise Conflict('idempotency key was already used for a different request')
+
+	async def run(
+			self,
+			req: Request,
+			path: str,
+			key: str,
+			principal: Optional[Principal],
+			respond: Callable[[], Awaitable[Response]],
+		) -> Response:
+		if not key or len(key) > _MAX_KEY_LENGTH:
+			raise BadRequest(f'{IDEMPOTENCY_HEADER} must be between 1 and {_MAX_KEY_LENGTH} characters')
+
+		# keys are only unique per client, so two principals picking the same key never see each other's responses
+		principal_id = principal.id if principal else ''
+		scoped_key = hashlib.blake2b(f'{principal_id}\0{path}\0{key}'.encode('utf-8'), digest_size = 16).hexdigest()
+		body = await req.body()
+		fingerprint = hashlib.blake2b(
+			req.headers.get('content-type', '').encode('latin-1') + b'\0' + body,
+			digest_size = 16,
+		).hexdigest()
+
+		while True:
+			stored = await self.store.get(scoped_key)
+			if stored is not None:
+				self._check(path, fingerprint, stored.fingerprint)
+				self.replayed_counter.inc(path = path)
+				return _replay(stored)
+
+			pending = self._pending.get(scoped_key)
+			if pending is None:
+				break
+
+			# a duplicate arriving mid-execution waits for the original, then replays whatever it stored;
+			# if nothing was stored (it failed), the next waiter through takes over
+			pending_fingerprint, done = pending
+			self._check(path, fingerprint, pending_fingerprint)
+			await asyncio.shield(done)
+
+		done = asyncio.get_running_loop().create_future()
+		self._pending[scoped_key] = (fingerprint, done)
+		try:
+			try:
+				res = await respond()
+			except HTTPError as ex:
+				# a client error from the handler is its answer to this request, so a retry gets the same one;
+				# server errors propagate and leave the key free for the retry to run again
+				if ex.code >= 500:
+					raise
+				res = error_response(ex.code, ex.desc, ex.data)
+			# server errors are worth retrying, and streamed bodies can't be replayed
+			if res.status_code < 500 and hasattr(res, 'body'):
+				headers = [ (k, v) for k, v in res.raw_headers if k != b'content-length' ]
+				await self.store.save(scoped_key, StoredResponse(fingerprint, res.status_code, headers, res.body), self.config.ttl_secs)
+			return res
+		finally:
+			del self._pending[scoped_key]
+			done.set_result(None)
@@ -0,0 +1,307 @@
+import asyncio
+import json
+import sqlite3
+import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from datetime import datetime, timezone
+from enum import Enum
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, cast
+
+from .auth import _REQUIRES_PRIVILEGE_ATTR, Principal, TFunc
+from .codecs import to_plain
+from .errors import Conflict, HTTPError, NotFound, TooManyRequests
+from .log import StructuredLogger
+from .metrics import MetricsRegistry
+
+_BACKGROUND_JOB_ATTR = '_background_job'
+
+def background_job() -> Callable[[ TFunc ], TFunc]:
+	def _decorator(func: TFunc) -> TFunc:
+		setattr(func, _BACKGROUND_JOB_ATTR, True)
+		return func
+	return _decorator
+
+class JobState(Enum):
+	queued = 'queued'
+	running = 'running'
+	succeeded = 'succeeded'
+	failed = 'failed'
+
+@dataclass
+class JobRecord:
+	id: str
+	path: str
+	principal_id: Optional[str]
+	state: JobState
+	created_at: float
+	started_at: Optional[float] = None
+	finished_at: Optional[float] = None
+	# results are stored already converted to plain JSON-compatible values
+	result: Optional[Any] = None
+	error: Optional[str] = None
+
+@dataclass
+class JobAccepted:
+	job_id: str
+
+@dataclass
+class JobStatus:
+	job_id: str
+	state: JobState
+	created_at: datetime
+	started_at: Optional[datetime]
+	finished_at: Optional[datetime]
+	error: Optional[str]
+
+def _timestamp(t: float) -> datetime:
+	return datetime.fromtimestamp(t, timezone.utc)
+
+def _maybe_timestamp(t: Optional[float]) -> Optional[datetime]:
+	return _timestamp(t) if t is not None else None
+
+class JobStore(ABC):
+	async def startup(self) -> None:
+		pass
+
+	async def shutdown(self) -> None:
+		pass
+
+	@abstractmethod
+	async def save(self, record: JobRecord) -> None:
+		...
+
+	@abstractmethod
+	async def get(self, job_id: str) -> Optional[JobRecord]:
+		...
+
+class InMemoryJobStore(JobStore):
+	def __init__(self, max_jobs: int = 10000) -> None:
+		self.max_jobs = max_jobs
+		self._jobs: Dict[str, JobRecord] = {}
+
+	async def save(self, record: JobRecord) -> None:
+		self._jobs[record.id] = record
+
+		# dicts keep insertion order, so the oldest jobs are first in line for eviction
+		if len(self._jobs) > self.max_jobs:
+			for job_id, job in list(self._jobs.items()):
+				if job.state in (JobState.succeeded, JobState.failed):
+					del self._jobs[job_id]
+					break
+
+	async def get(self, job_id: str) -> Optional[JobRecord]:
+		return self._jobs.get(job_id)
+
+class SQLiteJobStore(JobStore):
+	def __init__(self, path: str) -> None:
+		self.path = path
+		self._conn: Optional[sqlite3.Connection] = None
+		# sqlite connections aren't safe to share between threads, so every query goes through this one
+		self._executor = ThreadPoolExecutor(max_workers = 1)
+
+	async def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+		return await asyncio.get_running_loop().run_in_executor(self._executor, partial(func, *args))
+
+	def _connect(self) -> None:
+		self._conn = sqlite3.connect(self.path, check_same_thread = False)
+		with self._conn:
+			self._conn.execute('''
+				create table if not exists govyn_jobs (
+					id text primary key,
+					path text not null,
+					principal_id text,
+					state text not null,
+					created_at real not null,
+					started_at real,
+					finished_at real,
+					result text,
+					error text
+				)
+			''')
+			# the queue itself lives in memory, so anything unfinished from a previous run is never coming back
+			self._conn.execute(
+				'update govyn_jobs set state = ?, error = ? where state in (?, ?)',
+				(JobState.failed.value, 'interrupted by server restart', JobState.queued.value, JobState.running.value),
+			)
+
+	def _save(self, record: JobRecord) -> None:
+		assert self._conn
+		with self._conn:
+			self._conn.execute(
+				'insert or replace into govyn_jobs values (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+				(
+					record.id, record.path, record.principal_id, record.state.value,
+					record.created_at, record.started_at, record.finished_at,
+					json.dumps(record.result) if record.result is not None else None, record.error,
+				),
+			)
+
+	def _get(self, job_id: str) -> Optional[JobRecord]:
+		assert self._conn
+		row = self._conn.execute('select * from govyn_jobs where id = ?', (job_id,)).fetchone()
+		if row is None:
+			return None
+
+		id, path, principal_id, state, created_at, started_at, finished_at, result, error = row
+		return JobRecord(
+			id = id,
+			path = path,
+			principal_id = principal_id,
+			state = JobState(state),
+			created_at = created_at,
+			started_at = started_at,
+			finished_at = finished_at,
+			result = json.loads(result) if result is not None else None,
+			error = error,
+		)
+
+	async def startup(self) -> None:
+		await self._run(self._connect)
+
+	async def shutdown(self) -> None:
+		if self._conn:
+			await self._run(self._conn.close)
+			self._conn = None
+		self._executor.shutdown(wait = False)
+
+	async def save(self, record: JobRecord) -> None:
+		await self._run(self._save, record)
+
+	async def get(self, job_id: str) -> Optional[JobRecord]:
+		return cast(Optional[JobRecord], await self._run(self._get, job_id))
+
+@dataclass
+class JobQueueConfig:
+	workers: int
+	max_queue_size: int
+	store: JobStore
+
+def default_job_queue_config() -> JobQueueConfig:
+	return JobQueueConfig(
+		workers = 4,
+		max_queue_size = 1000,
+		store = InMemoryJobStore(),
+	)
+
+_QueueEntry = Tuple[JobRecord, Callable[[], Awaitable[Any]]]
+
+class JobQueue:
+	def __init__(self, config: JobQueueConfig, metrics_registry: MetricsRegistry, logger: StructuredLogger) -> None:
+		self.config = config
+		self.logger = logger
+		self.store = config.store
+		self._queue: Optional['asyncio.Queue[_QueueEntry]'] = None
+		self._workers: List['asyncio.Task[None]'] = []
+		self.queue_depth_gauge = metrics_registry.gauge('api_job_queue_depth')
+		self.wait_histogram = metrics_registry.histogram('api_job_queue_wait_seconds')
+		self.run_histogram = metrics_registry.histogram('api_job_run_seconds')
+		self.completed_counter = metrics_registry.counter('api_jobs_completed')
+
+	async def startup(self) -> None:
+		await self.store.startup()
+		self._queue = asyncio.Queue(self.config.max_queue_size)
+		loop = asyncio.get_running_loop()
+		self._workers = [ loop.create_task(self._work()) for _ in range(self.config.workers) ]
+
+	async def shutdown(self) -> None:
+		for worker in self._workers:
+			worker.cancel()
+		await asyncio.gather(*self._workers, return_exceptions = True)
+		self._workers = []
+		await self.store.shutdown()
+
+	async def submit(self, path: str, run: Callable[[], Awaitable[Any]], principal: Optional[Principal]) -> JobRecord:
+		if self._queue is None:
+			raise Exception('job queue has not been started')
+
+		record = JobRecord(
+			id = uuid.uuid4().hex,
+			path = path,
+			principal_id = principal.id if principal else None,
+			state = JobState.queued,
+			created_at = time.time(),
+		)
+
+		# enqueue before the first await, so the capacity check can't race with other submissions;
+		# stores serialise their writes, so this save still lands before the worker's
+		try:
+			self._queue.put_nowait((record, run))
+		except asyncio.QueueFull:
+			raise TooManyRequests('job queue is full')
+
+		self.queue_depth_gauge.set(self._queue.qsize())
+		await self.store.save(record)
+		return record
+
+	async def _work(self) -> None:
+		assert self._queue
+		while True:
+			record, run = await self._queue.get()
+			self.queue_depth_gauge.set(self._queue.qsize())
+
+			started_at = time.time()
+			record = replace(record, state = JobState.running, started_at = started_at)
+			self.wait_histogram.observe(started_at - record.created_at, path = record.path)
+			await self.store.save(record)
+
+			try:
+				result = await run()
+				record = replace(record, state = JobState.succeeded, result = to_plain(result))
+			except HTTPError as ex:
+				record = replace(record, state = JobState.failed, error = ex.desc)
+			except Exception as ex:
+				self.logger.exception('job_failed', ex, job_id = record.id, path = record.path)
+				record = replace(record, state = JobState.failed, error = 'internal error')
+
+			finished_at = time.time()
+			record = replace(record, finished_at = finished_at)
+			self.run_histogram.observe(finished_at - started_at, path = record.path)
+			self.completed_counter.inc(path = record.path, state = record.state.value)
+			await self.store.save(record)
+
+	async def _get_visible(self, path: str, job_id: str, principal: Optional[Principal]) -> JobRecord:
+		record = await self.store.get(job_id)
+		# jobs belonging to other principals are indistinguishable from ones that don't exist
+		if record is None or record.path != path or record.principal_id != (principal.id if principal else None):
+			raise NotFound('no such job')
+		return record
+
+	# builds get_ handlers for polling a job route, named so make_route_def gives them
+	# paths next to the original, e.g. /report_status and /report_result for post_report
+	def route_handlers(self, path: str, return_type: type, requires_privilege: Optional[str]) -> List[Callable[..., Any]]:
+		base_name = '_'.join([ 'get', *filter(None, [ path.strip('/') ]) ])
+
+		async def status(job_id: str, principal: Optional[Principal]) -> JobStatus:
+			record = await self._get_visible(path, job_id, principal)
+			return JobStatus(
+				job_id = record.id,
+				state = record.state,
+				created_at = _timestamp(record.created_at),
+				started_at = _maybe_timestamp(record.started_at),
+				finished_at = _maybe_timestamp(record.finished_at),
+				error = record.error,
+			)
+
+		async def result(job_id: str, principal: Optional[Principal]) -> Any:
+			record = await self._get_visible(path, job_id, principal)
+			if record.state == JobState.failed:
+				raise Conflict('job failed', data = record.error)
+			if record.state != JobState.succeeded:
+				raise Conflict('job has not finished yet')
+			return record.result
+
+		status.__name__ = f'{base_name}_status'
+		status.__doc__ = f'Status of a job started by POST {path}'
+		result.__name__ = f'{base_name}_result'
+		result.__doc__ = f'Result of a job started by POST {path}, once it has succeeded'
+		result.__annotations__['return'] = return_type
+
+		for handler in (status, result):
+			if requires_privilege is not None:
+				setattr(handler, _REQUIRES_PRIVILEGE_ATTR, requires_privilege)
+
+		return [ status, result ]
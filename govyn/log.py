@@ -0,0 +1,178 @@
+import asyncio
+import hashlib
+import json
+import random
+import sys
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from time import monotonic, perf_counter
+from typing import Any, Deque, Dict, List, Optional, TextIO, Tuple, Union
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .metrics import MetricsRegistry
+
+@dataclass
+class LogConfig:
+	stream: TextIO
+	# records waiting to be written; anything beyond this is dropped rather than slowing requests down
+	queue_size: int
+	batch_size: int
+	flush_interval_secs: float
+	access_log: bool
+	# fraction of successful requests that get an access log line; server errors are always logged
+	access_sample_rate: float
+	# an identical stack trace is only written out in full once per window
+	dedup_window_secs: float
+
+def default_log_config() -> LogConfig:
+	return LogConfig(
+		stream = sys.stderr,
+		queue_size = 10000,
+		batch_size = 200,
+		flush_interval_secs = 0.25,
+		# a line per request is a lot of output for apps that never asked for it
+		access_log = False,
+		access_sample_rate = 1.0,
+		dedup_window_secs = 60.0,
+	)
+
+def _stack_id(ex: BaseException) -> str:
+	# only code locations go into the fingerprint, so it's cheap to compute and stable across messages
+	h = hashlib.sha1(type(ex).__qualname__.encode('utf-8'))
+	for frame, lineno in traceback.walk_tb(ex.__traceback__):
+		h.update(f'{frame.f_code.co_filename}:{frame.f_code.co_name}:{lineno}'.encode('utf-8'))
+	return h.hexdigest()[:16]
+
+def _encode_record(record: Dict[str, Any]) -> str:
+	stack = record.pop('stack', None)
+	if isinstance(stack, traceback.TracebackException):
+		record['stack'] = ''.join(stack.format())
+	return json.dumps(record, ensure_ascii = False, separators = (',', ':'), default = str) + '\n'
+
+class StructuredLogger:
+	def __init__(self, config: LogConfig, metrics_registry: MetricsRegistry) -> None:
+		self.config = config
+		self._records: Deque[Dict[str, Any]] = deque()
+		self._stacks_seen: Dict[str, float] = {}
+		self._wakeup: Optional[asyncio.Event] = None
+		self._writer_task: Optional['asyncio.Task[None]'] = None
+		# a single thread keeps writes ordered, and blocking on a slow stream never stalls the event loop
+		self._executor = ThreadPoolExecutor(max_workers = 1)
+		self.dropped_counter = metrics_registry.counter('api_log_dropped_records')
+		self.deduplicated_counter = metrics_registry.counter('api_log_deduplicated_stacks')
+
+	async def startup(self) -> None:
+		self._wakeup = asyncio.Event()
+		self._writer_task = asyncio.get_running_loop().create_task(self._write_batches())
+
+	async def shutdown(self) -> None:
+		if self._writer_task:
+			self._writer_task.cancel()
+			await asyncio.gather(self._writer_task, return_exceptions = True)
+			self._writer_task = None
+
+		while self._records:
+			await self._write_batch()
+		self._executor.shutdown(wait = True)
+
+	def log(self, level: str, event: str, **fields: Any) -> None:
+		if len(self._records) >= self.config.queue_size:
+			self.dropped_counter.inc(reason = 'queue_full')
+			return
+
+		self._records.append({
+			'ts': datetime.now(timezone.utc).isoformat(),
+			'level': level,
+			'event': event,
+			**fields,
+		})
+		if self._wakeup and len(self._records) >= self.config.batch_size:
+			self._wakeup.set()
+
+	def info(self, event: str, **fields: Any) -> None:
+		self.log('info', event, **fields)
+
+	def error(self, event: str, **fields: Any) -> None:
+		self.log('error', event, **fields)
+
+	def exception(self, event: str, ex: BaseException, **fields: Any) -> None:
+		stack_id = _stack_id(ex)
+		now = monotonic()
+		last_seen = self._stacks_seen.get(stack_id)
+		if last_seen is not None and now - last_seen < self.config.dedup_window_secs:
+			self.deduplicated_counter.inc()
+			self.error(event, error = repr(ex), stack_id = stack_id, **fields)
+			return
+
+		if len(self._stacks_seen) >= 1000:
+			self._stacks_seen = { k: t for k, t in self._stacks_seen.items() if now - t < self.config.dedup_window_secs }
+		self._stacks_seen[stack_id] = now
+
+		# source lines are looked up when the writer formats the record, off the event loop
+		stack = traceback.TracebackException(type(ex), ex, ex.__traceback__, lookup_lines = False)
+		self.error(event, error = repr(ex), stack_id = stack_id, stack = stack, **fields)
+
+	def access(self, method: str, path: str, status: int, duration_secs: float, **fields: Any) -> None:
+		if status < 500 and random.random() >= self.config.access_sample_rate:
+			self.dropped_counter.inc(reason = 'sampled')
+			return
+		self.info('request', method = method, path = path, status = status, duration_ms = round(duration_secs * 1000, 3), **fields)
+
+	async def _write_batch(self) -> None:
+		batch: List[Dict[str, Any]] = []
+		while self._records and len(batch) < self.config.batch_size:
+			batch.append(self._records.popleft())
+		if not batch:
+			return
+
+		def _write() -> None:
+			self.config.stream.write(''.join([ _encode_record(r) for r in batch ]))
+			self.config.stream.flush()
+
+		await asyncio.get_running_loop().run_in_executor(self._executor, _write)
+
+	async def _write_batches(self) -> None:
+		assert self._wakeup
+		while True:
+			try:
+				await asyncio.wait_for(self._wakeup.wait(), self.config.flush_interval_secs)
+			except asyncio.TimeoutError:
+				pass
+			self._wakeup.clear()
+
+			while self._records:
+				await self._write_batch()
+
+class AccessLogMiddleware:
+	def __init__(self, app: ASGIApp, logger: StructuredLogger, exempt_prefix: Union[str, Tuple[str, ...]]) -> None:
+		self.app = app
+		self.logger = logger
+		self.exempt_prefix = exempt_prefix
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+		if scope['type'] != 'http' or scope['path'].startswith(self.exempt_prefix):
+			await self.app(scope, receive, send)
+			return
+
+		# routing rewrites the scope's path for mounted apps, so grab it up front
+		method, path = scope['method'], scope['path']
+		status = 500
+		async def _send(message: Message) -> None:
+			nonlocal status
+			if message['type'] == 'http.response.start':
+				status = message['status']
+			await send(message)
+
+		start_time = perf_counter()
+		try:
+			await self.app(scope, receive, _send)
+		finally:
+			fields = {}
+			principal = scope.get('state', {}).get('principal')
+			if principal is not None:
+				fields['principal'] = principal.id
+			self.logger.access(method, path, status, perf_counter() - start_time, **fields)
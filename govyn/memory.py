@@ -0,0 +1,162 @@
+import tracemalloc
+from dataclasses import dataclass
+from typing import (Any, Collection, Coroutine, Dict, List, Optional, Tuple,
+                    TypeVar, Union, cast)
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .auth import privileged
+from .errors import ServiceUnavailable
+from .metrics import MetricsRegistry
+from .profiling import DEBUG_PRIVILEGE, _MeasuredCoroutine
+
+T = TypeVar('T')
+
+_BYTES_BUCKETS = [ 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216 ]
+
+@dataclass
+class MemoryConfig:
+	# frames kept per allocation; more makes heap diffs easier to attribute but tracing slower
+	traceback_frames: int
+	top_n: int
+
+def default_memory_config() -> MemoryConfig:
+	return MemoryConfig(
+		traceback_frames = 1,
+		top_n = 25,
+	)
+
+@dataclass
+class RouteMemoryStats:
+	path: str
+	calls: int
+	# memory still allocated at the end of each step the handler ran for, summed over every call;
+	# a route that keeps growing this without bound is a good leak suspect
+	net_allocated_bytes: int
+
+@dataclass
+class HeapStat:
+	location: str
+	size_bytes: int
+	size_diff_bytes: int
+	count: int
+	count_diff: int
+
+@dataclass
+class HeapDiff:
+	traced_bytes: int
+	peak_traced_bytes: int
+	# compared against the previous snapshot, or against nothing on the first call
+	top: List[HeapStat]
+
+def _traced_bytes() -> float:
+	return float(tracemalloc.get_traced_memory()[0])
+
+class MemoryTracker:
+	def __init__(self, config: MemoryConfig, metrics_registry: MetricsRegistry) -> None:
+		self.config = config
+		self.route_stats: Dict[str, RouteMemoryStats] = {}
+		self._baseline: Optional[tracemalloc.Snapshot] = None
+		self._started_tracing = False
+		self.allocated_histogram = metrics_registry.histogram('api_route_net_allocated_bytes', buckets = _BYTES_BUCKETS)
+		self.request_size_histogram = metrics_registry.histogram('api_request_body_bytes', buckets = _BYTES_BUCKETS)
+		self.response_size_histogram = metrics_registry.histogram('api_response_body_bytes', buckets = _BYTES_BUCKETS)
+
+	async def startup(self) -> None:
+		if not tracemalloc.is_tracing():
+			tracemalloc.start(self.config.traceback_frames)
+			self._started_tracing = True
+
+	async def shutdown(self) -> None:
+		if self._started_tracing:
+			tracemalloc.stop()
+			self._started_tracing = False
+		self._baseline = None
+
+	async def measure(self, path: str, coro: Coroutine[Any, Any, T]) -> T:
+		measured = _MeasuredCoroutine(coro, _traced_bytes)
+		try:
+			return cast(T, await measured)
+		finally:
+			net_bytes = int(measured.total)
+			stats = self.route_stats.get(path)
+			if stats is None:
+				stats = self.route_stats[path] = RouteMemoryStats(path, 0, 0)
+			stats.calls += 1
+			stats.net_allocated_bytes += net_bytes
+			self.allocated_histogram.observe(max(0, net_bytes), path = path)
+
+	def heap_diff(self) -> HeapDiff:
+		if not tracemalloc.is_tracing():
+			raise ServiceUnavailable('memory tracing is not running')
+
+		snapshot = tracemalloc.take_snapshot().filter_traces([
+			tracemalloc.Filter(False, tracemalloc.__file__),
+		])
+		if self._baseline is None:
+			top = [
+				HeapStat(str(s.traceback), s.size, s.size, s.count, s.count)
+				for s in snapshot.statistics('lineno')[:self.config.top_n]
+			]
+		else:
+			top = [
+				HeapStat(str(s.traceback), s.size, s.size_diff, s.count, s.count_diff)
+				for s in snapshot.compare_to(self._baseline, 'lineno')[:self.config.top_n]
+			]
+		self._baseline = snapshot
+
+		traced_bytes, peak_traced_bytes = tracemalloc.get_traced_memory()
+		return HeapDiff(traced_bytes, peak_traced_bytes, top)
+
+# path label for requests that didn't match a route, so scanners and typos can't add a series each
+UNMATCHED_PATH = 'unmatched'
+
+class PayloadSizeMiddleware:
+	def __init__(self, app: ASGIApp, memory_tracker: MemoryTracker, route_paths: Collection[str], exempt_prefix: Union[str, Tuple[str, ...]]) -> None:
+		self.app = app
+		self.memory_tracker = memory_tracker
+		self.route_paths = frozenset(route_paths)
+		self.exempt_prefix = exempt_prefix
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+		if scope['type'] != 'http' or scope['path'].startswith(self.exempt_prefix):
+			await self.app(scope, receive, send)
+			return
+
+		# routes have no path parameters, so a request either names one exactly or matched nothing
+		path = scope['path'] if scope['path'] in self.route_paths else UNMATCHED_PATH
+		request_bytes = 0
+		response_bytes = 0
+
+		async def _receive() -> Message:
+			nonlocal request_bytes
+			message = await receive()
+			if message['type'] == 'http.request':
+				request_bytes += len(message.get('body', b''))
+			return message
+
+		async def _send(message: Message) -> None:
+			nonlocal response_bytes
+			if message['type'] == 'http.response.body':
+				response_bytes += len(message.get('body', b''))
+			await send(message)
+
+		try:
+			await self.app(scope, _receive, _send)
+		finally:
+			self.memory_tracker.request_size_histogram.observe(request_bytes, path = path)
+			self.memory_tracker.response_size_histogram.observe(response_bytes, path = path)
+
+class MemoryDebugAPI:
+	def __init__(self, memory_tracker: MemoryTracker) -> None:
+		self.memory_tracker = memory_tracker
+
+	# top allocation sites, and how they changed since the last call
+	@privileged(DEBUG_PRIVILEGE)
+	async def get_heap(self) -> HeapDiff:
+		return self.memory_tracker.heap_diff()
+
+	# routes leaving the most memory behind first
+	@privileged(DEBUG_PRIVILEGE)
+	async def get_memory_routes(self) -> List[RouteMemoryStats]:
+		return sorted(self.memory_tracker.route_stats.values(), key = lambda s: s.net_allocated_bytes, reverse = True)
@@ -12,8 +12,10 @@ import aioprometheus
 Observation = Union[float, int]
 LabelValue = Union[str, int]
 
+# one of these is made for every timed request, so it's kept to a single slot
 @dataclass
 class LabelUpdater:
+	__slots__ = ( '_labels', )
 	_labels: Dict[str, LabelValue]
 
 	def update(self, **labels: LabelValue) -> None:
@@ -39,6 +41,9 @@ class Gauge:
 	def inc(self, **labels: LabelValue) -> None:
 		self._gauge.inc(labels)
 
+	def dec(self, **labels: LabelValue) -> None:
+		self._gauge.dec(labels)
+
 @dataclass
 class Histogram:
 	_histogram: aioprometheus.Histogram
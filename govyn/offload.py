@@ -0,0 +1,109 @@
+import asyncio
+import inspect
+import os
+import pickle
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from time import perf_counter
+from typing import Any, Callable, Dict, Optional
+
+from .auth import TFunc
+from .errors import GatewayTimeout
+from .metrics import MetricsRegistry
+
+_CPU_BOUND_ATTR = '_cpu_bound'
+
+@dataclass
+class OffloadSpec:
+	timeout_secs: Optional[float]
+
+def cpu_bound(timeout_secs: Optional[float] = None) -> Callable[[ TFunc ], TFunc]:
+	def _decorator(func: TFunc) -> TFunc:
+		setattr(func, _CPU_BOUND_ATTR, OffloadSpec(timeout_secs))
+		return func
+	return _decorator
+
+@dataclass
+class ProcessPoolConfig:
+	max_workers: Optional[int]
+	timeout_secs: Optional[float]
+
+def default_process_pool_config() -> ProcessPoolConfig:
+	return ProcessPoolConfig(
+		max_workers = None,
+		timeout_secs = 30.0,
+	)
+
+# both directions are pickled up front with the highest protocol, so the executor's own
+# (default protocol) pickling only ever has to copy a flat bytes object
+def _run_pickled(payload: bytes) -> bytes:
+	func, kwargs = pickle.loads(payload)
+	res = func(**kwargs)
+	if inspect.iscoroutine(res):
+		res = asyncio.run(res)
+	return pickle.dumps(res, protocol = pickle.HIGHEST_PROTOCOL)
+
+def _warmup() -> None:
+	pass
+
+class ProcessPool:
+	def __init__(self, config: ProcessPoolConfig, metrics_registry: MetricsRegistry) -> None:
+		self.config = config
+		self.max_workers = config.max_workers or os.cpu_count() or 1
+		self._executor: Optional[ProcessPoolExecutor] = None
+		# submitted tasks not yet finished, whether still queued for a worker or already running on one
+		self.in_flight_gauge = metrics_registry.gauge('api_process_pool_in_flight_tasks')
+		self.task_histogram = metrics_registry.histogram('api_process_pool_task_seconds')
+		self.timeout_counter = metrics_registry.counter('api_process_pool_timeouts')
+
+	def _ensure_executor(self) -> ProcessPoolExecutor:
+		if self._executor is None:
+			self._executor = ProcessPoolExecutor(max_workers = self.max_workers)
+		return self._executor
+
+	async def startup(self) -> None:
+		executor = self._ensure_executor()
+		loop = asyncio.get_running_loop()
+		# workers are spawned on demand, so keep them all busy at once to get every process up
+		await asyncio.gather(*[ loop.run_in_executor(executor, _warmup) for _ in range(self.max_workers) ])
+
+	async def shutdown(self) -> None:
+		if self._executor is None:
+			return
+
+		executor, self._executor = self._executor, None
+		loop = asyncio.get_running_loop()
+		await loop.run_in_executor(None, partial(executor.shutdown, wait = True))
+
+	def _task_done(self, path: str, start_time: float) -> None:
+		self.in_flight_gauge.dec()
+		self.task_histogram.observe(perf_counter() - start_time, path = path)
+
+	async def run(self, func: Callable[..., Any], kwargs: Dict[str, Any], path: str, timeout_secs: Optional[float] = None) -> Any:
+		payload = pickle.dumps((func, kwargs), protocol = pickle.HIGHEST_PROTOCOL)
+		timeout_secs = timeout_secs if timeout_secs is not None else self.config.timeout_secs
+
+		loop = asyncio.get_running_loop()
+		self.in_flight_gauge.inc()
+		start_time = perf_counter()
+		future = self._ensure_executor().submit(_run_pickled, payload)
+
+		# done callbacks fire on the executor's management thread, so hop back onto the loop
+		# before touching metrics; this also covers jobs that outlive a timed out request
+		def _done(_: 'Future[bytes]') -> None:
+			try:
+				loop.call_soon_threadsafe(self._task_done, path, start_time)
+			except RuntimeError:
+				# the loop has already been closed, nobody is left to report to
+				pass
+
+		future.add_done_callback(_done)
+
+		try:
+			res = await asyncio.wait_for(asyncio.wrap_future(future), timeout_secs)
+		except asyncio.TimeoutError:
+			self.timeout_counter.inc(path = path)
+			raise GatewayTimeout('handler did not complete in time')
+
+		return pickle.loads(res)
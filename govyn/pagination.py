@@ -0,0 +1,135 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+from dataclasses import dataclass
+from typing import (Any, AsyncIterator, Awaitable, Callable, Dict, Generic,
+                    List, Optional, TypeVar)
+
+from .auth import TFunc
+from .codecs import encode_json
+from .errors import BadRequest
+
+T = TypeVar('T')
+
+CURSOR_PARAM = 'cursor'
+LIMIT_PARAM = 'limit'
+STREAM_PARAM = 'all_pages'
+
+_PAGINATED_ATTR = '_pagination'
+
+@dataclass
+class Cursor:
+	# the position returned as Page.next_key by the previous page, None when fetching the first page
+	key: Optional[Any]
+	limit: int
+
+@dataclass
+class Page(Generic[T]):
+	items: List[T]
+	next_key: Optional[Any] = None
+
+@dataclass
+class PaginationSpec:
+	default_page_size: Optional[int]
+	max_page_size: Optional[int]
+	streamable: bool
+
+def paginated(
+		default_page_size: Optional[int] = None,
+		max_page_size: Optional[int] = None,
+		streamable: bool = False,
+	) -> Callable[[ TFunc ], TFunc]:
+	def _decorator(func: TFunc) -> TFunc:
+		setattr(func, _PAGINATED_ATTR, PaginationSpec(default_page_size, max_page_size, streamable))
+		return func
+	return _decorator
+
+def is_page_type(py_type: type) -> bool:
+	return getattr(py_type, '__origin__', None) is Page
+
+@dataclass
+class PaginationConfig:
+	# shared by every worker that might receive a follow-up request, or cursors won't verify
+	secret: bytes
+	default_page_size: int
+	max_page_size: int
+
+# where deployments put a secret shared by all their processes, so cursors survive restarts and
+# can be followed up on any worker
+PAGINATION_SECRET_ENV = 'GOVYN_PAGINATION_SECRET'
+
+def configured_pagination_secret() -> Optional[bytes]:
+	value = os.environ.get(PAGINATION_SECRET_ENV)
+	return value.encode('utf-8') if value else None
+
+def default_pagination_config() -> PaginationConfig:
+	return PaginationConfig(
+		# a random secret only verifies cursors within this process, and only until it restarts
+		secret = configured_pagination_secret() or secrets.token_bytes(32),
+		default_page_size = 50,
+		max_page_size = 500,
+	)
+
+def _b64encode(data: bytes) -> str:
+	return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+def _b64decode(data: str) -> bytes:
+	return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+class Paginator:
+	def __init__(self, config: PaginationConfig) -> None:
+		self.config = config
+
+	def _sign(self, payload: bytes) -> bytes:
+		return hmac.new(self.config.secret, payload, hashlib.sha256).digest()[:16]
+
+	# tokens are bound to the route they were issued by, so they can't be replayed elsewhere
+	def encode_cursor(self, path: str, key: Any) -> str:
+		payload = encode_json([ path, key ])
+		return f'{_b64encode(payload)}.{_b64encode(self._sign(payload))}'
+
+	def decode_cursor(self, path: str, token: str) -> Any:
+		try:
+			encoded_payload, encoded_sig = token.split('.')
+			payload = _b64decode(encoded_payload)
+			sig = _b64decode(encoded_sig)
+		except ValueError:
+			raise BadRequest(f'invalid value for field {CURSOR_PARAM}')
+
+		if not hmac.compare_digest(sig, self._sign(payload)):
+			raise BadRequest(f'invalid value for field {CURSOR_PARAM}')
+
+		token_path, key = json.loads(payload)
+		if token_path != path:
+			raise BadRequest(f'invalid value for field {CURSOR_PARAM}')
+		return key
+
+	def make_cursor(self, path: str, spec: PaginationSpec, token: Optional[str], limit: Optional[int]) -> Cursor:
+		max_page_size = spec.max_page_size or self.config.max_page_size
+		if limit is None:
+			limit = spec.default_page_size or self.config.default_page_size
+		elif limit < 1:
+			raise BadRequest(f'invalid value for field {LIMIT_PARAM}: must be at least 1')
+
+		key = self.decode_cursor(path, token) if token else None
+		return Cursor(key, min(limit, max_page_size))
+
+	def render_page(self, path: str, page: Page[Any]) -> Dict[str, Any]:
+		return {
+			'items': page.items,
+			'next_cursor': self.encode_cursor(path, page.next_key) if page.next_key is not None else None,
+		}
+
+	async def stream_all(self, first: Cursor, fetch_page: Callable[[ Cursor ], Awaitable[Page[Any]]]) -> AsyncIterator[bytes]:
+		cursor = first
+		while True:
+			page = await fetch_page(cursor)
+			if page.items:
+				yield b''.join([ encode_json(item) + b'\n' for item in page.items ])
+			if page.next_key is None:
+				return
+			# round-trip the key like a token would, so handlers see the same types either way
+			cursor = Cursor(json.loads(encode_json(page.next_key)), cursor.limit)
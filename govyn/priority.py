@@ -0,0 +1,194 @@
+import asyncio
+import math
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from time import perf_counter
+from typing import AsyncIterator, Callable, Deque, Dict, Optional
+
+from .auth import Principal, TFunc
+from .deadline import Deadline
+from .errors import GatewayTimeout, ServiceUnavailable
+from .metrics import MetricsRegistry
+
+_PRIORITY_ATTR = '_priority'
+
+# runs the route in the given priority class, whoever calls it
+def priority(class_name: str) -> Callable[[ TFunc ], TFunc]:
+	def _decorator(func: TFunc) -> TFunc:
+		setattr(func, _PRIORITY_ATTR, class_name)
+		return func
+	return _decorator
+
+@dataclass
+class PriorityConfig:
+	# handlers allowed to run at once; requests past this wait in their class's queue
+	max_concurrent: int
+	# priority classes, highest first, each with its share of the free slots while several are waiting
+	weights: Dict[str, int]
+	# principals holding one of these privileges run in the class it maps to, the highest if several match
+	privilege_classes: Dict[str, str]
+	default_class: str
+	# once this many requests are waiting, the newest of the lowest class waiting is shed to make room
+	max_queued: int
+	max_wait_secs: Optional[float]
+
+def default_priority_config() -> PriorityConfig:
+	return PriorityConfig(
+		max_concurrent = 100,
+		weights = { 'high': 8, 'default': 4, 'low': 1 },
+		privilege_classes = {},
+		default_class = 'default',
+		max_queued = 1000,
+		max_wait_secs = 10.0,
+	)
+
+class PriorityScheduler:
+	def __init__(self, config: PriorityConfig, metrics_registry: MetricsRegistry) -> None:
+		for class_name in [ config.default_class, *config.privilege_classes.values() ]:
+			self.check_class(class_name, config)
+
+		self.config = config
+		self.classes = list(config.weights)
+		self._rank = { name: i for i, name in enumerate(self.classes) }
+		self._queues: Dict[str, Deque['asyncio.Future[None]']] = { name: deque() for name in self.classes }
+		self._credit = { name: 0 for name in self.classes }
+		self.running = 0
+		self.queued = 0
+		self.queue_depth_gauge = metrics_registry.gauge('api_priority_queue_depth')
+		self.wait_histogram = metrics_registry.histogram('api_priority_wait_seconds')
+		self.shed_counter = metrics_registry.counter('api_priority_shed_requests')
+		self.running_gauge = metrics_registry.gauge('api_priority_running')
+
+	@staticmethod
+	def check_class(class_name: str, config: PriorityConfig) -> None:
+		if class_name not in config.weights:
+			raise Exception(f'unknown priority class {class_name}')
+
+	def class_for(self, route_class: Optional[str], principal: Optional[Principal]) -> str:
+		if route_class is not None:
+			return route_class
+		if principal:
+			matches = [ self.config.privilege_classes[p] for p in principal.privileges if p in self.config.privilege_classes ]
+			if matches:
+				return min(matches, key = self._rank.__getitem__)
+		return self.config.default_class
+
+	def _report(self, class_name: str) -> None:
+		self.queue_depth_gauge.set(len(self._queues[class_name]), **{ 'class': class_name })
+		self.running_gauge.set(self.running)
+
+	# smooth weighted round robin over the classes with anyone waiting, so a busy high class gets
+	# most of the slots without starving the rest outright
+	def _next_class(self) -> Optional[str]:
+		waiting = [ c for c in self.classes if self._queues[c] ]
+		if not waiting:
+			return None
+		total = 0
+		for c in waiting:
+			self._credit[c] += self.config.weights[c]
+			total += self.config.weights[c]
+		chosen = max(waiting, key = lambda c: (self._credit[c], -self._rank[c]))
+		self._credit[chosen] -= total
+		return chosen
+
+	def _dequeue(self, class_name: str, future: 'asyncio.Future[None]') -> None:
+		queue = self._queues[class_name]
+		if future in queue:
+			queue.remove(future)
+			self.queued -= 1
+			if not queue:
+				self._credit[class_name] = 0
+			self._report(class_name)
+
+	def _make_room(self, class_name: str) -> None:
+		rank = self._rank[class_name]
+		for victim_class in reversed(self.classes):
+			if self._rank[victim_class] <= rank:
+				break
+			queue = self._queues[victim_class]
+			while queue:
+				# the newest has waited the least, so it loses the least by being turned away
+				victim = queue.pop()
+				self.queued -= 1
+				self._report(victim_class)
+				if not victim.done():
+					victim.set_exception(ServiceUnavailable('server is overloaded'))
+					self.shed_counter.inc(**{ 'class': victim_class, 'reason': 'displaced' })
+					return
+
+		self.shed_counter.inc(**{ 'class': class_name, 'reason': 'queue_full' })
+		raise ServiceUnavailable('server is overloaded')
+
+	async def _acquire(self, class_name: str, deadline: Optional[Deadline]) -> None:
+		# with nobody waiting there's nobody to be fair to, so admission is just a counter
+		if self.running < self.config.max_concurrent and self.queued == 0:
+			self.running += 1
+			self.running_gauge.set(self.running)
+			self.wait_histogram.observe(0.0, **{ 'class': class_name })
+			return
+
+		# time spent queued comes out of the request's deadline too, and one that's already gone isn't worth queueing
+		max_wait = self.config.max_wait_secs if self.config.max_wait_secs is not None else math.inf
+		remaining = deadline.remaining() if deadline is not None else math.inf
+		deadline_bound = remaining < max_wait
+		if deadline_bound:
+			max_wait = remaining
+			if max_wait <= 0:
+				self.shed_counter.inc(**{ 'class': class_name, 'reason': 'deadline' })
+				raise GatewayTimeout('request deadline exceeded')
+
+		if self.queued >= self.config.max_queued:
+			self._make_room(class_name)
+
+		future: 'asyncio.Future[None]' = asyncio.get_running_loop().create_future()
+		self._queues[class_name].append(future)
+		self.queued += 1
+		self._report(class_name)
+
+		start_time = perf_counter()
+		try:
+			await asyncio.wait_for(future, max_wait if max_wait != math.inf else None)
+		except asyncio.TimeoutError:
+			# the slot can be handed over in the same iteration the wait times out, and is passed on like a cancellation's
+			if future.done() and not future.cancelled() and future.exception() is None:
+				self._release()
+			else:
+				self._dequeue(class_name, future)
+			# running out of the request's own time is a timeout like any other, not a sign of overload
+			if deadline_bound:
+				self.shed_counter.inc(**{ 'class': class_name, 'reason': 'deadline' })
+				raise GatewayTimeout('request deadline exceeded')
+			self.shed_counter.inc(**{ 'class': class_name, 'reason': 'timeout' })
+			raise ServiceUnavailable('server is overloaded')
+		except asyncio.CancelledError:
+			# a slot handed over just as the request was cancelled has to be passed on
+			if future.done() and not future.cancelled() and future.exception() is None:
+				self._release()
+			else:
+				self._dequeue(class_name, future)
+			raise
+		self.wait_histogram.observe(perf_counter() - start_time, **{ 'class': class_name })
+
+	def _release(self) -> None:
+		while (class_name := self._next_class()) is not None:
+			future = self._queues[class_name].popleft()
+			self.queued -= 1
+			if not self._queues[class_name]:
+				self._credit[class_name] = 0
+			self._report(class_name)
+			if not future.done():
+				# the slot goes straight to the waiter, so running stays the same
+				future.set_result(None)
+				return
+
+		self.running -= 1
+		self.running_gauge.set(self.running)
+
+	@asynccontextmanager
+	async def admit(self, class_name: str, deadline: Optional[Deadline] = None) -> AsyncIterator[None]:
+		await self._acquire(class_name, deadline)
+		try:
+			yield
+		finally:
+			self._release()
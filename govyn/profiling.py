@@ -0,0 +1,168 @@
+import asyncio
+import sys
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from time import perf_counter, sleep, thread_time
+from types import FrameType
+from typing import (Any, Callable, Coroutine, Dict, Generator, List,
+                    Optional, TypeVar, cast)
+
+from .auth import privileged
+from .errors import Conflict
+from .metrics import MetricsRegistry
+
+T = TypeVar('T')
+
+DEBUG_PRIVILEGE = 'debug'
+
+@dataclass
+class ProfilingConfig:
+	# track CPU and wall time per route, at the cost of a thread_time() call per coroutine step, so off unless asked for
+	route_cpu_stats: bool
+	sample_interval_secs: float
+	max_profile_secs: float
+
+def default_profiling_config() -> ProfilingConfig:
+	return ProfilingConfig(
+		route_cpu_stats = False,
+		sample_interval_secs = 0.01,
+		max_profile_secs = 30.0,
+	)
+
+@dataclass
+class RouteStats:
+	path: str
+	calls: int
+	cpu_secs: float
+	wall_secs: float
+
+@dataclass
+class Profile:
+	duration_secs: float
+	samples: int
+	# one `frame;frame;frame count` line per distinct stack, ready for flamegraph.pl or speedscope
+	collapsed: str
+
+class _MeasuredCoroutine:
+	# drives the wrapped coroutine one step at a time, so only what happens while it's actually running
+	# is counted, not what other requests do on the loop while it's suspended
+	def __init__(self, coro: Coroutine[Any, Any, Any], measure: Callable[[], float]) -> None:
+		self._coro = coro
+		self._measure = measure
+		self.total = 0.0
+
+	def __await__(self) -> Generator[Any, Any, Any]:
+		coro = self._coro
+		measure = self._measure
+		value: Any = None
+		error: Optional[BaseException] = None
+		while True:
+			start = measure()
+			try:
+				if error is not None:
+					yielded = coro.throw(error)
+				else:
+					yielded = coro.send(value)
+			except StopIteration as ex:
+				return ex.value
+			finally:
+				self.total += measure() - start
+
+			try:
+				value = yield yielded
+				error = None
+			except GeneratorExit:
+				coro.close()
+				raise
+			except BaseException as ex:
+				value = None
+				error = ex
+
+def _frame_name(frame: FrameType) -> str:
+	code = frame.f_code
+	return f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})'
+
+def _collapse(frame: Optional[FrameType]) -> str:
+	names = []
+	while frame is not None:
+		names.append(_frame_name(frame))
+		frame = frame.f_back
+	return ';'.join(reversed(names))
+
+def sample_stacks(duration_secs: float, interval_secs: float, thread_ids: Optional[List[int]] = None) -> 'Counter[str]':
+	stacks: 'Counter[str]' = Counter()
+	sampler_id = threading.get_ident()
+	end_time = perf_counter() + duration_secs
+	while perf_counter() < end_time:
+		for thread_id, frame in sys._current_frames().items():
+			if thread_id == sampler_id or (thread_ids is not None and thread_id not in thread_ids):
+				continue
+			stacks[_collapse(frame)] += 1
+		sleep(interval_secs)
+	return stacks
+
+class Profiler:
+	def __init__(self, config: ProfilingConfig, metrics_registry: MetricsRegistry) -> None:
+		self.config = config
+		self.route_stats: Dict[str, RouteStats] = {}
+		self._executor = ThreadPoolExecutor(max_workers = 1)
+		self._profiling = False
+		self.cpu_histogram = metrics_registry.histogram('api_route_cpu_seconds')
+
+	async def shutdown(self) -> None:
+		self._executor.shutdown(wait = False)
+
+	async def measure(self, path: str, coro: Coroutine[Any, Any, T]) -> T:
+		if not self.config.route_cpu_stats:
+			return await coro
+
+		timed = _MeasuredCoroutine(coro, thread_time)
+		start_time = perf_counter()
+		try:
+			return cast(T, await timed)
+		finally:
+			wall_secs = perf_counter() - start_time
+			stats = self.route_stats.get(path)
+			if stats is None:
+				stats = self.route_stats[path] = RouteStats(path, 0, 0.0, 0.0)
+			stats.calls += 1
+			stats.cpu_secs += timed.total
+			stats.wall_secs += wall_secs
+			self.cpu_histogram.observe(timed.total, path = path)
+
+	async def profile(self, duration_secs: float, all_threads: bool) -> Profile:
+		if self._profiling:
+			raise Conflict('a profile is already running')
+
+		duration_secs = max(0.0, min(duration_secs, self.config.max_profile_secs))
+		# by default only the event loop's thread is sampled, which is where request handling happens
+		thread_ids = None if all_threads else [ threading.get_ident() ]
+		self._profiling = True
+		try:
+			stacks = await asyncio.get_running_loop().run_in_executor(
+				self._executor, sample_stacks, duration_secs, self.config.sample_interval_secs, thread_ids,
+			)
+		finally:
+			self._profiling = False
+
+		return Profile(
+			duration_secs = duration_secs,
+			samples = sum(stacks.values()),
+			collapsed = ''.join([ f'{stack} {count}\n' for stack, count in stacks.most_common() ]),
+		)
+
+class DebugAPI:
+	def __init__(self, profiler: Profiler) -> None:
+		self.profiler = profiler
+
+	# samples stacks for the given number of seconds, blocking only this request while it runs
+	@privileged(DEBUG_PRIVILEGE)
+	async def get_profile(self, seconds: Optional[float], all_threads: Optional[bool]) -> Profile:
+		return await self.profiler.profile(5.0 if seconds is None else seconds, bool(all_threads))
+
+	# busiest routes first
+	@privileged(DEBUG_PRIVILEGE)
+	async def get_routes(self) -> List[RouteStats]:
+		return sorted(self.profiler.route_stats.values(), key = lambda s: s.cpu_secs, reverse = True)
@@ -0,0 +1,156 @@
+from dataclasses import MISSING, fields, is_dataclass
+from datetime import date, datetime
+from enum import EnumMeta
+from functools import lru_cache
+from typing import (Any, Callable, Dict, Literal, Mapping, Set, Tuple, Union,
+                    get_type_hints)
+
+# requests and responses can be dataclasses (slotted or not), NamedTuples or TypedDicts, which
+# between them cover everything from convenient to compact
+
+def is_namedtuple_type(py_type: Any) -> bool:
+	return isinstance(py_type, type) and issubclass(py_type, tuple) and hasattr(py_type, '_fields')
+
+def is_typeddict_type(py_type: Any) -> bool:
+	return isinstance(py_type, type) and issubclass(py_type, dict) and hasattr(py_type, '__total__')
+
+def is_record_type(py_type: Any) -> bool:
+	return (isinstance(py_type, type) and is_dataclass(py_type)) or is_namedtuple_type(py_type) or is_typeddict_type(py_type)
+
+@lru_cache(maxsize = None)
+def record_fields(record_type: type) -> Dict[str, Any]:
+	try:
+		hints = get_type_hints(record_type)
+	except NameError:
+		# forward references to classes defined inside a function can't be resolved, so fall back to what was written
+		hints = dict(getattr(record_type, '__annotations__', {}))
+	if is_dataclass(record_type):
+		return { f.name: hints.get(f.name, f.type) for f in fields(record_type) if f.init }
+	if is_namedtuple_type(record_type):
+		# plain collections.namedtuple classes have fields but no annotations
+		return { name: hints.get(name, Any) for name in getattr(record_type, '_fields') }
+	return hints
+
+@lru_cache(maxsize = None)
+def required_fields(record_type: type) -> Set[str]:
+	if is_dataclass(record_type):
+		return { f.name for f in fields(record_type) if f.init and f.default is MISSING and f.default_factory is MISSING }
+	if is_namedtuple_type(record_type):
+		return set(record_fields(record_type)) - set(getattr(record_type, '_field_defaults'))
+	required_keys = getattr(record_type, '__required_keys__', None)
+	if required_keys is not None:
+		return set(required_keys)
+	return set(record_fields(record_type)) if getattr(record_type, '__total__') else set()
+
+def _contains(py_type: Any, predicate: Callable[[ Any ], bool], seen: Set[Any]) -> bool:
+	if predicate(py_type):
+		return True
+	# records can refer back to themselves, and Literal arguments are values rather than types
+	if py_type in seen or getattr(py_type, '__origin__', None) is Literal:
+		return False
+	seen.add(py_type)
+	if is_record_type(py_type):
+		return any(_contains(t, predicate, seen) for t in record_fields(py_type).values())
+	return any(_contains(t, predicate, seen) for t in getattr(py_type, '__args__', ()))
+
+# JSON and msgpack write tuples as arrays, so responses containing NamedTuples need converting first
+@lru_cache(maxsize = None)
+def contains_namedtuple(py_type: Any) -> bool:
+	return _contains(py_type, is_namedtuple_type, set())
+
+# dacite only builds dataclasses, so anything with a NamedTuple or TypedDict in it is decoded here instead
+@lru_cache(maxsize = None)
+def needs_record_decoder(py_type: Any) -> bool:
+	return _contains(py_type, lambda t: is_namedtuple_type(t) or is_typeddict_type(t), set())
+
+def _type_name(py_type: Any) -> str:
+	return getattr(py_type, '__name__', None) or str(py_type).replace('typing.', '')
+
+def _wrong_type(path: str, py_type: Any, raw: Any) -> ValueError:
+	return ValueError(f'wrong value type for field "{path}" - should be "{_type_name(py_type)}" instead of value "{raw}" of type "{type(raw).__name__}"')
+
+def _decode_record(record_type: type, raw: Any, path: str) -> Any:
+	if not isinstance(raw, Mapping):
+		raise _wrong_type(path or record_type.__name__, record_type, raw)
+
+	required = required_fields(record_type)
+	values: Dict[str, Any] = {}
+	for name, field_type in record_fields(record_type).items():
+		field_path = f'{path}.{name}' if path else name
+		if name in raw:
+			values[name] = decode_value(field_type, raw[name], field_path)
+		elif name in required:
+			raise ValueError(f'missing value for field "{field_path}"')
+
+	# TypedDicts are just dicts at runtime, so there's nothing to construct
+	return values if is_typeddict_type(record_type) else record_type(**values)
+
+def decode_value(py_type: Any, raw: Any, path: str = '') -> Any:
+	if py_type is Any:
+		return raw
+
+	origin = getattr(py_type, '__origin__', None)
+	generic_types: Tuple[Any, ...] = getattr(py_type, '__args__', ())
+	if origin is Union:
+		if raw is None and type(None) in generic_types:
+			return None
+		for option in generic_types:
+			try:
+				return decode_value(option, raw, path)
+			except ValueError:
+				pass
+		raise _wrong_type(path, py_type, raw)
+	if origin is Literal:
+		if raw not in generic_types:
+			raise _wrong_type(path, py_type, raw)
+		return raw
+	if origin is list:
+		if not isinstance(raw, list):
+			raise _wrong_type(path, py_type, raw)
+		return [ decode_value(generic_types[0], v, f'{path}[{i}]') for i, v in enumerate(raw) ]
+	if origin is dict:
+		if not isinstance(raw, Mapping):
+			raise _wrong_type(path, py_type, raw)
+		return { k: decode_value(generic_types[1], v, f'{path}.{k}') for k, v in raw.items() }
+	if origin is tuple:
+		# tuples arrive as arrays, either of any length for Tuple[T, ...] or matching the types one for one
+		if not isinstance(raw, (list, tuple)):
+			raise _wrong_type(path, py_type, raw)
+		if len(generic_types) == 2 and generic_types[1] is Ellipsis:
+			return tuple(decode_value(generic_types[0], v, f'{path}[{i}]') for i, v in enumerate(raw))
+		# Tuple[()] is the only way to spell an empty tuple, and some versions give it an empty tuple as its one argument
+		item_types = [ t for t in generic_types if t != () ]
+		if len(raw) != len(item_types):
+			raise _wrong_type(path, py_type, raw)
+		return tuple(decode_value(t, v, f'{path}[{i}]') for i, (t, v) in enumerate(zip(item_types, raw)))
+	if origin in (set, frozenset):
+		if not isinstance(raw, (list, tuple)):
+			raise _wrong_type(path, py_type, raw)
+		items = [ decode_value(generic_types[0], v, f'{path}[{i}]') for i, v in enumerate(raw) ]
+		try:
+			return origin(items)
+		except TypeError:
+			# e.g. a set of dataclasses that aren't frozen, so can't be hashed
+			raise _wrong_type(path, py_type, raw)
+
+	if is_record_type(py_type):
+		return _decode_record(py_type, raw, path)
+	if isinstance(py_type, EnumMeta):
+		try:
+			return py_type(raw)
+		except ValueError:
+			raise _wrong_type(path, py_type, raw)
+	if py_type in (datetime, date):
+		if not isinstance(raw, str):
+			raise ValueError(f'{raw} is an invalid value for {py_type.__name__} type field. Must be a valid {py_type.__name__} string')
+		return py_type.fromisoformat(raw)
+	# bool is a subclass of int, but true and false aren't numbers as far as a request is concerned
+	if py_type in (int, float) and isinstance(raw, bool):
+		raise _wrong_type(path, py_type, raw)
+	if py_type is float and isinstance(raw, int):
+		return float(raw)
+	if not isinstance(py_type, type):
+		raise ValueError(f'unsupported type "{_type_name(py_type)}" for field "{path}"')
+	if not isinstance(raw, py_type):
+		raise _wrong_type(path, py_type, raw)
+	return raw
@@ -0,0 +1,232 @@
+import argparse
+import asyncio
+import hashlib
+import importlib
+import json
+import sys
+from dataclasses import asdict, dataclass, field
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from starlette.types import ASGIApp
+
+from .asgi import ASGILifespan, asgi_request
+from .capture import CapturedRequest, read_capture
+
+# sends one captured request, returning the status and the response body
+Sender = Callable[[ CapturedRequest, Dict[str, str] ], Awaitable[Tuple[int, bytes]]]
+
+@dataclass
+class RouteReport:
+	path: str
+	requests: int
+	server_errors: int
+	# how many responses no longer match what was captured
+	status_changed: int
+	body_changed: int
+	latency_p50_ms: float
+	latency_p90_ms: float
+	latency_p99_ms: float
+	latency_max_ms: float
+	# latency of the same requests when they were captured, for comparison
+	captured_p50_ms: float
+	captured_p99_ms: float
+
+@dataclass
+class ReplayReport:
+	requests: int
+	duration_secs: float
+	requests_per_sec: float
+	routes: List[RouteReport] = field(default_factory = list)
+
+def _percentile(sorted_values: Sequence[float], fraction: float) -> float:
+	if not sorted_values:
+		return 0.0
+	index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+	return sorted_values[index]
+
+def _ms(secs: float) -> float:
+	return round(secs * 1000, 3)
+
+@dataclass
+class _Result:
+	record: CapturedRequest
+	status: int
+	digest: str
+	latency_secs: float
+
+class _ASGISender:
+	def __init__(self, app: ASGIApp) -> None:
+		self.app = app
+		self.lifespan = ASGILifespan(app)
+
+	async def startup(self) -> None:
+		await self.lifespan.startup()
+
+	async def shutdown(self) -> None:
+		await self.lifespan.shutdown()
+
+	async def __call__(self, record: CapturedRequest, extra_headers: Dict[str, str]) -> Tuple[int, bytes]:
+		return await asgi_request(self.app, record.method, record.path, record.query, { **record.headers, **extra_headers }, record.body_bytes())
+
+class _HTTPSender:
+	def __init__(self, base_url: str) -> None:
+		self.base_url = base_url.rstrip('/')
+		self._session: Any = None
+
+	async def startup(self) -> None:
+		# aiohttp is already installed alongside aioprometheus
+		import aiohttp
+		self._session = aiohttp.ClientSession()
+
+	async def shutdown(self) -> None:
+		if self._session:
+			await self._session.close()
+
+	async def __call__(self, record: CapturedRequest, extra_headers: Dict[str, str]) -> Tuple[int, bytes]:
+		url = self.base_url + record.path + (f'?{record.query}' if record.query else '')
+		async with self._session.request(
+			record.method, url,
+			data = record.body_bytes(),
+			headers = { **record.headers, **extra_headers },
+		) as res:
+			return res.status, await res.read()
+
+async def _replay(
+		records: Sequence[CapturedRequest],
+		send: Sender,
+		speed: float,
+		concurrency: int,
+		extra_headers: Dict[str, str],
+		principal_headers: Dict[str, Dict[str, str]],
+	) -> ReplayReport:
+	loop = asyncio.get_running_loop()
+	slots = asyncio.Semaphore(concurrency)
+	results: List[_Result] = []
+	first_time = records[0].time if records else 0.0
+
+	async def run_one(record: CapturedRequest) -> None:
+		async with slots:
+			start_time = perf_counter()
+			try:
+				headers = { **extra_headers, **principal_headers.get(record.principal, {}) } if record.principal else extra_headers
+				status, body = await send(record, headers)
+			except Exception:
+				status, body = 599, b''
+			latency = perf_counter() - start_time
+		results.append(_Result(record, status, hashlib.blake2b(body, digest_size = 16).hexdigest(), latency))
+
+	# requests are started on the captured schedule whether or not earlier ones have finished,
+	# so a slower build shows up as growing latency rather than a quietly lower request rate
+	start = loop.time()
+	tasks = []
+	for record in records:
+		if speed > 0:
+			delay = (record.time - first_time) / speed - (loop.time() - start)
+			if delay > 0:
+				await asyncio.sleep(delay)
+		tasks.append(asyncio.ensure_future(run_one(record)))
+	await asyncio.gather(*tasks)
+	duration = loop.time() - start
+
+	by_path: Dict[str, List[_Result]] = {}
+	for result in results:
+		by_path.setdefault(result.record.path, []).append(result)
+
+	routes = []
+	for path, path_results in sorted(by_path.items()):
+		latencies = sorted([ r.latency_secs for r in path_results ])
+		captured = sorted([ r.record.duration_secs for r in path_results ])
+		routes.append(RouteReport(
+			path = path,
+			requests = len(path_results),
+			server_errors = sum(1 for r in path_results if r.status >= 500),
+			status_changed = sum(1 for r in path_results if r.status != r.record.status),
+			body_changed = sum(1 for r in path_results if r.status == r.record.status and r.digest != r.record.response_digest),
+			latency_p50_ms = _ms(_percentile(latencies, 0.5)),
+			latency_p90_ms = _ms(_percentile(latencies, 0.9)),
+			latency_p99_ms = _ms(_percentile(latencies, 0.99)),
+			latency_max_ms = _ms(latencies[-1]),
+			captured_p50_ms = _ms(_percentile(captured, 0.5)),
+			captured_p99_ms = _ms(_percentile(captured, 0.99)),
+		))
+
+	return ReplayReport(
+		requests = len(results),
+		duration_secs = round(duration, 3),
+		requests_per_sec = round(len(results) / duration, 1) if duration > 0 else 0.0,
+		routes = routes,
+	)
+
+# plays captured traffic against an app in this process, or against a running server when given a URL.
+# a speed of 1 keeps the captured spacing between requests, 2 halves it, and 0 sends everything at once.
+# credentials are never captured, so requests go out as whoever extra_headers authenticates, except
+# those whose captured principal id has its own headers in principal_headers
+async def replay(
+		records: Sequence[CapturedRequest],
+		target: Any,
+		speed: float = 1.0,
+		concurrency: int = 100,
+		extra_headers: Dict[str, str] = {},
+		principal_headers: Dict[str, Dict[str, str]] = {},
+	) -> ReplayReport:
+	sender = _HTTPSender(target) if isinstance(target, str) else _ASGISender(target)
+	await sender.startup()
+	try:
+		return await _replay(sorted(records, key = lambda r: r.time), sender, speed, concurrency, extra_headers, principal_headers)
+	finally:
+		await sender.shutdown()
+
+def format_report(report: ReplayReport) -> str:
+	columns = [ 'path', 'requests', '5xx', 'status diff', 'body diff', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms', 'captured p50', 'captured p99' ]
+	rows = [ columns ] + [
+		[ r.path, str(r.requests), str(r.server_errors), str(r.status_changed), str(r.body_changed),
+			str(r.latency_p50_ms), str(r.latency_p90_ms), str(r.latency_p99_ms), str(r.latency_max_ms),
+			str(r.captured_p50_ms), str(r.captured_p99_ms) ]
+		for r in report.routes
+	]
+	widths = [ max(len(row[i]) for row in rows) for i in range(len(columns)) ]
+	lines = [ '  '.join(cell.ljust(widths[i]) for i, cell in enumerate(row)).rstrip() for row in rows ]
+	lines.append('')
+	lines.append(f'{report.requests} requests in {report.duration_secs}s ({report.requests_per_sec} req/s)')
+	return '\n'.join(lines)
+
+def _load_app(spec: str, factory: bool) -> Any:
+	module_name, _, attr = spec.partition(':')
+	target = getattr(importlib.import_module(module_name), attr or 'app')
+	return target() if factory else target
+
+def main(argv: Optional[List[str]] = None) -> int:
+	parser = argparse.ArgumentParser(prog = 'govyn-replay', description = 'replay captured govyn traffic and report latency and result changes')
+	parser.add_argument('capture', help = 'capture file written by CaptureConfig')
+	target = parser.add_mutually_exclusive_group(required = True)
+	target.add_argument('--app', help = 'module:attribute of an ASGI app to run in-process')
+	target.add_argument('--url', help = 'base URL of a running server')
+	parser.add_argument('--factory', action = 'store_true', help = 'call the --app attribute to build the app')
+	parser.add_argument('--speed', type = float, default = 1.0, help = 'multiple of the captured request rate; 0 sends everything at once')
+	parser.add_argument('--concurrency', type = int, default = 100)
+	parser.add_argument('--header', action = 'append', default = [], help = 'extra header for every request, e.g. for auth: "Name: value"')
+	parser.add_argument('--principal-header', action = 'append', default = [], help = 'header for requests captured from one principal, overriding --header: "id=Name: value"')
+	parser.add_argument('--json', action = 'store_true', help = 'print the report as JSON')
+	args = parser.parse_args(argv)
+
+	extra_headers: Dict[str, str] = {}
+	for header in args.header:
+		name, _, value = header.partition(':')
+		extra_headers[name.strip()] = value.strip()
+
+	principal_headers: Dict[str, Dict[str, str]] = {}
+	for principal_header in args.principal_header:
+		principal_id, _, header = principal_header.partition('=')
+		name, _, value = header.partition(':')
+		principal_headers.setdefault(principal_id.strip(), {})[name.strip()] = value.strip()
+
+	records = list(read_capture(args.capture))
+	app_or_url = args.url if args.url else _load_app(args.app, args.factory)
+	report = asyncio.run(replay(records, app_or_url, args.speed, args.concurrency, extra_headers, principal_headers))
+
+	print(json.dumps(asdict(report), indent = 2) if args.json else format_report(report))
+	return 1 if any(r.server_errors or r.status_changed for r in report.routes) else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,211 @@
+import asyncio
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from time import perf_counter
+from typing import (Any, AsyncContextManager, AsyncIterator, Awaitable,
+                    Callable, Dict, Generic, List, Optional, TypeVar)
+
+from .errors import ServiceUnavailable
+from .metrics import MetricsRegistry
+
+T = TypeVar('T')
+
+ResourceFactory = Callable[[], Awaitable[T]]
+ResourceCloser = Callable[[ T ], Awaitable[None]]
+
+class _PoolMetrics:
+	def __init__(self, metrics_registry: MetricsRegistry) -> None:
+		self.size_gauge = metrics_registry.gauge('api_resource_pool_size')
+		self.in_use_gauge = metrics_registry.gauge('api_resource_pool_in_use')
+		self.wait_histogram = metrics_registry.histogram('api_resource_pool_wait_seconds')
+		self.checkout_histogram = metrics_registry.histogram('api_resource_checkout_seconds')
+		self.hold_histogram = metrics_registry.histogram('api_resource_hold_seconds')
+
+class Resource(ABC, Generic[T]):
+	def __init__(self, name: str) -> None:
+		self.name = name
+		self._metrics: Optional[_PoolMetrics] = None
+
+	@abstractmethod
+	async def startup(self) -> None:
+		...
+
+	@abstractmethod
+	async def shutdown(self) -> None:
+		...
+
+	@abstractmethod
+	def checkout(self) -> AsyncContextManager[T]:
+		...
+
+class SharedResource(Resource[T]):
+	def __init__(self, name: str, factory: ResourceFactory[T], close: Optional[ResourceCloser[T]] = None) -> None:
+		super().__init__(name)
+		self.factory = factory
+		self.close = close
+		self._value: Optional[T] = None
+
+	async def startup(self) -> None:
+		self._value = await self.factory()
+
+	async def shutdown(self) -> None:
+		if self._value is not None and self.close:
+			await self.close(self._value)
+		self._value = None
+
+	@asynccontextmanager
+	async def checkout(self) -> AsyncIterator[T]:
+		if self._value is None:
+			raise ServiceUnavailable(f'resource {self.name} is not available')
+		yield self._value
+
+class ResourcePool(Resource[T]):
+	def __init__(
+			self,
+			name: str,
+			factory: ResourceFactory[T],
+			close: Optional[ResourceCloser[T]] = None,
+			min_size: int = 0,
+			max_size: int = 10,
+			acquire_timeout_secs: Optional[float] = None,
+		) -> None:
+		super().__init__(name)
+		self.factory = factory
+		self.close = close
+		self.min_size = min_size
+		self.max_size = max_size
+		self.acquire_timeout_secs = acquire_timeout_secs
+		self.size = 0
+		self.in_use = 0
+		self._idle: List[T] = []
+		self._slots: Optional[asyncio.Semaphore] = None
+		self._closed = False
+
+	def _report(self) -> None:
+		if self._metrics:
+			self._metrics.size_gauge.set(self.size, resource = self.name)
+			self._metrics.in_use_gauge.set(self.in_use, resource = self.name)
+
+	def _ensure_slots(self) -> asyncio.Semaphore:
+		if self._slots is None:
+			self._slots = asyncio.Semaphore(self.max_size)
+		return self._slots
+
+	async def startup(self) -> None:
+		self._closed = False
+		self._ensure_slots()
+		new_items = await asyncio.gather(*[ self.factory() for _ in range(self.min_size) ])
+		self._idle.extend(new_items)
+		self.size += len(new_items)
+		self._report()
+
+	async def shutdown(self) -> None:
+		self._closed = True
+		idle, self._idle = self._idle, []
+		self.size -= len(idle)
+		if self.close:
+			await asyncio.gather(*[ self.close(item) for item in idle ])
+		self._report()
+
+	async def acquire(self) -> T:
+		slots = self._ensure_slots()
+		start_time = perf_counter()
+		try:
+			await asyncio.wait_for(slots.acquire(), self.acquire_timeout_secs)
+		except asyncio.TimeoutError:
+			raise ServiceUnavailable(f'timed out waiting for resource {self.name}')
+
+		if self._metrics:
+			self._metrics.wait_histogram.observe(perf_counter() - start_time, resource = self.name)
+
+		if self._idle:
+			item = self._idle.pop()
+		else:
+			try:
+				item = await self.factory()
+			except BaseException:
+				slots.release()
+				raise
+			self.size += 1
+
+		self.in_use += 1
+		self._report()
+
+		if self._metrics:
+			self._metrics.checkout_histogram.observe(perf_counter() - start_time, resource = self.name)
+		return item
+
+	async def release(self, item: T) -> None:
+		self.in_use -= 1
+		if self._closed:
+			# checked out while shutting down, so there's no pool left to return it to
+			self.size -= 1
+			if self.close:
+				await self.close(item)
+		else:
+			self._idle.append(item)
+
+		self._ensure_slots().release()
+		self._report()
+
+	@asynccontextmanager
+	async def checkout(self) -> AsyncIterator[T]:
+		item = await self.acquire()
+		checkout_time = perf_counter()
+		try:
+			yield item
+		finally:
+			if self._metrics:
+				self._metrics.hold_histogram.observe(perf_counter() - checkout_time, resource = self.name)
+			await self.release(item)
+
+class ResourceRegistry:
+	def __init__(self) -> None:
+		self._resources: Dict[str, Resource[Any]] = {}
+		self._metrics: Optional[_PoolMetrics] = None
+
+	def _attach_metrics(self, metrics_registry: MetricsRegistry) -> None:
+		self._metrics = _PoolMetrics(metrics_registry)
+		for resource in self._resources.values():
+			resource._metrics = self._metrics
+
+	def register(self, resource: Resource[T]) -> Resource[T]:
+		if resource.name in self._resources:
+			raise Exception(f'resource {resource.name} is already registered')
+
+		resource._metrics = self._metrics
+		self._resources[resource.name] = resource
+		return resource
+
+	def pool(
+			self,
+			name: str,
+			factory: ResourceFactory[T],
+			close: Optional[ResourceCloser[T]] = None,
+			min_size: int = 0,
+			max_size: int = 10,
+			acquire_timeout_secs: Optional[float] = None,
+		) -> ResourcePool[T]:
+		pool = ResourcePool(name, factory, close, min_size, max_size, acquire_timeout_secs)
+		self.register(pool)
+		return pool
+
+	def shared(self, name: str, factory: ResourceFactory[T], close: Optional[ResourceCloser[T]] = None) -> SharedResource[T]:
+		resource = SharedResource(name, factory, close)
+		self.register(resource)
+		return resource
+
+	def names(self) -> List[str]:
+		return list(self._resources)
+
+	def get(self, name: str) -> Resource[Any]:
+		return self._resources[name]
+
+	def checkout(self, name: str) -> AsyncContextManager[Any]:
+		return self._resources[name].checkout()
+
+	async def startup(self) -> None:
+		await asyncio.gather(*[ r.startup() for r in self._resources.values() ])
+
+	async def shutdown(self) -> None:
+		await asyncio.gather(*[ r.shutdown() for r in self._resources.values() ])
@@ -1,13 +1,47 @@
-from typing import Any, Union, Dict, Callable, Literal, Set, TypeVar, Optional
+import collections.abc
+import inspect
+from typing import Any, Collection, Union, Dict, Callable, List, Literal, Set, TypeVar, Optional
 from dataclasses import dataclass
 from datetime import datetime, date
 
 from .auth import _REQUIRES_PRIVILEGE_ATTR
+from .binary import BINARY_BYTES, BINARY_FILE, BINARY_STREAM, File
+from .body import _MAX_BODY_BYTES_ATTR
+from .columnar import columnar_fields
+from .deadline import _TIMEOUT_ATTR
+from .etag import _CACHE_ATTR, CacheSpec, is_versioned_type
+from .idempotency import _IDEMPOTENT_ATTR, IdempotencySpec
+from .jobs import _BACKGROUND_JOB_ATTR
+from .offload import _CPU_BOUND_ATTR, OffloadSpec
+from .pagination import (_PAGINATED_ATTR, CURSOR_PARAM, LIMIT_PARAM,
+                         STREAM_PARAM, Cursor, PaginationSpec, is_page_type)
+from .priority import _PRIORITY_ATTR
+from .records import is_record_type
 
 _ParserType = Callable[[ str ], Any]
 
+_SUBSCRIPTION_TYPES = (
+	collections.abc.AsyncIterator,
+	collections.abc.AsyncIterable,
+	collections.abc.AsyncGenerator,
+)
+
+def is_subscription_type(py_type: type) -> bool:
+	return getattr(py_type, '__origin__', None) in _SUBSCRIPTION_TYPES
+
+def binary_kind(py_type: type) -> Optional[str]:
+	if py_type is bytes:
+		return BINARY_BYTES
+	if py_type is File:
+		return BINARY_FILE
+	if is_subscription_type(py_type) and getattr(py_type, '__args__')[0] is bytes:
+		return BINARY_STREAM
+	return None
+
 @dataclass
 class ArgDef:
+	# read for every argument of every request, so kept to fixed slots rather than an instance dict
+	__slots__ = ( 'original_type', 'element_type', 'optional', 'parser', 'is_list' )
 	original_type: type
 	element_type: type
 	optional: bool
@@ -77,30 +111,144 @@ class RouteDef:
 	requires_privilege: Optional[str]
 	readable_name: str
 	doc: str
+	offload: Optional[OffloadSpec]
+	requires_deadline: bool
+	timeout_secs: Optional[float]
+	columnar_fields: Optional[List[str]]
+	cursor_arg: Optional[str]
+	pagination: Optional[PaginationSpec]
+	max_body_bytes: Optional[int]
+	resources: List[str]
+	background_job: bool
+	cache: Optional[CacheSpec]
+	versioned: bool
+	idempotency: Optional[IdempotencySpec]
+	# set when the body or the response is raw bytes rather than an encoded dataclass
+	binary_body: Optional[str]
+	binary_response: Optional[str]
+	priority: Optional[str]
 
-def make_route_def(impl: Callable[..., Any]) -> RouteDef:
+def make_route_def(impl: Callable[..., Any], resource_names: Collection[str] = ()) -> RouteDef:
 	name_tokens = impl.__name__.split('_')
 	http_method = name_tokens[0]
 
 	input_annotations = impl.__annotations__.copy()
 	return_type = input_annotations['return']
 	del input_annotations['return']
+	# sub_ handlers are async generators, documented by the type of event they yield
+	if http_method == 'sub':
+		if not is_subscription_type(return_type):
+			raise Exception('sub methods must be async generators')
+		return_type = getattr(return_type, '__args__')[0]
+
+	binary_response = binary_kind(return_type) if http_method != 'sub' else None
+	if is_subscription_type(return_type) and binary_response is None and http_method != 'sub':
+		raise Exception('only sub methods can return async iterators of anything but bytes')
+
+	# handlers returning Versioned[T] are documented and rendered as T
+	versioned = is_versioned_type(return_type)
+	if versioned:
+		return_type = getattr(return_type, '__args__')[0]
 	requires_principal = input_annotations.get('principal') is not None
 	if requires_principal:
 		del input_annotations['principal']
+	requires_deadline = input_annotations.get('deadline') is not None
+	if requires_deadline:
+		del input_annotations['deadline']
+	resources = [ name for name in input_annotations if name in resource_names ]
+	for name in resources:
+		del input_annotations[name]
+
+	cursor_arg = next((name for name, t in input_annotations.items() if t is Cursor), None)
+	if cursor_arg is not None:
+		del input_annotations[cursor_arg]
 
 	if http_method == 'post':
 		if len(input_annotations) != 1:
 			raise Exception('POST methods require one argument')
 
+	binary_body = None
+	if http_method == 'post':
+		binary_body = binary_kind(list(input_annotations.values())[0])
+		if binary_body == BINARY_FILE:
+			raise Exception('File can only be returned, not taken as a body')
+	elif any(binary_kind(t) for t in input_annotations.values()):
+		raise Exception('bytes can only be taken as the body of POST methods')
+	if http_method != 'post' and any(is_record_type(make_arg_def(t).element_type) for t in input_annotations.values()):
+		raise Exception('dataclasses, NamedTuples and TypedDicts can only be taken as the body of POST methods')
+
+	if http_method == 'sub' and (requires_deadline or resources or cursor_arg is not None):
+		raise Exception('sub methods cannot use deadlines, resources or cursors')
+
 	args = {
 		name: make_arg_def(element_type) for name, element_type
 		in input_annotations.items()
 	}
 
+	pagination = None
+	if cursor_arg is not None:
+		if http_method != 'get' or not is_page_type(return_type):
+			raise Exception('Cursor arguments are only supported on GET methods returning a Page')
+
+		pagination = getattr(impl, _PAGINATED_ATTR, PaginationSpec(None, None, False))
+		assert isinstance(pagination, PaginationSpec)
+
+		# the cursor is exposed as plain query string arguments, decoded by the endpoint
+		pagination_args = [ CURSOR_PARAM, LIMIT_PARAM ] + ([ STREAM_PARAM ] if pagination.streamable else [])
+		if any(name in args for name in pagination_args):
+			raise Exception(f'paginated methods cannot declare arguments named {pagination_args}')
+
+		args[CURSOR_PARAM] = make_arg_def(Optional[str]) # type: ignore
+		args[LIMIT_PARAM] = make_arg_def(Optional[int]) # type: ignore
+		if pagination.streamable:
+			args[STREAM_PARAM] = make_arg_def(Optional[bool]) # type: ignore
+
 	requires_privilege = getattr(impl, _REQUIRES_PRIVILEGE_ATTR, None)
 	assert requires_privilege is None or isinstance(requires_privilege, str)
 
+	offload = getattr(impl, _CPU_BOUND_ATTR, None)
+	assert offload is None or isinstance(offload, OffloadSpec)
+	if offload and inspect.ismethod(impl):
+		# bound methods would drag the whole service instance through pickle
+		raise Exception('cpu_bound handlers must be static methods')
+	if offload and resources:
+		raise Exception('cpu_bound handlers cannot use resources')
+
+	timeout_secs = getattr(impl, _TIMEOUT_ATTR, None)
+	assert timeout_secs is None or isinstance(timeout_secs, (int, float))
+
+	background_job = getattr(impl, _BACKGROUND_JOB_ATTR, False)
+	if background_job and http_method != 'post':
+		raise Exception('only POST methods can be background jobs')
+
+	cache = getattr(impl, _CACHE_ATTR, None)
+	assert cache is None or isinstance(cache, CacheSpec)
+	if versioned and cache is None:
+		cache = CacheSpec(None, True)
+	if cache and http_method != 'get':
+		raise Exception('only GET methods can be cached or versioned')
+
+	idempotency = getattr(impl, _IDEMPOTENT_ATTR, None)
+	assert idempotency is None or isinstance(idempotency, IdempotencySpec)
+	if idempotency and http_method != 'post':
+		raise Exception('only POST methods can be idempotent')
+
+	max_body_bytes = getattr(impl, _MAX_BODY_BYTES_ATTR, None)
+	assert max_body_bytes is None or isinstance(max_body_bytes, int)
+
+	priority = getattr(impl, _PRIORITY_ATTR, None)
+	assert priority is None or isinstance(priority, str)
+
+	# streams and files are consumed after the handler returns, so nothing can hold on to a copy of them
+	if binary_body == BINARY_STREAM and (idempotency or background_job or offload):
+		raise Exception('streamed bodies cannot be idempotent, background jobs or cpu_bound')
+	if binary_response in (BINARY_STREAM, BINARY_FILE) and (idempotency or background_job or offload or cache):
+		raise Exception('streamed and file responses cannot be idempotent, background jobs, cpu_bound or cached')
+	if binary_response == BINARY_STREAM and resources:
+		raise Exception('streamed responses cannot use resources, which are released when the handler returns')
+	if binary_response and background_job:
+		raise Exception('background jobs cannot return bytes')
+
 	return RouteDef(
 		path = '/' + '_'.join(name_tokens[1:]),
 		http_method = http_method,
@@ -111,4 +259,19 @@ def make_route_def(impl: Callable[..., Any]) -> RouteDef:
 		requires_privilege = requires_privilege,
 		readable_name = ' '.join([ s.title() for s in name_tokens[1:] ]),
 		doc = getattr(impl, '__doc__'),
+		offload = offload,
+		requires_deadline = requires_deadline,
+		timeout_secs = timeout_secs,
+		columnar_fields = columnar_fields(return_type) if http_method != 'sub' else None,
+		cursor_arg = cursor_arg,
+		pagination = pagination,
+		max_body_bytes = max_body_bytes,
+		resources = resources,
+		background_job = background_job,
+		cache = cache,
+		versioned = versioned,
+		idempotency = idempotency,
+		binary_body = binary_body,
+		binary_response = binary_response,
+		priority = priority,
 	)
@@ -5,6 +5,14 @@ from enum import Enum, EnumMeta
 from typing import Any, Dict, List, Literal, Optional, Union
 
 from .auth import AuthBackend
+from .binary import BINARY_FILE, BINARY_MEDIA_TYPE, BINARY_SCHEMA
+from .codecs import available_codecs
+from .columnar import (ARROW_STREAM_MEDIA_TYPE, COLUMNAR_JSON_MEDIA_TYPE,
+                       COLUMNAR_QUERY_FLAG, arrow_available)
+from .jobs import JobAccepted
+from .pagination import is_page_type
+from .records import (is_namedtuple_type, is_typeddict_type, record_fields,
+                      required_fields)
 from .route_def import RouteDef
 
 _pytype_to_schema_type_lookup = {
@@ -23,6 +31,10 @@ _pytype_string_formats = {
 }
 
 def pytype_to_schema(py_type: type) -> Dict[str, Any]:
+	# fields of plain namedtuples have no annotations, so could be anything
+	if py_type is Any:
+		return {}
+
 	origin_type = getattr(py_type, '__origin__', None)
 
 	if not origin_type:
@@ -31,6 +43,12 @@ def pytype_to_schema(py_type: type) -> Dict[str, Any]:
 				'type': 'object',
 				'properties': { f.name: pytype_to_schema(f.type) for f in fields(py_type) },
 			}
+		elif is_namedtuple_type(py_type) or is_typeddict_type(py_type):
+			return {
+				'type': 'object',
+				'properties': { name: pytype_to_schema(t) for name, t in record_fields(py_type).items() },
+				'required': sorted(required_fields(py_type)),
+			}
 		elif isinstance(py_type, EnumMeta):
 			return {
 				'type': 'string',
@@ -56,6 +74,14 @@ def pytype_to_schema(py_type: type) -> Dict[str, Any]:
 			return {
 				'oneOf': [ pytype_to_schema(t) for t in generic_types ],
 			}
+		elif is_page_type(py_type):
+			return {
+				'type': 'object',
+				'properties': {
+					'items': pytype_to_schema(List[generic_types[0]]), # type: ignore
+					'next_cursor': pytype_to_schema(Optional[str]), # type: ignore
+				},
+			}
 		elif origin_type == Literal:
 			return {
 				'type': _pytype_to_schema_type_lookup[type(generic_types[0])],
@@ -67,25 +93,38 @@ def pytype_to_schema(py_type: type) -> Dict[str, Any]:
 		'format': _pytype_string_formats.get(py_type),
 	}
 
+def content_for_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+	return { codec.media_type: { 'schema': schema } for codec in available_codecs() }
+
 def build_schemas(route_defs: List[RouteDef], api_name: str, auth_backend: Optional[AuthBackend]) -> Dict[str, Any]:
 	paths: Dict[str, Any] = defaultdict(dict)
 	for route_def in route_defs:
+		if route_def.binary_response:
+			# files carry their own media type, only known once the handler has picked one
+			media_type = '*/*' if route_def.binary_response == BINARY_FILE else BINARY_MEDIA_TYPE
+			response_content = { media_type: { 'schema': BINARY_SCHEMA } }
+		else:
+			response_content = content_for_schema(pytype_to_schema(route_def.return_type))
+
 		spec: Any = {
 			'summary': route_def.readable_name,
 			'description': route_def.doc,
 			'responses': {
 				'200': {
 					'description': 'success',
-					'content': {
-						'application/json': {
-							'schema': pytype_to_schema(route_def.return_type),
-						},
-					},
+					'content': response_content,
 				},
 			}
 		}
 
-		if route_def.http_method == 'get':
+		if route_def.binary_response == BINARY_FILE:
+			spec['responses']['206'] = {
+				'description': 'the requested byte range',
+				'content': { '*/*': { 'schema': BINARY_SCHEMA } },
+			}
+			spec['responses']['416'] = { 'description': 'the requested range starts past the end of the file' }
+
+		if route_def.http_method in ('get', 'sub'):
 			spec['parameters'] = [ {
 					'name': arg_name,
 					'in': 'query',
@@ -94,17 +133,86 @@ def build_schemas(route_defs: List[RouteDef], api_name: str, auth_backend: Optio
 				}
 				for arg_name, arg_def in route_def.args.items()
 			]
+		elif route_def.binary_body:
+			spec['requestBody'] = {
+				'required': True,
+				'content': { BINARY_MEDIA_TYPE: { 'schema': BINARY_SCHEMA } },
+			}
 		else:
 			spec['requestBody'] = {
 				'required': True,
-				'content': {
-					'application/json': {
-						'schema': pytype_to_schema(list(route_def.args.values())[0].original_type),
+				'content': content_for_schema(pytype_to_schema(list(route_def.args.values())[0].original_type)),
+			}
+
+		if route_def.binary_response == BINARY_FILE:
+			spec.setdefault('parameters', []).append({
+				'name': 'Range',
+				'in': 'header',
+				'description': 'a single byte range, e.g. bytes=0-1023',
+				'schema': pytype_to_schema(str),
+				'required': False,
+			})
+
+		if route_def.columnar_fields is not None:
+			row_schema = pytype_to_schema(getattr(route_def.return_type, '__args__')[0])
+			response_content = spec['responses']['200']['content']
+			response_content[COLUMNAR_JSON_MEDIA_TYPE] = {
+				'schema': {
+					'type': 'object',
+					'properties': {
+						name: { 'type': 'array', 'items': field_schema }
+						for name, field_schema in row_schema['properties'].items()
 					},
 				},
 			}
+			if arrow_available():
+				response_content[ARROW_STREAM_MEDIA_TYPE] = {
+					'schema': { 'type': 'string', 'format': 'binary' },
+				}
+
+			spec.setdefault('parameters', []).append({
+				'name': COLUMNAR_QUERY_FLAG,
+				'in': 'query',
+				'description': 'return the rows as a dictionary of columns',
+				'schema': pytype_to_schema(bool),
+				'required': False,
+			})
+
+		if route_def.background_job:
+			spec['responses'] = {
+				'202': {
+					'description': 'job accepted',
+					'content': content_for_schema(pytype_to_schema(JobAccepted)),
+				},
+			}
+
+		if route_def.idempotency:
+			spec.setdefault('parameters', []).append({
+				'name': 'Idempotency-Key',
+				'in': 'header',
+				'description': 'retries sharing a key get the first response replayed instead of running the request again',
+				'schema': pytype_to_schema(str),
+				'required': route_def.idempotency.required,
+			})
+			spec['responses']['409'] = { 'description': 'idempotency key was already used for a different request' }
+
+		if route_def.pagination and route_def.pagination.streamable:
+			item_schema = pytype_to_schema(getattr(route_def.return_type, '__args__')[0])
+			spec['responses']['200']['content']['application/x-ndjson'] = {
+				'schema': item_schema,
+			}
+
+		if route_def.http_method == 'sub':
+			spec['description'] = '\n\n'.join(filter(None, [
+				route_def.doc,
+				'Streams events as server-sent events, or as JSON text messages when connecting with a WebSocket.',
+			]))
+			spec['responses']['200']['content'] = {
+				'text/event-stream': { 'schema': pytype_to_schema(route_def.return_type) },
+			}
 
-		paths[route_def.path][route_def.http_method] = spec
+		# subscriptions are served by a GET (or a websocket upgrade) on the same path
+		paths[route_def.path]['get' if route_def.http_method == 'sub' else route_def.http_method] = spec
 
 	openapi_spec: Dict[str, Any] = {
 		'openapi': '3.0.0',
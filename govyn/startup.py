@@ -0,0 +1,197 @@
+import asyncio
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from starlette.types import ASGIApp
+
+from .asgi import asgi_request
+from .auth import TFunc
+from .log import StructuredLogger
+from .metrics import MetricsRegistry
+from .route_def import RouteDef
+
+_STARTUP_AFTER_ATTR = '_startup_after'
+
+StartupFunc = Callable[[], Awaitable[None]]
+
+# names the startup hooks that must finish before this one starts. hooks on the service are
+# `startup` and any `startup_<name>` method, and wait for every resource unless told otherwise;
+# built-in components such as the auth backend and job queue wait for every service hook
+def startup_after(*hooks: str) -> Callable[[ TFunc ], TFunc]:
+	def _decorator(func: TFunc) -> TFunc:
+		setattr(func, _STARTUP_AFTER_ATTR, list(hooks))
+		return func
+	return _decorator
+
+def startup_dependencies(func: Callable[..., Any], default: Sequence[str]) -> List[str]:
+	return list(getattr(func, _STARTUP_AFTER_ATTR, default))
+
+@dataclass
+class StartupHook:
+	name: str
+	func: StartupFunc
+	after: List[str]
+
+class StartupGraph:
+	def __init__(self, metrics_registry: MetricsRegistry, logger: StructuredLogger) -> None:
+		self.hooks: Dict[str, StartupHook] = {}
+		self.durations: Dict[str, float] = {}
+		self.logger = logger
+		self.duration_gauge = metrics_registry.gauge('api_startup_hook_seconds')
+		self.total_gauge = metrics_registry.gauge('api_startup_seconds')
+
+	def add(self, name: str, func: StartupFunc, after: Sequence[str] = ()) -> None:
+		if name in self.hooks:
+			raise Exception(f'startup hook {name} is already registered')
+		self.hooks[name] = StartupHook(name, func, list(after))
+
+	# hooks in an order where each comes after everything it depends on; checked when the app is
+	# created, so a typo or a cycle fails there rather than on the first deploy
+	def ordered(self) -> List[StartupHook]:
+		ordered: List[StartupHook] = []
+		state: Dict[str, str] = {}
+
+		def visit(hook: StartupHook, path: List[str]) -> None:
+			if state.get(hook.name) == 'done':
+				return
+			if state.get(hook.name) == 'visiting':
+				raise Exception(f'startup hooks depend on each other: {" -> ".join(path + [ hook.name ])}')
+			state[hook.name] = 'visiting'
+			for dep in hook.after:
+				if dep not in self.hooks:
+					raise Exception(f'startup hook {hook.name} depends on unknown hook {dep}')
+				visit(self.hooks[dep], path + [ hook.name ])
+			state[hook.name] = 'done'
+			ordered.append(hook)
+
+		for hook in self.hooks.values():
+			visit(hook, [])
+		return ordered
+
+	async def _run_hook(self, hook: StartupHook, deps: List['asyncio.Future[None]']) -> None:
+		if deps:
+			await asyncio.gather(*deps)
+		start_time = perf_counter()
+		try:
+			await hook.func()
+		except Exception as ex:
+			self.logger.exception('startup_hook_failed', ex, hook = hook.name)
+			raise
+		duration = perf_counter() - start_time
+		self.durations[hook.name] = duration
+		self.duration_gauge.set(duration, hook = hook.name)
+
+	# each hook starts as soon as the ones it depends on have finished, so independent hooks
+	# overlap and startup takes as long as the slowest chain rather than the sum of every hook
+	async def run(self) -> None:
+		start_time = perf_counter()
+		tasks: Dict[str, 'asyncio.Future[None]'] = {}
+		for hook in self.ordered():
+			tasks[hook.name] = asyncio.ensure_future(self._run_hook(hook, [ tasks[dep] for dep in hook.after ]))
+
+		try:
+			await asyncio.gather(*tasks.values())
+		except BaseException:
+			# the first failure fails startup; nothing else is left half-started in the background
+			for task in tasks.values():
+				task.cancel()
+			await asyncio.gather(*tasks.values(), return_exceptions = True)
+			raise
+
+		self.total_gauge.set(perf_counter() - start_time)
+
+@dataclass
+class WarmupRequest:
+	path: str
+	method: str = 'GET'
+	query: str = ''
+	headers: Dict[str, str] = field(default_factory = dict)
+	body: bytes = b''
+
+@dataclass
+class WarmupConfig:
+	requests: List[WarmupRequest]
+	# also sends a GET to every route that can be called without any arguments
+	argless_routes: bool
+	# sent with every request, e.g. a service token so warmup gets past auth
+	headers: Dict[str, str]
+	# each request is sent this many times, so pools and caches filled lazily see more than one caller
+	rounds: int
+	concurrency: int
+	timeout_secs: float
+	# otherwise failed requests are logged and counted, but the pod still becomes ready
+	fail_on_error: bool
+
+def default_warmup_config(requests: Sequence[WarmupRequest] = ()) -> WarmupConfig:
+	return WarmupConfig(
+		requests = list(requests),
+		argless_routes = True,
+		headers = {},
+		rounds = 1,
+		concurrency = 4,
+		timeout_secs = 30.0,
+		fail_on_error = False,
+	)
+
+def argless_warmup_requests(route_defs: Sequence[RouteDef]) -> List[WarmupRequest]:
+	return [
+		WarmupRequest(r.path)
+		for r in route_defs
+		if r.http_method == 'get' and not r.requires_principal and not r.requires_privilege
+			and all(a.optional for a in r.args.values())
+	]
+
+class Warmup:
+	def __init__(self, config: WarmupConfig, requests: List[WarmupRequest], metrics_registry: MetricsRegistry, logger: StructuredLogger) -> None:
+		self.config = config
+		self.requests = requests
+		self.logger = logger
+		self.app: Optional[ASGIApp] = None
+		self.request_counter = metrics_registry.counter('api_warmup_requests')
+		self.duration_gauge = metrics_registry.gauge('api_warmup_seconds')
+
+	async def _send(self, request: WarmupRequest, slots: asyncio.Semaphore) -> bool:
+		assert self.app
+		async with slots:
+			try:
+				status, _ = await asgi_request(
+					self.app, request.method, request.path, request.query,
+					{ **self.config.headers, **request.headers }, request.body,
+				)
+			except Exception as ex:
+				self.request_counter.inc(path = request.path, status = 'error')
+				self.logger.exception('warmup_request_failed', ex, path = request.path)
+				return False
+
+		self.request_counter.inc(path = request.path, status = str(status))
+		if status >= 400:
+			self.logger.error('warmup_request_failed', path = request.path, status = status)
+			return False
+		return True
+
+	# sent through the whole app, middleware included, after every startup hook has finished
+	# and before the pod reports ready
+	async def run(self) -> None:
+		if not self.requests:
+			return
+
+		start_time = perf_counter()
+		slots = asyncio.Semaphore(self.config.concurrency)
+
+		async def _rounds() -> bool:
+			ok = True
+			for _ in range(self.config.rounds):
+				results = await asyncio.gather(*[ self._send(r, slots) for r in self.requests ])
+				ok = ok and all(results)
+			return ok
+
+		try:
+			ok = await asyncio.wait_for(_rounds(), self.config.timeout_secs)
+		except asyncio.TimeoutError:
+			self.logger.error('warmup_timed_out', timeout_secs = self.config.timeout_secs)
+			ok = False
+
+		self.duration_gauge.set(perf_counter() - start_time)
+		if not ok and self.config.fail_on_error:
+			raise Exception('warmup requests failed')
@@ -0,0 +1,210 @@
+import asyncio
+from contextlib import suppress
+from dataclasses import dataclass
+from typing import (Any, AsyncGenerator, AsyncIterator, Awaitable, Callable,
+                    Dict, List, Optional, Set, cast)
+
+from starlette.requests import HTTPConnection, Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import BaseRoute, Route, WebSocketRoute
+from starlette.websockets import WebSocket, WebSocketDisconnect, WebSocketState
+
+from .auth import AuthBackend, Principal
+from .codecs import encode_json
+from .errors import Forbidden, HTTPError, ServiceUnavailable
+from .metrics import MetricsRegistry
+from .route_def import ArgDef, RouteDef
+
+# websocket close codes
+_WS_NORMAL = 1000
+_WS_GOING_AWAY = 1001
+_WS_POLICY_VIOLATION = 1008
+_WS_TRY_AGAIN_LATER = 1013
+
+@dataclass
+class SubscriptionConfig:
+	max_connections: Optional[int]
+	heartbeat_secs: float
+	# websocket clients that can't take an event within this long are disconnected;
+	# SSE clients are throttled by the server's own flow control instead
+	send_timeout_secs: float
+
+def default_subscription_config() -> SubscriptionConfig:
+	return SubscriptionConfig(
+		max_connections = 1000,
+		heartbeat_secs = 15.0,
+		send_timeout_secs = 10.0,
+	)
+
+class SubscriptionHub:
+	def __init__(self, config: SubscriptionConfig, metrics_registry: MetricsRegistry) -> None:
+		self.config = config
+		self.active = 0
+		self.closing = False
+		self._stops: Set['asyncio.Future[None]'] = set()
+		self.active_gauge = metrics_registry.gauge('api_subscriptions_active')
+		self.events_counter = metrics_registry.counter('api_subscription_events_sent')
+		self.rejected_counter = metrics_registry.counter('api_subscriptions_rejected')
+
+	def close_all(self) -> None:
+		self.closing = True
+		for stop in self._stops:
+			if not stop.done():
+				stop.set_result(None)
+
+	def acquire(self, path: str) -> None:
+		if self.closing:
+			self.rejected_counter.inc(path = path)
+			raise ServiceUnavailable('server is shutting down')
+		if self.config.max_connections is not None and self.active >= self.config.max_connections:
+			self.rejected_counter.inc(path = path)
+			raise ServiceUnavailable('too many subscriptions')
+
+		self.active += 1
+		self.active_gauge.set(self.active)
+
+	def release(self) -> None:
+		self.active -= 1
+		self.active_gauge.set(self.active)
+
+	# yields the handler's events, or None whenever a heartbeat is due. the handler is only asked for
+	# its next event once the previous one has been sent, so slow clients hold up their own producer
+	async def events(self, gen: AsyncIterator[Any], disconnected: Awaitable[None]) -> AsyncGenerator[Optional[Any], None]:
+		stop: 'asyncio.Future[None]' = asyncio.get_running_loop().create_future()
+		self._stops.add(stop)
+		disconnect = asyncio.ensure_future(disconnected)
+		next_event: Optional['asyncio.Future[Any]'] = None
+		try:
+			while True:
+				if next_event is None:
+					next_event = asyncio.ensure_future(gen.__anext__())
+
+				done, _ = await asyncio.wait(
+					[ next_event, stop, disconnect ],
+					timeout = self.config.heartbeat_secs,
+					return_when = asyncio.FIRST_COMPLETED,
+				)
+				if stop in done or disconnect in done:
+					return
+
+				if next_event in done:
+					try:
+						event = next_event.result()
+					except StopAsyncIteration:
+						next_event = None
+						return
+					next_event = None
+					yield event
+				else:
+					yield None
+		finally:
+			self._stops.discard(stop)
+			disconnect.cancel()
+			if next_event is not None:
+				next_event.cancel()
+				with suppress(BaseException):
+					await next_event
+			aclose = getattr(gen, 'aclose', None)
+			if aclose:
+				await aclose()
+
+async def _wait_for_http_disconnect(req: Request) -> None:
+	while (await req.receive())['type'] != 'http.disconnect':
+		pass
+
+async def _wait_for_ws_disconnect(ws: WebSocket) -> None:
+	while (await ws.receive())['type'] != 'websocket.disconnect':
+		pass
+
+def subscription_routes(
+		route: RouteDef,
+		hub: SubscriptionHub,
+		parse_args: Callable[[ Request, Dict[str, ArgDef] ], Awaitable[Dict[str, Any]]],
+		auth_backend: Optional[AuthBackend],
+	) -> List[BaseRoute]:
+	def check_privilege(principal: Optional[Principal]) -> None:
+		if route.requires_privilege is not None:
+			if not principal or route.requires_privilege not in principal.privileges:
+				raise Forbidden('insufficient privileges')
+
+	async def start(conn: HTTPConnection, principal: Optional[Principal]) -> AsyncIterator[Any]:
+		check_privilege(principal)
+		args = await parse_args(cast(Request, conn), route.args)
+		if route.requires_principal:
+			args['principal'] = principal
+		return cast(AsyncIterator[Any], route.impl(**args))
+
+	async def sse_endpoint(req: Request) -> Response:
+		principal = getattr(req.state, 'principal', None)
+		gen = await start(req, principal)
+		hub.acquire(route.path)
+
+		async def body() -> AsyncIterator[bytes]:
+			events = hub.events(gen, _wait_for_http_disconnect(req))
+			event_id = 0
+			try:
+				async for event in events:
+					if event is None:
+						yield b': heartbeat\n\n'
+						continue
+					event_id += 1
+					yield b'id: %d\ndata: %s\n\n' % (event_id, encode_json(event))
+					hub.events_counter.inc(path = route.path)
+			finally:
+				await events.aclose()
+				hub.release()
+
+		return StreamingResponse(body(), media_type = 'text/event-stream', headers = {
+			'cache-control': 'no-cache',
+			# stop reverse proxies from holding events back
+			'x-accel-buffering': 'no',
+		})
+
+	async def ws_endpoint(ws: WebSocket) -> None:
+		# the HTTP auth middleware doesn't see websocket connections, so the backend is asked directly
+		principal = None
+		if auth_backend:
+			principal = await auth_backend.resolve_principal(cast(Request, ws))
+			if principal is None:
+				await ws.close(_WS_POLICY_VIOLATION)
+				return
+
+		try:
+			gen = await start(ws, principal)
+			hub.acquire(route.path)
+		except ServiceUnavailable:
+			await ws.close(_WS_TRY_AGAIN_LATER)
+			return
+		except HTTPError:
+			await ws.close(_WS_POLICY_VIOLATION)
+			return
+
+		events = hub.events(gen, _wait_for_ws_disconnect(ws))
+		close_code = _WS_NORMAL
+		try:
+			await ws.accept()
+			async for event in events:
+				# ASGI doesn't expose ping frames, so heartbeats are empty text frames
+				message = encode_json(event).decode('utf-8') if event is not None else ''
+				try:
+					await asyncio.wait_for(ws.send_text(message), hub.config.send_timeout_secs)
+				except asyncio.TimeoutError:
+					close_code = _WS_POLICY_VIOLATION
+					break
+				if event is not None:
+					hub.events_counter.inc(path = route.path)
+
+			if hub.closing:
+				close_code = _WS_GOING_AWAY
+			if ws.client_state != WebSocketState.DISCONNECTED:
+				await ws.close(close_code)
+		except WebSocketDisconnect:
+			pass
+		finally:
+			await events.aclose()
+			hub.release()
+
+	return [
+		Route(route.path, sse_endpoint, methods = [ 'GET' ]),
+		WebSocketRoute(route.path, ws_endpoint),
+	]
@@ -0,0 +1,275 @@
+import asyncio
+import json
+import random
+import re
+import secrets
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar, Token
+from dataclasses import dataclass
+from time import perf_counter, time
+from types import TracebackType
+from typing import Any, Deque, Dict, List, Optional, Tuple, Type, Union
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .metrics import MetricsRegistry
+
+TRACEPARENT_HEADER = 'traceparent'
+
+_TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+_INVALID_TRACE_ID = '0' * 32
+_INVALID_SPAN_ID = '0' * 16
+_SAMPLED_FLAG = 0x01
+
+class Span:
+	__slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'attributes', 'start_time', 'duration_secs', 'recording', '_start')
+
+	def __init__(self, trace_id: str, span_id: str, parent_id: Optional[str], name: str, attributes: Dict[str, Any], recording: bool = True) -> None:
+		self.trace_id = trace_id
+		self.span_id = span_id
+		self.parent_id = parent_id
+		self.name = name
+		self.attributes = attributes
+		self.start_time = time()
+		self.duration_secs: Optional[float] = None
+		self.recording = recording
+		self._start = perf_counter()
+
+	def set_attribute(self, key: str, value: Any) -> None:
+		if self.recording:
+			self.attributes[key] = value
+
+	def end(self) -> None:
+		self.duration_secs = perf_counter() - self._start
+
+	def to_dict(self) -> Dict[str, Any]:
+		return {
+			'trace_id': self.trace_id,
+			'span_id': self.span_id,
+			'parent_id': self.parent_id,
+			'name': self.name,
+			'start_time': self.start_time,
+			'duration_secs': self.duration_secs,
+			'attributes': self.attributes,
+		}
+
+class _Trace:
+	__slots__ = ('trace_id', 'parent_id', 'sampled', 'recording', 'spans')
+
+	def __init__(self, trace_id: str, parent_id: Optional[str], sampled: bool, recording: bool) -> None:
+		self.trace_id = trace_id
+		self.parent_id = parent_id
+		# the head sampling decision, passed on to downstream services
+		self.sampled = sampled
+		# whether spans are kept at all, which tail sampling needs even for unsampled requests
+		self.recording = recording
+		self.spans: List[Span] = []
+
+_current_trace: ContextVar[Optional[_Trace]] = ContextVar('govyn_trace', default = None)
+_current_span: ContextVar[Optional[Span]] = ContextVar('govyn_span', default = None)
+
+def _new_trace_id() -> str:
+	return secrets.token_hex(16)
+
+def _new_span_id() -> str:
+	return secrets.token_hex(8)
+
+class _SpanContext:
+	__slots__ = ('_trace', '_span', '_token')
+
+	def __init__(self, trace: _Trace, span: Span) -> None:
+		self._trace = trace
+		self._span = span
+		self._token: Optional[Token[Optional[Span]]] = None
+
+	def __enter__(self) -> Span:
+		self._token = _current_span.set(self._span)
+		return self._span
+
+	def __exit__(self, exc_type: Optional[Type[BaseException]], exc: Optional[BaseException], tb: Optional[TracebackType]) -> None:
+		if self._token is not None:
+			_current_span.reset(self._token)
+		if exc is not None:
+			self._span.set_attribute('error', repr(exc))
+		self._span.end()
+		self._trace.spans.append(self._span)
+
+class _NoopSpanContext:
+	__slots__ = ()
+
+	def __enter__(self) -> Span:
+		return _NOOP_SPAN
+
+	def __exit__(self, exc_type: Optional[Type[BaseException]], exc: Optional[BaseException], tb: Optional[TracebackType]) -> None:
+		pass
+
+_NOOP_SPAN = Span(_INVALID_TRACE_ID, _INVALID_SPAN_ID, None, '', {}, recording = False)
+_NOOP_SPAN_CONTEXT = _NoopSpanContext()
+
+# usable from handlers as `with span('db query', table = 'users'):`, and free when the request isn't being traced
+def span(name: str, **attributes: Any) -> Any:
+	trace = _current_trace.get()
+	if trace is None or not trace.recording:
+		return _NOOP_SPAN_CONTEXT
+
+	parent = _current_span.get()
+	new_span = Span(trace.trace_id, _new_span_id(), parent.span_id if parent else trace.parent_id, name, attributes)
+	return _SpanContext(trace, new_span)
+
+def current_span() -> Span:
+	return _current_span.get() or _NOOP_SPAN
+
+# for passing the trace on to downstream services
+def traceparent_header() -> Optional[str]:
+	trace = _current_trace.get()
+	if trace is None:
+		return None
+
+	current = _current_span.get()
+	parent_id = current.span_id if current else trace.parent_id
+	flags = _SAMPLED_FLAG if trace.sampled else 0
+	return f'00-{trace.trace_id}-{parent_id or _new_span_id()}-{flags:02x}'
+
+def parse_traceparent(value: Optional[str]) -> Optional[Dict[str, Any]]:
+	if not value:
+		return None
+
+	match = _TRACEPARENT_RE.match(value.strip().lower())
+	if not match:
+		return None
+
+	trace_id, parent_id, flags = match.groups()
+	if trace_id == _INVALID_TRACE_ID or parent_id == _INVALID_SPAN_ID:
+		return None
+	return {
+		'trace_id': trace_id,
+		'parent_id': parent_id,
+		'sampled': bool(int(flags, 16) & _SAMPLED_FLAG),
+	}
+
+class SpanSink(ABC):
+	async def startup(self) -> None:
+		pass
+
+	async def shutdown(self) -> None:
+		pass
+
+	@abstractmethod
+	async def export(self, spans: List[Span]) -> None:
+		...
+
+class InMemorySpanSink(SpanSink):
+	def __init__(self, max_spans: int = 10000) -> None:
+		self.spans: Deque[Span] = deque(maxlen = max_spans)
+
+	async def export(self, spans: List[Span]) -> None:
+		self.spans.extend(spans)
+
+	def traces(self) -> Dict[str, List[Span]]:
+		ret: Dict[str, List[Span]] = {}
+		for s in self.spans:
+			ret.setdefault(s.trace_id, []).append(s)
+		return ret
+
+class FileSpanSink(SpanSink):
+	def __init__(self, path: str) -> None:
+		self.path = path
+		self._executor = ThreadPoolExecutor(max_workers = 1)
+
+	def _write(self, lines: str) -> None:
+		with open(self.path, 'a', encoding = 'utf-8') as f:
+			f.write(lines)
+
+	async def export(self, spans: List[Span]) -> None:
+		lines = ''.join([ json.dumps(s.to_dict(), separators = (',', ':'), default = str) + '\n' for s in spans ])
+		await asyncio.get_running_loop().run_in_executor(self._executor, self._write, lines)
+
+	async def shutdown(self) -> None:
+		self._executor.shutdown(wait = True)
+
+@dataclass
+class TracingConfig:
+	# fraction of new traces recorded up front; sampled traces from upstream services are always recorded
+	sample_rate: float
+	# record every request, keeping the ones that turned out slower than this
+	slow_request_secs: Optional[float]
+	sink: SpanSink
+
+def default_tracing_config() -> TracingConfig:
+	return TracingConfig(
+		sample_rate = 0.0,
+		slow_request_secs = None,
+		sink = InMemorySpanSink(),
+	)
+
+class Tracer:
+	def __init__(self, config: TracingConfig, metrics_registry: MetricsRegistry) -> None:
+		self.config = config
+		self.sink = config.sink
+		self.exported_counter = metrics_registry.counter('api_traces_exported')
+
+	async def startup(self) -> None:
+		await self.sink.startup()
+
+	async def shutdown(self) -> None:
+		await self.sink.shutdown()
+
+	def start_trace(self, traceparent: Optional[str]) -> _Trace:
+		parent = parse_traceparent(traceparent)
+		if parent:
+			trace_id, parent_id, sampled = parent['trace_id'], parent['parent_id'], parent['sampled']
+		else:
+			trace_id, parent_id, sampled = _new_trace_id(), None, False
+
+		sampled = sampled or (self.config.sample_rate > 0 and random.random() < self.config.sample_rate)
+		return _Trace(trace_id, parent_id, sampled, sampled or self.config.slow_request_secs is not None)
+
+	async def finish_trace(self, trace: _Trace, duration_secs: float) -> None:
+		if not trace.recording or not trace.spans:
+			return
+
+		if trace.sampled:
+			reason = 'head'
+		elif self.config.slow_request_secs is not None and duration_secs >= self.config.slow_request_secs:
+			reason = 'slow'
+		else:
+			return
+
+		self.exported_counter.inc(sampling = reason)
+		await self.sink.export(trace.spans)
+
+class TracingMiddleware:
+	def __init__(self, app: ASGIApp, tracer: Tracer, exempt_prefix: Union[str, Tuple[str, ...]]) -> None:
+		self.app = app
+		self.tracer = tracer
+		self.exempt_prefix = exempt_prefix
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+		if scope['type'] != 'http' or scope['path'].startswith(self.exempt_prefix):
+			await self.app(scope, receive, send)
+			return
+
+		traceparent = None
+		for key, value in scope['headers']:
+			if key == b'traceparent':
+				traceparent = value.decode('latin-1')
+				break
+
+		trace = self.tracer.start_trace(traceparent)
+		trace_token = _current_trace.set(trace)
+		try:
+			with span('request', method = scope['method'], path = scope['path']) as root:
+				async def _send(message: Message) -> None:
+					if message['type'] == 'http.response.start':
+						root.set_attribute('status', message['status'])
+					await send(message)
+
+				await self.app(scope, receive, _send)
+		finally:
+			_current_trace.reset(trace_token)
+
+		# the response has already gone out, so exporting doesn't hold the client up
+		if trace.spans:
+			await self.tracer.finish_trace(trace, trace.spans[-1].duration_secs or 0.0)
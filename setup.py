@@ -17,6 +17,9 @@ setup(
 		'govyn': [ 'py.typed' ],
 	},
 	zip_safe = False,
+	entry_points = {
+		'console_scripts': [ 'govyn-replay = govyn.replay:main' ],
+	},
 	install_requires = [
 		'starlette >= 0.14, < 0.15',
 		'uvicorn >= 0.13',
@@ -25,6 +28,11 @@ setup(
 		# not explicit dependencies, but required to avoid build breaks
 		'aiohttp >= 3.7',
 	],
+	extras_require = {
+		'msgpack': [ 'msgpack >= 1.0' ],
+		'cbor': [ 'cbor2 >= 5.2' ],
+		'arrow': [ 'pyarrow >= 6.0' ],
+	},
 	classifiers=[
 		'Programming Language :: Python :: 3',
 		'License :: OSI Approved :: MIT License',
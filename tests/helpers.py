@@ -1,4 +1,5 @@
-from typing import Any, Callable, Generator, Optional
+import asyncio
+from typing import Any, Awaitable, Callable, Generator, Optional, TypeVar
 
 import pytest
 from govyn.app import create_app
@@ -6,9 +7,19 @@ from govyn.auth import AuthBackend
 from starlette.testclient import TestClient
 
 
-def make_client(srv: Callable[[], Any], auth_backend: Optional[AuthBackend] = None) -> Any:
+def make_client(srv: Callable[[], Any], auth_backend: Optional[AuthBackend] = None, **app_kwargs: Any) -> Any:
 	@pytest.fixture
 	def _client() -> Any:
-		with TestClient(create_app(srv(), auth_backend = auth_backend), raise_server_exceptions=False) as c:
+		with TestClient(create_app(srv(), auth_backend = auth_backend, **app_kwargs), raise_server_exceptions=False) as c:
 			yield c
 	return _client
+
+T = TypeVar('T')
+
+# like asyncio.run, except it leaves the current event loop alone, which the test client still expects to find
+def run_async(coro: Awaitable[T]) -> T:
+	loop = asyncio.new_event_loop()
+	try:
+		return loop.run_until_complete(coro)
+	finally:
+		loop.close()
@@ -0,0 +1,89 @@
+import asyncio
+import gc
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Callable, List, NamedTuple, Tuple, TypedDict
+
+from govyn.app import create_app
+from govyn.asgi import ASGILifespan, asgi_request
+
+# compares the memory taken by each kind of response record, both held in a list and while being
+# served: run with `python -m tests.manual.memory`
+
+ELEMENTS = 100_000
+REQUESTS = 20
+ROWS_PER_REQUEST = 5_000
+
+@dataclass
+class PlainRow:
+	id: int
+	name: str
+	score: float
+
+@dataclass
+class SlottedRow:
+	__slots__ = ( 'id', 'name', 'score' )
+	id: int
+	name: str
+	score: float
+
+class TupleRow(NamedTuple):
+	id: int
+	name: str
+	score: float
+
+class DictRow(TypedDict):
+	id: int
+	name: str
+	score: float
+
+KINDS: List[Tuple[str, Callable[[ int, str, float ], Any], Any]] = [
+	( 'dataclass', PlainRow, PlainRow ),
+	( 'slotted dataclass', SlottedRow, SlottedRow ),
+	( 'NamedTuple', TupleRow, TupleRow ),
+	( 'TypedDict', lambda id, name, score: DictRow(id = id, name = name, score = score), DictRow ),
+]
+
+def measure(func: Callable[[], Any]) -> Tuple[int, int, Any]:
+	gc.collect()
+	tracemalloc.start()
+	try:
+		result = func()
+		current, peak = tracemalloc.get_traced_memory()
+	finally:
+		tracemalloc.stop()
+	return current, peak, result
+
+def make_api(make_row: Callable[[ int, str, float ], Any], row_type: Any) -> Any:
+	class RowAPI:
+		async def get_rows(self, count: int) -> List[row_type]:
+			return [ make_row(i, f'row{i}', i / 2) for i in range(count) ]
+	return RowAPI()
+
+# the peak while serving, counted from after startup so only per-request allocations show up
+def serve_peak(app: Any) -> int:
+	async def scenario() -> int:
+		lifespan = ASGILifespan(app)
+		await lifespan.startup()
+		gc.collect()
+		tracemalloc.start()
+		try:
+			for _ in range(REQUESTS):
+				status, _ = await asgi_request(app, 'GET', '/rows', f'count={ROWS_PER_REQUEST}')
+				assert status == 200
+			_, peak = tracemalloc.get_traced_memory()
+		finally:
+			tracemalloc.stop()
+		await lifespan.shutdown()
+		return peak
+
+	return asyncio.new_event_loop().run_until_complete(scenario())
+
+print(f'{"kind":<20}{"bytes/element held":>20}{"peak bytes/request":>20}{"peak bytes/element":>20}')
+for name, make_row, row_type in KINDS:
+	held, _, rows = measure(lambda: [ make_row(i, f'row{i}', i / 2) for i in range(ELEMENTS) ])
+	del rows
+
+	# each request's garbage is freed before the next, so the peak is the largest single request
+	peak = serve_peak(create_app(make_api(make_row, row_type)))
+	print(f'{name:<20}{held / ELEMENTS:>20.1f}{peak:>20}{peak / ROWS_PER_REQUEST:>20.1f}')
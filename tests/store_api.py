@@ -0,0 +1,74 @@
+import asyncio
+from dataclasses import dataclass
+from datetime import date
+from enum import Enum
+from typing import List, Optional
+
+from govyn.errors import NotFound, ServiceUnavailable
+from govyn.idempotency import idempotent
+from govyn.pagination import Cursor, Page
+
+# the service the generated client tests talk to, kept apart so store_client.pyi can describe its client
+
+class Colour(Enum):
+	red = 'red'
+	blue = 'blue'
+
+@dataclass
+class Item:
+	name: str
+	colour: Colour
+	added: date
+
+@dataclass
+class NewItem:
+	name: str
+	colour: Colour
+
+@dataclass
+class Count:
+	value: int
+
+class StoreAPI:
+	def __init__(self) -> None:
+		self.items = [ Item(f'item{i}', Colour.red if i % 2 else Colour.blue, date(2021, 1, i + 1)) for i in range(5) ]
+		self.lookups = 0
+		self.flaky_failures = 0
+		self.created = 0
+
+	async def get_item(self, name: str) -> Item:
+		self.lookups += 1
+		await asyncio.sleep(0.05)
+		for item in self.items:
+			if item.name == name:
+				return item
+		raise NotFound(f'no item named {name}')
+
+	async def get_search(self, colours: List[Colour], limit: Optional[int] = None) -> List[Item]:
+		return [ i for i in self.items if i.colour in colours ][:limit]
+
+	async def get_page(self, cursor: Cursor) -> Page[Item]:
+		start = cursor.key or 0
+		items = self.items[start:start + cursor.limit]
+		return Page(items, start + cursor.limit if start + cursor.limit < len(self.items) else None)
+
+	async def get_flaky(self) -> Count:
+		if self.flaky_failures > 0:
+			self.flaky_failures -= 1
+			raise ServiceUnavailable('try again')
+		return Count(1)
+
+	async def post_item(self, item: NewItem) -> Count:
+		self.created += 1
+		if self.flaky_failures > 0:
+			self.flaky_failures -= 1
+			raise ServiceUnavailable('try again')
+		self.items.append(Item(item.name, item.colour, date(2021, 2, 1)))
+		return Count(len(self.items))
+
+	@idempotent()
+	async def post_idempotent_item(self, item: NewItem) -> Count:
+		return await self.post_item(item)
+
+	async def post_reverse(self, data: bytes) -> bytes:
+		return data[::-1]
@@ -0,0 +1,6 @@
+from govyn.client import generate_client
+
+from .store_api import StoreAPI
+
+# typed by store_client.pyi, which test_client checks is up to date
+StoreClient = generate_client(StoreAPI)
@@ -0,0 +1,14 @@
+# generated by govyn.client.client_stub, regenerate rather than edit
+import govyn.client
+import govyn.pagination
+import tests.store_api
+import typing
+
+class StoreClient(govyn.client.GovynClient):
+	async def get_flaky(self) -> tests.store_api.Count: ...
+	async def get_item(self, *, name: str) -> tests.store_api.Item: ...
+	async def get_page(self, *, cursor: typing.Union[str, None] = ..., limit: typing.Union[int, None] = ...) -> govyn.pagination.Page[tests.store_api.Item]: ...
+	async def get_search(self, *, colours: typing.List[tests.store_api.Colour], limit: typing.Union[int, None] = ...) -> typing.List[tests.store_api.Item]: ...
+	async def post_idempotent_item(self, item: tests.store_api.NewItem) -> tests.store_api.Count: ...
+	async def post_item(self, item: tests.store_api.NewItem) -> tests.store_api.Count: ...
+	async def post_reverse(self, data: bytes) -> bytes: ...
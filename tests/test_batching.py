@@ -0,0 +1,118 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any, List, Optional, Sequence, Tuple
+
+from govyn.app import create_app
+from govyn.batching import BatchLoader
+from govyn.metrics import MetricsRegistry
+
+from .helpers import run_async
+
+
+@dataclass
+class User:
+	id: int
+	name: str
+
+class UserAPI:
+	def __init__(self) -> None:
+		self.metrics = MetricsRegistry()
+		self.batches: List[List[int]] = []
+		self.users = BatchLoader('users', self.fetch_users, max_batch_size = 50, max_wait_secs = 0.01)
+
+	async def fetch_users(self, ids: List[int]) -> Sequence[Optional[User]]:
+		self.batches.append(ids)
+		return [ User(i, f'user{i}') if i >= 0 else None for i in ids ]
+
+	async def get_user(self, id: int) -> Optional[User]:
+		return await self.users.load(id)
+
+def run(*coros: Any) -> List[Any]:
+	async def gather() -> List[Any]:
+		return list(await asyncio.gather(*coros, return_exceptions = True))
+	return run_async(gather())
+
+def test_concurrent_loads_batched() -> None:
+	srv = UserAPI()
+	users = run(*[ srv.users.load(i % 10) for i in range(30) ])
+	assert [ u.id for u in users ] == [ i % 10 for i in range(30) ]
+	# repeated keys share a slot in the batch
+	assert srv.batches == [ list(range(10)) ]
+
+def test_max_batch_size() -> None:
+	srv = UserAPI()
+	run(srv.users.load_many(list(range(120))))
+	assert [ len(b) for b in srv.batches ] == [ 50, 50, 20 ]
+
+def test_sequential_loads_not_batched() -> None:
+	srv = UserAPI()
+
+	async def load_each() -> None:
+		for i in range(3):
+			await srv.users.load(i)
+
+	run(load_each())
+	assert srv.batches == [ [ 0 ], [ 1 ], [ 2 ] ]
+
+def test_errors_reach_every_caller() -> None:
+	async def fail(keys: List[int]) -> Sequence[int]:
+		raise RuntimeError('database is down')
+
+	loader = BatchLoader('failing', fail)
+	results = run(loader.load(1), loader.load(2))
+	assert [ str(r) for r in results ] == [ 'database is down', 'database is down' ]
+
+def test_mismatched_results() -> None:
+	async def short(keys: List[int]) -> Sequence[int]:
+		return keys[:1]
+
+	loader = BatchLoader('short', short)
+	assert all(isinstance(r, ValueError) for r in run(loader.load(1), loader.load(2)))
+
+def test_cancelled_caller_leaves_others() -> None:
+	srv = UserAPI()
+
+	async def scenario() -> Tuple[Any, Any]:
+		first = asyncio.ensure_future(srv.users.load(1))
+		second = asyncio.ensure_future(srv.users.load(1))
+		await asyncio.sleep(0)
+		first.cancel()
+		return await asyncio.gather(first, second, return_exceptions = True)
+
+	first, second = run(scenario())[0]
+	assert isinstance(first, asyncio.CancelledError)
+	assert second == User(1, 'user1')
+
+async def _get(app: Any, path: str) -> bytes:
+	messages: List[Any] = []
+	request_sent = False
+
+	async def receive() -> Any:
+		nonlocal request_sent
+		if not request_sent:
+			request_sent = True
+			return { 'type': 'http.request', 'body': b'', 'more_body': False }
+		await asyncio.sleep(10)
+
+	async def send(message: Any) -> None:
+		messages.append(message)
+
+	path, _, query = path.partition('?')
+	await app({
+		'type': 'http',
+		'method': 'GET',
+		'path': path,
+		'query_string': query.encode(),
+		'headers': [],
+	}, receive, send)
+	return b''.join(m.get('body', b'') for m in messages[1:])
+
+def test_concurrent_requests() -> None:
+	srv = UserAPI()
+	app = create_app(srv)
+	bodies = run(*[ _get(app, f'/user?id={i}') for i in range(20) ])
+	assert bodies[3] == b'{"id":3,"name":"user3"}'
+	assert len(srv.batches) == 1
+
+	collector = srv.metrics._prom_svc.registry.get('api_batch_size')
+	assert { labels['loader']: values['sum'] for labels, values in collector.get_all() } == { 'users': 20 }
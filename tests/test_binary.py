@@ -0,0 +1,124 @@
+import hashlib
+from typing import Any, AsyncIterator, Callable, List
+
+import pytest
+from govyn.app import create_app
+from govyn.binary import File, content_disposition, parse_range
+from govyn.body import max_body_size
+from govyn.etag import cache_control
+from govyn.route_def import make_route_def
+from starlette.testclient import TestClient
+
+
+class BlobAPI:
+	def __init__(self, root: str) -> None:
+		self.root = root
+
+	async def post_echo(self, data: bytes) -> bytes:
+		return data[::-1]
+
+	@max_body_size(1000)
+	async def post_digest(self, chunks: AsyncIterator[bytes]) -> bytes:
+		h = hashlib.sha256()
+		async for chunk in chunks:
+			h.update(chunk)
+		return h.digest()
+
+	async def get_numbers(self, count: int) -> AsyncIterator[bytes]:
+		for i in range(count):
+			yield f'{i}\n'.encode()
+
+	async def get_file(self, name: str) -> File:
+		return File(f'{self.root}/{name}', 'text/plain', filename = name if name.endswith('.txt') else None)
+
+@pytest.fixture
+def client(tmp_path: Any) -> Any:
+	(tmp_path / 'data.txt').write_bytes(bytes(range(256)) * 4096)
+	(tmp_path / 'empty').write_bytes(b'')
+	with TestClient(create_app(BlobAPI(str(tmp_path))), raise_server_exceptions = False) as c:
+		yield c
+
+def test_bytes_body_and_response(client: Any) -> None:
+	res = client.post('/echo', data = b'\x00\x01\x02')
+	assert res.status_code == 200
+	assert res.headers['content-type'] == 'application/octet-stream'
+	assert res.content == b'\x02\x01\x00'
+
+def test_streamed_body(client: Any) -> None:
+	body = b'x' * 900
+	res = client.post('/digest', data = (chunk for chunk in [ body[:400], body[400:] ]))
+	assert res.content == hashlib.sha256(body).digest()
+
+	assert client.post('/digest', data = b'x' * 1001).status_code == 413
+	assert client.post('/digest', data = (chunk for chunk in [ b'x' * 600, b'x' * 600 ])).status_code == 413
+
+def test_streamed_response(client: Any) -> None:
+	res = client.get('/numbers', params = { 'count': 3 })
+	assert res.content == b'0\n1\n2\n'
+
+def test_file(client: Any, tmp_path: Any) -> None:
+	content = (tmp_path / 'data.txt').read_bytes()
+	res = client.get('/file', params = { 'name': 'data.txt' })
+	assert res.status_code == 200
+	assert res.content == content
+	assert res.headers['content-length'] == str(len(content))
+	assert res.headers['accept-ranges'] == 'bytes'
+	assert res.headers['content-disposition'] == 'attachment; filename="data.txt"'
+
+	for if_none_match in [ res.headers['etag'], f'"other", W/{res.headers["etag"]}', '*' ]:
+		assert client.get('/file', params = { 'name': 'data.txt' }, headers = { 'if-none-match': if_none_match }).status_code == 304
+	assert client.get('/file', params = { 'name': 'missing' }).status_code == 404
+	assert client.get('/file', params = { 'name': 'empty' }).content == b''
+
+def test_file_ranges(client: Any, tmp_path: Any) -> None:
+	content = (tmp_path / 'data.txt').read_bytes()
+
+	res = client.get('/file', params = { 'name': 'data.txt' }, headers = { 'range': 'bytes=300000-' })
+	assert res.status_code == 206
+	assert res.content == content[300000:]
+	assert res.headers['content-range'] == f'bytes 300000-{len(content) - 1}/{len(content)}'
+
+	res = client.get('/file', params = { 'name': 'data.txt' }, headers = { 'range': 'bytes=-10' })
+	assert res.content == content[-10:]
+
+	res = client.get('/file', params = { 'name': 'data.txt' }, headers = { 'range': f'bytes={len(content)}-' })
+	assert res.status_code == 416
+	assert res.headers['content-range'] == f'bytes */{len(content)}'
+
+	# a stale If-Range gets the whole file rather than a piece of a different version
+	res = client.get('/file', params = { 'name': 'data.txt' }, headers = { 'range': 'bytes=0-9', 'if-range': '"stale"' })
+	assert res.status_code == 200
+	assert len(res.content) == len(content)
+
+def test_parse_range() -> None:
+	assert parse_range('bytes=0-9', 100) == (0, 10)
+	assert parse_range('bytes=90-200', 100) == (90, 100)
+	assert parse_range('bytes=-200', 100) == (0, 100)
+	assert parse_range('bytes=5-2', 100) is None
+	assert parse_range('bytes=0-1,5-6', 100) is None
+	assert parse_range('items=0-1', 100) is None
+
+def test_schema(client: Any) -> None:
+	paths = client.get('/openapi/schema').json()['paths']
+	assert paths['/echo']['post']['requestBody']['content'] == { 'application/octet-stream': { 'schema': { 'type': 'string', 'format': 'binary' } } }
+	assert list(paths['/numbers']['get']['responses']['200']['content']) == [ 'application/octet-stream' ]
+	assert { '200', '206', '416' } <= set(paths['/file']['get']['responses'])
+	assert 'Range' in [ p['name'] for p in paths['/file']['get']['parameters'] ]
+
+def test_invalid_binary_routes() -> None:
+	async def get_upload(data: bytes) -> bytes:
+		return data
+
+	@cache_control('max-age=60')
+	async def get_cached(name: str) -> File:
+		return File(name)
+
+	impls: List[Callable[..., Any]] = [ get_upload, get_cached ]
+	for impl in impls:
+		with pytest.raises(Exception):
+			make_route_def(impl)
+
+def test_content_disposition() -> None:
+	assert content_disposition('data.txt') == 'attachment; filename="data.txt"'
+	assert content_disposition('say "hi"\\.txt') == 'attachment; filename="say \\"hi\\"\\\\.txt"'
+	assert content_disposition('naïve\r\n.txt') == "attachment; filename=\"na_ve__.txt\"; filename*=UTF-8''na%C3%AFve%0D%0A.txt"
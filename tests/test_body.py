@@ -0,0 +1,63 @@
+import json
+from dataclasses import dataclass
+from typing import Iterator, List
+
+from govyn.app import create_app
+from govyn.body import max_body_size
+from starlette.testclient import TestClient
+
+from .helpers import make_client
+
+
+@dataclass
+class Blob:
+	values: List[int]
+
+@dataclass
+class BlobSize:
+	count: int
+
+class BodyAPI:
+	async def post_blob(self, blob: Blob) -> BlobSize:
+		return BlobSize(len(blob.values))
+
+	@max_body_size(64 * 1024)
+	async def post_big_blob(self, blob: Blob) -> BlobSize:
+		return BlobSize(len(blob.values))
+
+	async def post_raw(self, data: bytes) -> BlobSize:
+		return BlobSize(len(data))
+
+client = make_client(BodyAPI, max_body_bytes = 1024)
+
+def blob_json(count: int) -> bytes:
+	return json.dumps({ 'values': [ 1 ] * count }).encode('utf-8')
+
+def test_within_limit(client: TestClient) -> None:
+	res = client.post('/blob', data = blob_json(10))
+	assert res.status_code == 200
+	assert res.json() == { 'count': 10 }
+
+def test_content_length_over_limit(client: TestClient) -> None:
+	res = client.post('/blob', data = blob_json(1000))
+	assert res.status_code == 413
+	assert res.json()['error_type'] == 'Request Entity Too Large'
+
+def test_chunked_over_limit(client: TestClient) -> None:
+	def chunks() -> Iterator[bytes]:
+		body = blob_json(1000)
+		for i in range(0, len(body), 100):
+			yield body[i:i + 100]
+
+	res = client.post('/blob', data = chunks())
+	assert res.status_code == 413
+
+def test_route_limit_override(client: TestClient) -> None:
+	res = client.post('/big_blob', data = blob_json(1000))
+	assert res.status_code == 200
+	assert res.json() == { 'count': 1000 }
+
+def test_unlimited_by_default() -> None:
+	with TestClient(create_app(BodyAPI())) as c:
+		res = c.post('/raw', data = b'x' * 2 * 1024 * 1024)
+		assert res.json() == { 'count': 2 * 1024 * 1024 }
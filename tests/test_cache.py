@@ -0,0 +1,164 @@
+import multiprocessing
+import sys
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import pytest
+from govyn.app import create_app
+from govyn.auth import HeaderAuthBackend, Principal
+from govyn.cache import CachedAuthBackend, InMemoryCache, SharedMemoryCache
+from govyn.etag import cache_control
+from starlette.testclient import TestClient
+
+from .helpers import run_async
+
+
+# SharedMemoryCache locks with fcntl, which Windows doesn't have
+requires_fcntl = pytest.mark.skipif(sys.platform == 'win32', reason = 'SharedMemoryCache requires fcntl')
+
+def test_in_memory_lru() -> None:
+	cache = InMemoryCache(max_entries = 2)
+
+	async def scenario() -> None:
+		await cache.set('a', b'1')
+		await cache.set('b', b'2')
+		assert await cache.get('a') == b'1'
+		await cache.set('c', b'3')
+		assert await cache.get('b') is None
+		assert await cache.get('a') == b'1'
+
+		await cache.set('d', b'4', ttl_secs = 0.0)
+		assert await cache.get('d') is None
+		await cache.delete('a')
+		assert await cache.get('a') is None
+
+	run_async(scenario())
+
+@requires_fcntl
+def test_shared_memory_basics(tmp_path: Any) -> None:
+	cache = SharedMemoryCache(str(tmp_path / 'cache'), slots = 16, slot_bytes = 8, ways = 4)
+	try:
+		cache.set_sync('a', b'hello')
+		assert cache.get_sync('a') == b'hello'
+		cache.set_sync('a', b'bye')
+		assert cache.get_sync('a') == b'bye'
+
+		cache.set_sync('big', b'x' * 9)
+		assert cache.get_sync('big') is None
+
+		cache.set_sync('short', b'1', ttl_secs = 0.0)
+		assert cache.get_sync('short') is None
+
+		cache.delete_sync('a')
+		assert cache.get_sync('a') is None
+	finally:
+		cache.close()
+
+@requires_fcntl
+def test_shared_memory_lru_eviction(tmp_path: Any) -> None:
+	# a single bucket, so every key competes for the same two slots
+	cache = SharedMemoryCache(str(tmp_path / 'cache'), slots = 2, slot_bytes = 8, ways = 2)
+	try:
+		cache.set_sync('a', b'1')
+		cache.set_sync('b', b'2')
+		cache.get_sync('a')
+		cache.set_sync('c', b'3')
+		assert cache.get_sync('a') == b'1'
+		assert cache.get_sync('b') is None
+		assert cache.get_sync('c') == b'3'
+	finally:
+		cache.close()
+
+@requires_fcntl
+def test_layout_mismatch(tmp_path: Any) -> None:
+	SharedMemoryCache(str(tmp_path / 'cache'), slots = 16).close()
+	with pytest.raises(ValueError):
+		SharedMemoryCache(str(tmp_path / 'cache'), slots = 32)
+
+def _write_entries(path: str, start: int) -> None:
+	cache = SharedMemoryCache(path, slots = 512, slot_bytes = 16)
+	for i in range(start, start + 50):
+		cache.set_sync(f'key{i}', str(i).encode())
+	cache.close()
+
+@requires_fcntl
+def test_shared_between_processes(tmp_path: Any) -> None:
+	path = str(tmp_path / 'cache')
+	cache = SharedMemoryCache(path, slots = 512, slot_bytes = 16)
+	try:
+		ctx = multiprocessing.get_context('spawn')
+		workers = [ ctx.Process(target = _write_entries, args = (path, start)) for start in (0, 50) ]
+		for w in workers:
+			w.start()
+		for w in workers:
+			w.join(30)
+			assert w.exitcode == 0
+
+		assert cache.get_sync('key7') == b'7'
+		assert cache.get_sync('key93') == b'93'
+	finally:
+		cache.close()
+
+class CountingAuthBackend(HeaderAuthBackend):
+	header = 'Token'
+
+	def __init__(self) -> None:
+		self.lookups = 0
+
+	async def principal_from_header(self, value: str) -> Optional[Principal]:
+		self.lookups += 1
+		if value == 'bad':
+			return None
+		return Principal(value, { 'read' })
+
+@dataclass
+class Report:
+	generation: int
+
+class ReportAPI:
+	def __init__(self) -> None:
+		self.generation = 0
+
+	@cache_control('max-age=5', server_ttl_secs = 60)
+	async def get_report(self, region: str) -> Report:
+		self.generation += 1
+		return Report(self.generation)
+
+@requires_fcntl
+def test_cached_auth(tmp_path: Any) -> None:
+	backend = CountingAuthBackend()
+	cache = SharedMemoryCache(str(tmp_path / 'cache'))
+	app = create_app(ReportAPI(), auth_backend = CachedAuthBackend(backend, cache, ttl_secs = 60))
+	with TestClient(app, raise_server_exceptions = False) as c:
+		for _ in range(3):
+			assert c.get('/report', params = { 'region': 'eu' }, headers = { 'Token': 'alice' }).status_code == 200
+		assert backend.lookups == 1
+
+		assert c.get('/report', params = { 'region': 'eu' }, headers = { 'Token': 'bad' }).status_code == 401
+		assert c.get('/report', params = { 'region': 'eu' }, headers = { 'Token': 'bad' }).status_code == 401
+		assert backend.lookups == 3
+
+def test_server_side_response_cache() -> None:
+	srv = ReportAPI()
+	with TestClient(create_app(srv)) as c:
+		first = c.get('/report', params = { 'region': 'eu' })
+		second = c.get('/report', params = { 'region': 'eu' })
+		assert first.json() == second.json() == { 'generation': 1 }
+		assert second.headers['content-type'] == first.headers['content-type']
+		assert second.headers['etag'] == first.headers['etag']
+		assert c.get('/report', params = { 'region': 'eu' }, headers = { 'if-none-match': first.headers['etag'] }).status_code == 304
+
+		assert c.get('/report', params = { 'region': 'us' }).json() == { 'generation': 2 }
+		assert srv.generation == 2
+
+@requires_fcntl
+def test_response_cache_backend(tmp_path: Any) -> None:
+	cache = SharedMemoryCache(str(tmp_path / 'cache'))
+	first, second = ReportAPI(), ReportAPI()
+	with TestClient(create_app(first, response_cache = cache)) as c:
+		c.get('/report', params = { 'region': 'eu' })
+
+	# a second app (standing in for another worker) sees the first one's responses
+	with TestClient(create_app(second, response_cache = SharedMemoryCache(str(tmp_path / 'cache')))) as c:
+		assert c.get('/report', params = { 'region': 'eu' }).json() == { 'generation': 1 }
+	assert second.generation == 0
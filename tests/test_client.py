@@ -0,0 +1,121 @@
+import asyncio
+import inspect
+from datetime import date
+from typing import Any, List
+
+import pytest
+from govyn.app import create_app
+from govyn.client import (RetryBudget, UnexpectedResponse, client_stub,
+                          default_client_config, encode_query)
+from govyn.errors import NotFound, ServiceUnavailable
+from govyn.metrics import MetricsRegistry
+
+from .helpers import run_async
+from .store_api import Colour, Count, Item, NewItem, StoreAPI
+from .store_client import StoreClient
+
+
+def test_generated_methods() -> None:
+	assert StoreClient.__name__ == 'StoreAPIClient'
+	signature = inspect.signature(StoreClient.get_search)
+	assert list(signature.parameters) == [ 'self', 'colours', 'limit' ]
+	assert signature.parameters['limit'].default is None
+	assert signature.return_annotation == List[Item]
+	assert list(inspect.signature(StoreClient.get_page).parameters) == [ 'self', 'cursor', 'limit' ]
+
+def test_stub_up_to_date() -> None:
+	with open(inspect.getfile(StoreAPI).replace('store_api.py', 'store_client.pyi')) as f:
+		assert f.read() == client_stub(StoreAPI, 'StoreClient')
+
+def test_calls() -> None:
+	srv = StoreAPI()
+
+	async def scenario() -> None:
+		async with StoreClient(create_app(srv)) as client:
+			assert await client.get_item(name = 'item1') == srv.items[1]
+			assert [ i.name for i in await client.get_search(colours = [ Colour.red ], limit = 1) ] == [ 'item1' ]
+			assert await client.post_item(NewItem('new', Colour.blue)) == Count(6)
+			assert await client.post_reverse(b'abc') == b'cba'
+
+			names = []
+			page = await client.get_page(limit = 4)
+			names += [ i.name for i in page.items ]
+			page = await client.get_page(cursor = page.next_key, limit = 4)
+			names += [ i.name for i in page.items ]
+			assert page.next_key is None
+			assert names == [ i.name for i in srv.items ]
+
+			with pytest.raises(NotFound):
+				await client.get_item(name = 'missing')
+			with pytest.raises(TypeError):
+				await client.get_item() # type: ignore
+
+	run_async(scenario())
+
+def test_coalesces_concurrent_gets() -> None:
+	srv = StoreAPI()
+	metrics = MetricsRegistry()
+
+	async def scenario() -> None:
+		async with StoreClient(create_app(srv), metrics_registry = metrics) as client:
+			results = await asyncio.gather(*[ client.get_item(name = 'item2') for _ in range(5) ])
+			# each caller gets its own copy, even though only one request was made
+			assert results[0] == results[4] and results[0] is not results[4]
+			await client.get_item(name = 'item3')
+
+	run_async(scenario())
+	assert srv.lookups == 2
+
+def test_retries() -> None:
+	srv = StoreAPI()
+	config = default_client_config()
+	config.backoff_secs = 0.001
+
+	async def scenario() -> None:
+		async with StoreClient(create_app(srv), config = config) as client:
+			srv.flaky_failures = 2
+			assert await client.get_flaky() == Count(1)
+
+			srv.flaky_failures = 3
+			with pytest.raises(ServiceUnavailable):
+				await client.get_flaky()
+			srv.flaky_failures = 0
+
+			# a plain POST might have done its work before failing, so it's only ever sent once
+			srv.flaky_failures, srv.created = 1, 0
+			with pytest.raises(ServiceUnavailable):
+				await client.post_item(NewItem('a', Colour.red))
+			assert srv.created == 1
+
+			# an idempotent one is safe to send again
+			srv.flaky_failures, srv.created = 1, 0
+			await client.post_idempotent_item(NewItem('b', Colour.red))
+			assert srv.created == 2
+
+	run_async(scenario())
+
+def test_retry_budget() -> None:
+	budget = RetryBudget(ratio = 0.5, min_per_sec = 0.0)
+	assert budget.try_withdraw()
+	assert not budget.try_withdraw()
+	budget.deposit()
+	assert not budget.try_withdraw()
+	budget.deposit()
+	assert budget.try_withdraw()
+
+def test_unexpected_response() -> None:
+	async def teapot(scope: Any, receive: Any, send: Any) -> None:
+		if scope['type'] == 'http':
+			await send({ 'type': 'http.response.start', 'status': 418, 'headers': [] })
+			await send({ 'type': 'http.response.body', 'body': b'short and stout' })
+
+	async def scenario() -> None:
+		async with StoreClient(teapot, run_lifespan = False) as client:
+			with pytest.raises(UnexpectedResponse) as ex:
+				await client.get_flaky()
+			assert ex.value.status == 418
+
+	run_async(scenario())
+
+def test_encode_query() -> None:
+	assert encode_query({ 'a': [ Colour.red, Colour.blue ], 'b': True, 'c': None, 'd': date(2021, 1, 2) }) == 'a=red&a=blue&b=true&d=2021-01-02'
@@ -0,0 +1,92 @@
+from dataclasses import asdict, dataclass
+from datetime import date, datetime
+from enum import Enum
+
+import pytest
+from govyn.codecs import codec_for_accept, parse_accept
+from starlette.testclient import TestClient
+
+from .helpers import make_client
+
+msgpack = pytest.importorskip('msgpack')
+cbor2 = pytest.importorskip('cbor2')
+
+class Colour(Enum):
+	red = 'RED'
+	blue = 'BLUE'
+
+@dataclass
+class Record:
+	name: str
+	count: int
+	colour: Colour
+	created: datetime
+	day: date
+
+class CodecAPI:
+	async def post_echo(self, body: Record) -> Record:
+		return body
+
+example = Record('thing', 3, Colour.blue, datetime(2020, 1, 2, 3, 4, 5), date(2020, 1, 2))
+example_plain = {
+	**asdict(example),
+	'colour': 'BLUE',
+	'created': example.created.isoformat(),
+	'day': example.day.isoformat(),
+}
+
+client = make_client(CodecAPI)
+
+def test_msgpack_roundtrip(client: TestClient) -> None:
+	res = client.post(
+		'/echo',
+		data = msgpack.packb(example_plain),
+		headers = { 'content-type': 'application/msgpack', 'accept': 'application/msgpack' },
+	)
+	assert res.status_code == 200
+	assert res.headers['content-type'] == 'application/msgpack'
+	assert msgpack.unpackb(res.content) == example_plain
+
+def test_cbor_roundtrip(client: TestClient) -> None:
+	res = client.post(
+		'/echo',
+		data = cbor2.dumps(example_plain),
+		headers = { 'content-type': 'application/cbor', 'accept': 'application/cbor' },
+	)
+	assert res.status_code == 200
+	assert res.headers['content-type'] == 'application/cbor'
+	assert cbor2.loads(res.content) == example_plain
+
+def test_binary_request_json_response(client: TestClient) -> None:
+	res = client.post('/echo', data = msgpack.packb(example_plain), headers = { 'content-type': 'application/x-msgpack' })
+	assert res.status_code == 200
+	assert res.json() == example_plain
+
+def test_binary_validation(client: TestClient) -> None:
+	res = client.post('/echo', data = msgpack.packb({ 'name': 'missing fields' }), headers = { 'content-type': 'application/msgpack' })
+	assert res.status_code == 400
+
+@pytest.mark.parametrize('content_type, body, name', [
+	('application/json', b'{"name": "trunc', 'JSON'),
+	('application/json', b'\xff\xfe', 'JSON'),
+	('application/msgpack', b'\xc1', 'MessagePack'),
+	('application/msgpack', b'\x81\xa4name', 'MessagePack'),
+	('application/cbor', b'\xa1', 'CBOR'),
+	('application/cbor', b'\xff', 'CBOR'),
+])
+def test_invalid_body(client: TestClient, content_type: str, body: bytes, name: str) -> None:
+	res = client.post('/echo', data = body, headers = { 'content-type': content_type })
+	assert res.status_code == 400
+	assert res.json()['error_description'] == f'Request body is not valid {name}'
+
+def test_accept_negotiation() -> None:
+	assert parse_accept('application/json;q=0.5, application/cbor, text/html;q=0') == [ 'application/cbor', 'application/json' ]
+	assert codec_for_accept('application/msgpack;q=0.1, application/json').name == 'JSON'
+	assert codec_for_accept('text/html').name == 'JSON'
+	assert codec_for_accept(None).name == 'JSON'
+
+def test_schema_media_types(client: TestClient) -> None:
+	res = client.get('/openapi/schema')
+	spec = res.json()['paths']['/echo']['post']
+	assert set(spec['requestBody']['content']) == { 'application/json', 'application/msgpack', 'application/cbor' }
+	assert set(spec['responses']['200']['content']) == { 'application/json', 'application/msgpack', 'application/cbor' }
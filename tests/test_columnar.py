@@ -0,0 +1,62 @@
+from dataclasses import asdict, dataclass
+from datetime import date
+from typing import List
+
+import pytest
+from govyn.columnar import ARROW_STREAM_MEDIA_TYPE, COLUMNAR_JSON_MEDIA_TYPE
+from starlette.testclient import TestClient
+
+from .helpers import make_client
+
+
+@dataclass
+class Row:
+	id: int
+	name: str
+	day: date
+
+rows = [ Row(1, 'a', date(2021, 1, 1)), Row(2, 'b', date(2021, 1, 2)) ]
+
+columns = {
+	'id': [ 1, 2 ],
+	'name': [ 'a', 'b' ],
+	'day': [ '2021-01-01', '2021-01-02' ],
+}
+
+class RowsAPI:
+	async def get_rows(self) -> List[Row]:
+		return rows
+
+client = make_client(RowsAPI)
+
+def test_rows_by_default(client: TestClient) -> None:
+	res = client.get('/rows')
+	assert res.status_code == 200
+	assert res.json() == [ { **asdict(r), 'day': r.day.isoformat() } for r in rows ]
+
+def test_columnar_query_flag(client: TestClient) -> None:
+	res = client.get('/rows', params = { '_columnar': 'true' })
+	assert res.status_code == 200
+	assert res.json() == columns
+
+def test_columnar_accept(client: TestClient) -> None:
+	res = client.get('/rows', headers = { 'accept': COLUMNAR_JSON_MEDIA_TYPE })
+	assert res.status_code == 200
+	assert res.headers['content-type'] == COLUMNAR_JSON_MEDIA_TYPE
+	assert res.json() == columns
+
+def test_arrow_stream(client: TestClient) -> None:
+	pyarrow_ipc = pytest.importorskip('pyarrow.ipc')
+
+	res = client.get('/rows', headers = { 'accept': ARROW_STREAM_MEDIA_TYPE })
+	assert res.status_code == 200
+	assert res.headers['content-type'] == ARROW_STREAM_MEDIA_TYPE
+	table = pyarrow_ipc.open_stream(res.content).read_all()
+	assert table.column('id').to_pylist() == [ 1, 2 ]
+	assert table.column('day').to_pylist() == [ r.day for r in rows ]
+
+def test_columnar_schema(client: TestClient) -> None:
+	spec = client.get('/openapi/schema').json()['paths']['/rows']['get']
+	schema = spec['responses']['200']['content'][COLUMNAR_JSON_MEDIA_TYPE]['schema']
+	assert schema['properties']['id'] == { 'type': 'array', 'items': { 'type': 'integer', 'format': None } }
+	assert any(p['name'] == '_columnar' for p in spec['parameters'])
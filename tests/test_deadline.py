@@ -0,0 +1,57 @@
+import asyncio
+from dataclasses import asdict, dataclass
+
+from govyn.deadline import Deadline, TimeoutConfig, timeout
+from starlette.testclient import TestClient
+
+from .helpers import make_client
+
+
+@dataclass
+class SleepResponse:
+	slept: bool
+
+@dataclass
+class BudgetResponse:
+	remaining: float
+
+class DeadlineAPI:
+	@timeout(0.05)
+	async def get_slow(self) -> SleepResponse:
+		await asyncio.sleep(1)
+		return SleepResponse(True)
+
+	async def get_fast(self) -> SleepResponse:
+		return SleepResponse(False)
+
+	async def get_sleep(self, secs: float) -> SleepResponse:
+		await asyncio.sleep(secs)
+		return SleepResponse(True)
+
+	async def get_budget(self, deadline: Deadline) -> BudgetResponse:
+		return BudgetResponse(deadline.remaining())
+
+client = make_client(DeadlineAPI, timeout_config = TimeoutConfig(default_secs = 5, header = 'Request-Timeout'))
+
+def test_route_timeout(client: TestClient) -> None:
+	res = client.get('/slow')
+	assert res.status_code == 504
+	assert res.json()['error_type'] == 'Gateway Timeout'
+
+def test_within_deadline(client: TestClient) -> None:
+	res = client.get('/fast')
+	assert res.status_code == 200
+	assert res.json() == asdict(SleepResponse(False))
+
+def test_client_shortened_deadline(client: TestClient) -> None:
+	res = client.get('/sleep', params = { 'secs': 1 }, headers = { 'Request-Timeout': '0.05' })
+	assert res.status_code == 504
+
+def test_client_cannot_extend_deadline(client: TestClient) -> None:
+	res = client.get('/budget', headers = { 'Request-Timeout': '60' })
+	assert res.status_code == 200
+	assert 0 < res.json()['remaining'] <= 5
+
+def test_invalid_deadline_header(client: TestClient) -> None:
+	res = client.get('/fast', headers = { 'Request-Timeout': 'soon' })
+	assert res.status_code == 400
@@ -0,0 +1,95 @@
+from dataclasses import dataclass
+from typing import List
+
+import pytest
+from govyn.etag import Versioned, cache_control
+from govyn.route_def import make_route_def
+from starlette.testclient import TestClient
+
+from .helpers import make_client
+
+
+@dataclass
+class Settings:
+	theme: str
+
+class CachedAPI:
+	def __init__(self) -> None:
+		self.theme = 'dark'
+		self.version = 1
+
+	@cache_control('max-age=60')
+	async def get_settings(self) -> Settings:
+		return Settings(self.theme)
+
+	async def get_versioned_settings(self) -> Versioned[Settings]:
+		return Versioned(Settings(self.theme), str(self.version))
+
+	async def post_theme(self, settings: Settings) -> Settings:
+		self.theme = settings.theme
+		self.version += 1
+		return settings
+
+	async def get_uncached(self) -> List[int]:
+		return [ 1, 2, 3 ]
+
+client = make_client(CachedAPI)
+
+def test_body_etag(client: TestClient) -> None:
+	res = client.get('/settings')
+	assert res.status_code == 200
+	assert res.headers['cache-control'] == 'max-age=60'
+	etag = res.headers['etag']
+
+	res = client.get('/settings', headers = { 'if-none-match': etag })
+	assert res.status_code == 304
+	assert res.content == b''
+	assert res.headers['etag'] == etag
+	assert res.headers['cache-control'] == 'max-age=60'
+
+	client.post('/theme', json = { 'theme': 'light' })
+	res = client.get('/settings', headers = { 'if-none-match': etag })
+	assert res.status_code == 200
+	assert res.json() == { 'theme': 'light' }
+	assert res.headers['etag'] != etag
+
+def test_if_none_match_lists(client: TestClient) -> None:
+	etag = client.get('/settings').headers['etag']
+	assert client.get('/settings', headers = { 'if-none-match': f'"other", W/{etag}' }).status_code == 304
+	assert client.get('/settings', headers = { 'if-none-match': '*' }).status_code == 304
+	assert client.get('/settings', headers = { 'if-none-match': '"other"' }).status_code == 200
+
+def test_versioned(client: TestClient) -> None:
+	res = client.get('/versioned_settings')
+	assert res.status_code == 200
+	assert res.json() == { 'theme': 'dark' }
+	etag = res.headers['etag']
+	assert 'cache-control' not in res.headers
+
+	assert client.get('/versioned_settings', headers = { 'if-none-match': etag }).status_code == 304
+	client.post('/theme', json = { 'theme': 'light' })
+	assert client.get('/versioned_settings', headers = { 'if-none-match': etag }).status_code == 200
+
+def test_versioned_etag_per_encoding(client: TestClient) -> None:
+	json_etag = client.get('/versioned_settings').headers['etag']
+	columnar_etag = client.get('/versioned_settings', params = { '_columnar': 'true' }).headers['etag']
+	assert json_etag != columnar_etag
+
+def test_uncached_routes_untouched(client: TestClient) -> None:
+	res = client.get('/uncached')
+	assert 'etag' not in res.headers
+	assert client.get('/uncached', headers = { 'if-none-match': '*' }).status_code == 200
+
+def test_versioned_schema(client: TestClient) -> None:
+	spec = client.get('/openapi/schema').json()['paths']['/versioned_settings']['get']
+	schema = spec['responses']['200']['content']['application/json']['schema']
+	assert set(schema['properties']) == { 'theme' }
+
+def test_cache_control_get_only() -> None:
+	class BadAPI:
+		@cache_control('max-age=60')
+		async def post_thing(self, settings: Settings) -> Settings:
+			return settings
+
+	with pytest.raises(Exception):
+		make_route_def(BadAPI().post_thing)
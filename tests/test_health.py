@@ -0,0 +1,62 @@
+from dataclasses import dataclass
+from typing import Any
+
+import pytest
+from govyn.app import create_app
+from govyn.health import HealthConfig
+from starlette.applications import Starlette
+from starlette.testclient import TestClient
+
+
+@dataclass
+class PingResponse:
+	pong: bool
+
+class HealthAPI:
+	async def get_ping(self) -> PingResponse:
+		return PingResponse(True)
+
+@pytest.fixture
+def app() -> Starlette:
+	return create_app(HealthAPI(), health_config = HealthConfig(
+		max_in_flight = 10,
+		max_loop_lag_secs = 0.5,
+		loop_lag_interval_secs = 0.1,
+		drain_timeout_secs = 1,
+	))
+
+@pytest.fixture
+def client(app: Starlette) -> Any:
+	with TestClient(app, raise_server_exceptions = False) as c:
+		yield c
+
+def test_live(client: TestClient) -> None:
+	res = client.get('/health/live')
+	assert res.status_code == 200
+
+def test_ready_after_startup(client: TestClient) -> None:
+	res = client.get('/health/ready')
+	assert res.status_code == 200
+	assert res.json()['ready']
+	assert res.json()['in_flight'] == 0
+
+def test_saturated(app: Starlette, client: TestClient) -> None:
+	monitor = getattr(app, 'state').health_monitor
+	monitor.in_flight = 10
+	res = client.get('/health/ready')
+	assert res.status_code == 503
+	assert res.json()['reasons'] == [ 'too many requests in flight' ]
+	monitor.in_flight = 0
+
+def test_draining(app: Starlette, client: TestClient) -> None:
+	getattr(app, 'state').health_monitor.begin_drain()
+
+	res = client.get('/health/ready')
+	assert res.status_code == 503
+	assert 'draining' in res.json()['reasons']
+
+	res = client.get('/ping')
+	assert res.status_code == 503
+
+	res = client.get('/health/live')
+	assert res.status_code == 200
@@ -0,0 +1,192 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+
+import pytest
+from govyn.app import create_app
+from govyn.auth import HeaderAuthBackend, Principal
+from govyn.errors import Conflict, ServiceUnavailable
+from govyn.idempotency import (IdempotencyConfig, InMemoryIdempotencyStore,
+                               StoredResponse, idempotent)
+from starlette.testclient import TestClient
+
+from .helpers import run_async
+
+
+@dataclass
+class Order:
+	item: str
+
+@dataclass
+class Receipt:
+	order_number: int
+	item: str
+
+class ShopAPI:
+	def __init__(self) -> None:
+		self.orders: List[str] = []
+
+	@idempotent()
+	async def post_order(self, order: Order) -> Receipt:
+		await asyncio.sleep(0.05)
+		self.orders.append(order.item)
+		return Receipt(len(self.orders), order.item)
+
+	@idempotent(required = True)
+	async def post_strict_order(self, order: Order) -> Receipt:
+		self.orders.append(order.item)
+		return Receipt(len(self.orders), order.item)
+
+	@idempotent()
+	async def post_limited_order(self, order: Order) -> Receipt:
+		self.orders.append(order.item)
+		if order.item == 'sold out':
+			raise Conflict('out of stock', { 'item': order.item })
+		if order.item == 'busy':
+			raise ServiceUnavailable('try again later')
+		return Receipt(len(self.orders), order.item)
+
+class UserAuthBackend(HeaderAuthBackend):
+	header = 'User'
+
+	async def principal_from_header(self, value: str) -> Optional[Principal]:
+		return Principal(value, set())
+
+@pytest.fixture
+def srv() -> ShopAPI:
+	return ShopAPI()
+
+@pytest.fixture
+def client(srv: ShopAPI) -> Any:
+	with TestClient(create_app(srv, auth_backend = UserAuthBackend()), raise_server_exceptions = False) as c:
+		yield c
+
+def headers(key: Optional[str] = None, user: str = 'alice') -> Any:
+	ret = { 'User': user }
+	if key is not None:
+		ret['Idempotency-Key'] = key
+	return ret
+
+def test_replay(client: TestClient, srv: ShopAPI) -> None:
+	first = client.post('/order', json = { 'item': 'tea' }, headers = headers('k1'))
+	second = client.post('/order', json = { 'item': 'tea' }, headers = headers('k1'))
+	assert first.status_code == second.status_code == 200
+	assert first.json() == second.json() == { 'order_number': 1, 'item': 'tea' }
+	assert second.headers['idempotent-replayed'] == 'true'
+	assert second.headers['content-type'] == first.headers['content-type']
+	assert 'idempotent-replayed' not in first.headers
+	assert srv.orders == [ 'tea' ]
+
+def test_no_key_runs_every_time(client: TestClient, srv: ShopAPI) -> None:
+	client.post('/order', json = { 'item': 'tea' }, headers = headers())
+	client.post('/order', json = { 'item': 'tea' }, headers = headers())
+	assert srv.orders == [ 'tea', 'tea' ]
+
+def test_required_key(client: TestClient, srv: ShopAPI) -> None:
+	assert client.post('/strict_order', json = { 'item': 'tea' }, headers = headers()).status_code == 400
+	assert client.post('/strict_order', json = { 'item': 'tea' }, headers = headers('k1')).status_code == 200
+	assert srv.orders == [ 'tea' ]
+
+def test_key_reused_with_different_body(client: TestClient) -> None:
+	client.post('/order', json = { 'item': 'tea' }, headers = headers('k1'))
+	res = client.post('/order', json = { 'item': 'coffee' }, headers = headers('k1'))
+	assert res.status_code == 409
+
+def test_keys_scoped_to_principal(client: TestClient, srv: ShopAPI) -> None:
+	client.post('/order', json = { 'item': 'tea' }, headers = headers('k1', 'alice'))
+	res = client.post('/order', json = { 'item': 'tea' }, headers = headers('k1', 'bob'))
+	assert res.json()['order_number'] == 2
+	assert srv.orders == [ 'tea', 'tea' ]
+
+def test_failures_not_stored(client: TestClient, srv: ShopAPI) -> None:
+	assert client.post('/order', json = { 'wrong': 'tea' }, headers = headers('k1')).status_code == 400
+	assert client.post('/order', json = { 'item': 'tea' }, headers = headers('k1')).status_code == 200
+	assert srv.orders == [ 'tea' ]
+
+def test_client_errors_replayed(client: TestClient, srv: ShopAPI) -> None:
+	first = client.post('/limited_order', json = { 'item': 'sold out' }, headers = headers('k1'))
+	second = client.post('/limited_order', json = { 'item': 'sold out' }, headers = headers('k1'))
+	assert first.status_code == second.status_code == 409
+	assert first.json() == second.json()
+	assert first.json()['error_data'] == { 'item': 'sold out' }
+	assert second.headers['idempotent-replayed'] == 'true'
+	assert srv.orders == [ 'sold out' ]
+
+def test_server_errors_release_key(client: TestClient, srv: ShopAPI) -> None:
+	assert client.post('/limited_order', json = { 'item': 'busy' }, headers = headers('k1')).status_code == 503
+	second = client.post('/limited_order', json = { 'item': 'busy' }, headers = headers('k1'))
+	assert second.status_code == 503
+	assert 'idempotent-replayed' not in second.headers
+	assert srv.orders == [ 'busy', 'busy' ]
+
+async def _post(app: Any, body: bytes, key: str) -> Tuple[int, bytes]:
+	messages: List[Any] = []
+	request_sent = False
+
+	async def receive() -> Any:
+		nonlocal request_sent
+		if not request_sent:
+			request_sent = True
+			return { 'type': 'http.request', 'body': body, 'more_body': False }
+		await asyncio.sleep(10)
+
+	async def send(message: Any) -> None:
+		messages.append(message)
+
+	await app({
+		'type': 'http',
+		'method': 'POST',
+		'path': '/order',
+		'query_string': b'',
+		'headers': [ (b'idempotency-key', key.encode()), (b'content-type', b'application/json') ],
+	}, receive, send)
+	return messages[0]['status'], b''.join(m.get('body', b'') for m in messages[1:])
+
+def test_concurrent_duplicates_wait() -> None:
+	srv = ShopAPI()
+	app = create_app(srv)
+
+	async def run() -> List[Tuple[int, bytes]]:
+		return await asyncio.gather(*[ _post(app, b'{"item":"tea"}', 'k1') for _ in range(5) ])
+
+	results = run_async(run())
+	assert srv.orders == [ 'tea' ]
+	assert len({ body for _, body in results }) == 1
+	assert all(status == 200 for status, _ in results)
+
+def test_store_expiry() -> None:
+	store = InMemoryIdempotencyStore(max_entries = 2)
+	response = StoredResponse('f', 200, [], b'')
+
+	async def run() -> None:
+		await store.save('a', response, 0.0)
+		assert await store.get('a') is None
+
+		await store.save('b', response, 60.0)
+		await store.save('c', response, 60.0)
+		await store.save('d', response, 60.0)
+		assert await store.get('b') is None
+		assert await store.get('d') is response
+
+	run_async(run())
+
+def test_custom_store_config() -> None:
+	store = InMemoryIdempotencyStore()
+	config = IdempotencyConfig(store = store, ttl_secs = 60.0)
+	with TestClient(create_app(ShopAPI(), idempotency_config = config)) as c:
+		c.post('/order', json = { 'item': 'tea' }, headers = { 'Idempotency-Key': 'k1' })
+	assert len(store._entries) == 1
+
+def test_schema(client: TestClient) -> None:
+	spec = client.get('/openapi/schema').json()['paths']['/strict_order']['post']
+	assert [ (p['name'], p['in'], p['required']) for p in spec['parameters'] ] == [ ('Idempotency-Key', 'header', True) ]
+	assert '409' in spec['responses']
+
+def test_get_routes_rejected() -> None:
+	class BadAPI:
+		@idempotent()
+		async def get_thing(self) -> int:
+			return 1
+
+	with pytest.raises(Exception):
+		create_app(BadAPI())
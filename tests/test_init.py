@@ -1,9 +1,17 @@
+import asyncio
+import signal
 from dataclasses import dataclass, asdict
+from typing import Any, Dict
 
 import pytest
+import uvicorn
+from govyn import _DrainingServer, run
+from govyn.app import create_app
+from govyn.health import HealthMonitor, default_health_config
+from govyn.metrics import MetricsRegistry
 from starlette.testclient import TestClient
 
-from .helpers import make_client
+from .helpers import make_client, run_async
 
 @dataclass
 class Response:
@@ -22,3 +30,25 @@ def test_async_startup(client: TestClient) -> None:
 	res = client.get('/')
 	assert res.status_code == 200
 	assert res.json() == asdict(Response(1))
+
+@pytest.mark.parametrize('uvicorn_kwargs', [ { 'workers': 2 }, { 'reload': True } ])
+def test_run_rejects_import_string_options(uvicorn_kwargs: Dict[str, Any]) -> None:
+	with pytest.raises(Exception, match = 'import string'):
+		run(AsyncInitAPI(), metrics_port = None, uvicorn_kwargs = uvicorn_kwargs)
+
+def test_exit_waits_for_drain() -> None:
+	monitor = HealthMonitor(default_health_config(), MetricsRegistry())
+	server = _DrainingServer(uvicorn.Config(create_app(AsyncInitAPI())), monitor)
+
+	async def scenario() -> None:
+		monitor.request_started()
+		server.handle_exit(signal.SIGTERM, None)
+		await asyncio.sleep(0)
+		assert monitor.draining and server._drain_task is not None
+		assert not server.should_exit
+
+		monitor.request_finished()
+		await server._drain_task
+		assert server.should_exit
+
+	run_async(scenario())
@@ -0,0 +1,130 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, cast
+
+from govyn.app import create_app
+from govyn.auth import HeaderAuthBackend, Principal
+from govyn.errors import BadRequest
+from govyn.jobs import JobQueueConfig, SQLiteJobStore, background_job
+from starlette.testclient import TestClient
+
+from .helpers import make_client
+
+
+@dataclass
+class ReportRequest:
+	size: int
+
+@dataclass
+class Report:
+	total: int
+
+class JobAPI:
+	def __init__(self) -> None:
+		self.release = asyncio.Event()
+
+	@background_job()
+	async def post_report(self, req: ReportRequest) -> Report:
+		if req.size < 0:
+			raise BadRequest('size must not be negative')
+		return Report(sum(range(req.size)))
+
+	@background_job()
+	async def post_blocked(self, req: ReportRequest) -> Report:
+		await self.release.wait()
+		return Report(req.size)
+
+class UserAuthBackend(HeaderAuthBackend):
+	header = 'User'
+
+	async def principal_from_header(self, value: str) -> Optional[Principal]:
+		return Principal(value, set())
+
+client = make_client(JobAPI)
+
+def wait_for_job(client: TestClient, path: str, job_id: str, headers: Dict[str, str] = {}) -> Dict[str, Any]:
+	for _ in range(100):
+		res = client.get(f'{path}_status', params = { 'job_id': job_id }, headers = headers)
+		assert res.status_code == 200
+		if res.json()['state'] in ('succeeded', 'failed'):
+			return cast(Dict[str, Any], res.json())
+		time.sleep(0.01)
+	raise AssertionError('job never finished')
+
+def test_job_lifecycle(client: TestClient) -> None:
+	res = client.post('/report', json = { 'size': 10 })
+	assert res.status_code == 202
+	job_id = res.json()['job_id']
+
+	status = wait_for_job(client, '/report', job_id)
+	assert status['state'] == 'succeeded'
+	assert status['error'] is None
+
+	res = client.get('/report_result', params = { 'job_id': job_id })
+	assert res.status_code == 200
+	assert res.json() == { 'total': 45 }
+
+def test_failed_job(client: TestClient) -> None:
+	job_id = client.post('/report', json = { 'size': -1 }).json()['job_id']
+	status = wait_for_job(client, '/report', job_id)
+	assert status['state'] == 'failed'
+	assert status['error'] == 'size must not be negative'
+
+	res = client.get('/report_result', params = { 'job_id': job_id })
+	assert res.status_code == 409
+
+def test_unfinished_job(client: TestClient) -> None:
+	job_id = client.post('/blocked', json = { 'size': 1 }).json()['job_id']
+	res = client.get('/blocked_status', params = { 'job_id': job_id })
+	assert res.json()['state'] in ('queued', 'running')
+	res = client.get('/blocked_result', params = { 'job_id': job_id })
+	assert res.status_code == 409
+
+def test_unknown_job(client: TestClient) -> None:
+	res = client.get('/report_status', params = { 'job_id': 'nope' })
+	assert res.status_code == 404
+
+def test_job_from_other_route(client: TestClient) -> None:
+	job_id = client.post('/report', json = { 'size': 1 }).json()['job_id']
+	res = client.get('/blocked_status', params = { 'job_id': job_id })
+	assert res.status_code == 404
+
+def test_queue_full() -> None:
+	app = create_app(JobAPI(), job_queue_config = JobQueueConfig(workers = 1, max_queue_size = 1, store = SQLiteJobStore(':memory:')))
+	with TestClient(app, raise_server_exceptions = False) as c:
+		# the first job occupies the only worker, the second fills the queue
+		assert c.post('/blocked', json = { 'size': 1 }).status_code == 202
+		for _ in range(10):
+			res = c.post('/blocked', json = { 'size': 2 })
+			if res.status_code == 429:
+				break
+		assert res.status_code == 429
+
+def test_jobs_scoped_to_principal() -> None:
+	with TestClient(create_app(JobAPI(), auth_backend = UserAuthBackend()), raise_server_exceptions = False) as c:
+		job_id = c.post('/report', json = { 'size': 3 }, headers = { 'user': 'alice' }).json()['job_id']
+		assert wait_for_job(c, '/report', job_id, { 'user': 'alice' })['state'] == 'succeeded'
+		res = c.get('/report_result', params = { 'job_id': job_id }, headers = { 'user': 'bob' })
+		assert res.status_code == 404
+
+def test_sqlite_store_survives_restart(tmp_path: Any) -> None:
+	sqlite_path = str(tmp_path / 'jobs.db')
+	def make_app() -> Any:
+		return create_app(JobAPI(), job_queue_config = JobQueueConfig(workers = 1, max_queue_size = 10, store = SQLiteJobStore(sqlite_path)))
+
+	with TestClient(make_app(), raise_server_exceptions = False) as c:
+		done_id = c.post('/report', json = { 'size': 4 }).json()['job_id']
+		wait_for_job(c, '/report', done_id)
+		stuck_id = c.post('/blocked', json = { 'size': 1 }).json()['job_id']
+
+	with TestClient(make_app(), raise_server_exceptions = False) as c:
+		assert c.get('/report_result', params = { 'job_id': done_id }).json() == { 'total': 6 }
+		status = c.get('/blocked_status', params = { 'job_id': stuck_id }).json()
+		assert status['state'] == 'failed'
+
+def test_job_schema(client: TestClient) -> None:
+	paths = client.get('/openapi/schema').json()['paths']
+	assert '202' in paths['/report']['post']['responses']
+	assert '/report_status' in paths
+	assert '/report_result' in paths
@@ -0,0 +1,57 @@
+import io
+import json
+from dataclasses import replace
+from typing import Any, Dict, List
+
+from govyn.app import create_app
+from govyn.log import LogConfig, default_log_config
+from starlette.testclient import TestClient
+
+
+class LoggedAPI:
+	async def get_ok(self) -> str:
+		return 'ok'
+
+	async def get_broken(self) -> str:
+		raise RuntimeError('something went wrong')
+
+def log_config(**kwargs: Any) -> LogConfig:
+	return replace(default_log_config(), stream = io.StringIO(), **kwargs)
+
+def run_requests(config: LogConfig, paths: List[str]) -> List[Dict[str, Any]]:
+	with TestClient(create_app(LoggedAPI(), log_config = config), raise_server_exceptions = False) as c:
+		for path in paths:
+			c.get(path)
+	# shutdown flushes whatever the writer hadn't got to yet
+	stream = config.stream
+	assert isinstance(stream, io.StringIO)
+	return [ json.loads(line) for line in stream.getvalue().splitlines() ]
+
+def test_access_log() -> None:
+	records = run_requests(log_config(access_log = True), [ '/ok', '/health/live' ])
+	assert len(records) == 1
+	assert records[0]['event'] == 'request'
+	assert records[0]['method'] == 'GET'
+	assert records[0]['path'] == '/ok'
+	assert records[0]['status'] == 200
+	assert records[0]['duration_ms'] >= 0
+
+def test_access_log_disabled() -> None:
+	assert run_requests(log_config(), [ '/ok' ]) == []
+
+def test_sampling_keeps_server_errors() -> None:
+	records = run_requests(log_config(access_log = True, access_sample_rate = 0.0), [ '/ok', '/ok', '/broken' ])
+	requests = [ r for r in records if r['event'] == 'request' ]
+	assert [ r['status'] for r in requests ] == [ 500 ]
+
+def test_error_stack_deduplicated() -> None:
+	records = run_requests(log_config(access_log = False), [ '/broken', '/broken', '/broken' ])
+	assert [ r['event'] for r in records ] == [ 'internal_error' ] * 3
+	assert len({ r['stack_id'] for r in records }) == 1
+	assert 'something went wrong' in records[0]['stack']
+	assert all('stack' not in r for r in records[1:])
+	assert records[0]['path'] == '/broken'
+
+def test_queue_full_drops_records() -> None:
+	records = run_requests(log_config(access_log = True, queue_size = 2, flush_interval_secs = 60.0), [ '/ok' ] * 5)
+	assert len(records) == 2
@@ -0,0 +1,88 @@
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from govyn.app import create_app
+from govyn.auth import HeaderAuthBackend, Principal
+from govyn.memory import default_memory_config
+from govyn.metrics import MetricsRegistry
+from govyn.profiling import DEBUG_PRIVILEGE
+from starlette.testclient import TestClient
+
+from .helpers import make_client
+
+
+@dataclass
+class Numbers:
+	values: List[int]
+
+class LeakyAPI:
+	def __init__(self) -> None:
+		self.leaked: List[bytes] = []
+		self.metrics = MetricsRegistry()
+
+	async def get_leak(self) -> int:
+		self.leaked.append(b'x' * 100000)
+		return len(self.leaked)
+
+	async def get_clean(self) -> int:
+		return len(b'x' * 100000)
+
+	async def post_echo(self, body: Numbers) -> Numbers:
+		return body
+
+class AdminAuthBackend(HeaderAuthBackend):
+	header = 'Token'
+
+	async def principal_from_header(self, value: str) -> Optional[Principal]:
+		return Principal(value, { DEBUG_PRIVILEGE })
+
+client = make_client(LeakyAPI, auth_backend = AdminAuthBackend(), memory_config = default_memory_config())
+
+admin = { 'Token': 'admin' }
+
+def test_route_allocations(client: TestClient) -> None:
+	for _ in range(3):
+		client.get('/leak', headers = admin)
+		client.get('/clean', headers = admin)
+
+	stats = { s['path']: s for s in client.get('/debug/memory_routes', headers = admin).json() }
+	assert stats['/leak']['calls'] == 3
+	assert stats['/leak']['net_allocated_bytes'] >= 300000
+	assert stats['/clean']['net_allocated_bytes'] < 100000
+
+def test_heap_diff(client: TestClient) -> None:
+	first = client.get('/debug/heap', headers = admin).json()
+	assert first['traced_bytes'] > 0
+
+	for _ in range(5):
+		client.get('/leak', headers = admin)
+
+	top = client.get('/debug/heap', headers = admin).json()['top']
+	assert top[0]['size_diff_bytes'] >= 500000
+	assert 'test_memory.py' in top[0]['location']
+
+def test_payload_sizes() -> None:
+	srv = LeakyAPI()
+	with TestClient(create_app(srv, auth_backend = AdminAuthBackend(), memory_config = default_memory_config())) as c:
+		res = c.post('/echo', data = b'{"values":[1,2,3]}', headers = admin)
+		assert res.status_code == 200
+		for path in [ '/nope', '/scan/1', '/scan/2' ]:
+			assert c.get(path, headers = admin).status_code == 404
+		c.get('/health/ready')
+
+	def observed(name: str) -> Dict[str, Any]:
+		collector = srv.metrics._prom_svc.registry.get(name)
+		return { labels['path']: values for labels, values in collector.get_all() }
+
+	assert observed('api_request_body_bytes')['/echo']['sum'] == len(b'{"values":[1,2,3]}')
+	assert observed('api_response_body_bytes')['/echo']['sum'] == len(res.content)
+	# unknown paths share one series, and probes aren't counted at all
+	assert set(observed('api_request_body_bytes')) == { '/echo', 'unmatched' }
+	assert observed('api_request_body_bytes')['unmatched']['count'] == 3
+
+def test_disabled_by_default() -> None:
+	with TestClient(create_app(LeakyAPI(), auth_backend = AdminAuthBackend())) as c:
+		assert not tracemalloc.is_tracing()
+		assert c.get('/debug/heap', headers = admin).status_code == 404
+		assert c.get('/leak', headers = admin).status_code == 200
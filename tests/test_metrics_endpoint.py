@@ -0,0 +1,93 @@
+from typing import Any, Dict
+
+import pytest
+from govyn.app import create_app
+from govyn.exposition import (MetricsEndpointConfig, _Family,
+                              default_metrics_endpoint_config, render_families)
+from govyn.metrics import MetricsRegistry
+from starlette.applications import Starlette
+from starlette.testclient import TestClient
+
+
+class CountingAPI:
+	def __init__(self) -> None:
+		self.metrics = MetricsRegistry()
+		self.calls = self.metrics.counter('api_test_calls_total', 'calls made')
+
+	async def get_count(self) -> int:
+		self.calls.inc(kind = 'a"b')
+		return 1
+
+openmetrics = { 'Accept': 'application/openmetrics-text;version=1.0.0,text/plain;version=0.0.4;q=0.5' }
+
+@pytest.fixture
+def app() -> Starlette:
+	return create_app(CountingAPI(), metrics_endpoint_config = MetricsEndpointConfig(
+		cache_secs = 0.0,
+		gzip_min_bytes = 0,
+		collectors_per_step = 1,
+	))
+
+@pytest.fixture
+def client(app: Starlette) -> Any:
+	with TestClient(app, raise_server_exceptions = False) as c:
+		yield c
+
+def test_text_format(client: TestClient) -> None:
+	client.get('/count')
+	res = client.get('/metrics', headers = { 'Accept-Encoding': 'identity' })
+	assert res.status_code == 200
+	assert res.headers['content-type'] == 'text/plain; version=0.0.4; charset=utf-8'
+	assert 'content-encoding' not in res.headers
+	assert '# HELP api_test_calls_total calls made\n# TYPE api_test_calls_total counter' in res.text
+	assert 'api_test_calls_total{kind="a\\"b"} 1\n' in res.text
+	assert 'api_response_time_seconds_count{app="CountingAPI",method="GET",path="/count",status="200"} 1\n' in res.text
+	assert '# TYPE api_response_time_seconds histogram' in res.text
+	assert 'le="+Inf"' in res.text
+
+def test_openmetrics_format(client: TestClient) -> None:
+	client.get('/count')
+	res = client.get('/metrics', headers = { **openmetrics, 'Accept-Encoding': 'identity' })
+	assert res.headers['content-type'] == 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+	assert '# TYPE api_test_calls counter' in res.text
+	assert 'api_test_calls_total{' in res.text
+	assert res.text.endswith('# EOF\n')
+
+def test_gzip(client: TestClient) -> None:
+	res = client.get('/metrics', headers = { 'Accept-Encoding': 'gzip' })
+	assert res.headers['content-encoding'] == 'gzip'
+	assert '# TYPE' in res.text
+
+def test_cached_scrapes() -> None:
+	srv = CountingAPI()
+	with TestClient(create_app(srv, metrics_endpoint_config = default_metrics_endpoint_config())) as c:
+		first = c.get('/metrics').text
+		c.get('/count')
+		assert c.get('/metrics').text == first
+
+	def observed(name: str) -> Dict[Any, Any]:
+		collector = srv.metrics._prom_svc.registry.get(name)
+		return { tuple(sorted(labels.items())): values for labels, values in collector.get_all() }
+
+	scrapes = observed('api_metrics_scrape_seconds')
+	assert scrapes[(('cache', 'miss'), ('format', 'text'))]['count'] == 1
+	assert scrapes[(('cache', 'hit'), ('format', 'text'))]['count'] == 1
+	assert observed('api_metrics_scrape_bytes')[(('format', 'text'),)]['sum'] > 0
+
+def test_served_while_draining(app: Starlette, client: TestClient) -> None:
+	getattr(app, 'state').health_monitor.begin_drain()
+	assert client.get('/count').status_code == 503
+	assert client.get('/metrics').status_code == 200
+
+def test_disabled_by_default() -> None:
+	with TestClient(create_app(CountingAPI())) as c:
+		assert c.get('/metrics').status_code == 404
+
+def test_render_summary() -> None:
+	families = [ _Family('latency', '', 'summary', [ ({}, { 0.5: 2.0, 'count': 3, 'sum': 6.5 }) ]) ]
+	assert render_families(families, False).decode('utf-8').splitlines() == [
+		'# TYPE latency summary',
+		'latency{quantile="0.5"} 2.0',
+		'latency_count 3',
+		'latency_sum 6.5',
+	]
@@ -0,0 +1,74 @@
+import time
+from dataclasses import asdict, dataclass
+from typing import List
+
+import pytest
+from govyn.errors import GatewayTimeout
+from govyn.metrics import MetricsRegistry
+from govyn.offload import ProcessPool, ProcessPoolConfig, cpu_bound
+from govyn.route_def import make_route_def
+from starlette.testclient import TestClient
+
+from .helpers import make_client, run_async
+
+
+@dataclass
+class SumSquaresRequest:
+	numbers: List[int]
+
+@dataclass
+class SumSquaresResponse:
+	total: int
+
+class OffloadAPI:
+	@staticmethod
+	@cpu_bound()
+	def post_sum_squares(req: SumSquaresRequest) -> SumSquaresResponse:
+		return SumSquaresResponse(sum(n * n for n in req.numbers))
+
+	@staticmethod
+	@cpu_bound()
+	async def get_async_square(n: int) -> SumSquaresResponse:
+		return SumSquaresResponse(n * n)
+
+	@staticmethod
+	@cpu_bound(timeout_secs = 0.05)
+	def get_slow(secs: float) -> SumSquaresResponse:
+		time.sleep(secs)
+		return SumSquaresResponse(0)
+
+client = make_client(OffloadAPI, process_pool_config = ProcessPoolConfig(max_workers = 2, timeout_secs = 10))
+
+def test_offloaded_post(client: TestClient) -> None:
+	res = client.post('/sum_squares', json = asdict(SumSquaresRequest([ 1, 2, 3 ])))
+	assert res.status_code == 200
+	assert res.json() == asdict(SumSquaresResponse(14))
+
+def test_offloaded_async_get(client: TestClient) -> None:
+	res = client.get('/async_square', params = { 'n': 12 })
+	assert res.status_code == 200
+	assert res.json() == asdict(SumSquaresResponse(144))
+
+def test_offloaded_timeout(client: TestClient) -> None:
+	res = client.get('/slow', params = { 'secs': 0.5 })
+	assert res.status_code == 504
+
+def test_explicit_zero_timeout() -> None:
+	pool = ProcessPool(ProcessPoolConfig(max_workers = 1, timeout_secs = 10), MetricsRegistry())
+
+	async def scenario() -> None:
+		# zero means no time at all, rather than falling back to the pool's default
+		with pytest.raises(GatewayTimeout):
+			await pool.run(OffloadAPI.get_slow, { 'secs': 0.2 }, '/slow', timeout_secs = 0)
+		await pool.shutdown()
+
+	run_async(scenario())
+
+def test_bound_methods_rejected() -> None:
+	class BoundAPI:
+		@cpu_bound()
+		def get_thing(self) -> SumSquaresResponse:
+			return SumSquaresResponse(0)
+
+	with pytest.raises(Exception, match = 'cpu_bound handlers must be static methods'):
+		make_route_def(BoundAPI().get_thing)
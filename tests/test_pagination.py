@@ -0,0 +1,122 @@
+import io
+import json
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List
+
+import pytest
+from govyn.app import create_app
+from govyn.log import default_log_config
+from govyn.pagination import (PAGINATION_SECRET_ENV, Cursor, Page,
+                              PaginationConfig, default_pagination_config,
+                              paginated)
+from starlette.testclient import TestClient
+
+from .helpers import make_client
+
+
+@dataclass
+class Item:
+	id: int
+
+items = [ Item(i) for i in range(1, 26) ]
+
+def page_after(cursor: Cursor) -> Page[Item]:
+	last_id = cursor.key or 0
+	page_items = [ i for i in items if i.id > last_id ][:cursor.limit]
+	next_key = page_items[-1].id if page_items and page_items[-1].id < items[-1].id else None
+	return Page(page_items, next_key)
+
+class PagedAPI:
+	async def get_items(self, cursor: Cursor) -> Page[Item]:
+		return page_after(cursor)
+
+	@paginated(default_page_size = 5, max_page_size = 10, streamable = True)
+	async def get_bulk_items(self, min_id: int, cursor: Cursor) -> Page[Item]:
+		page = page_after(cursor)
+		return Page([ i for i in page.items if i.id >= min_id ], page.next_key)
+
+client = make_client(PagedAPI, pagination_config = PaginationConfig(
+	secret = b'test secret',
+	default_page_size = 10,
+	max_page_size = 20,
+))
+
+def fetch_all(client: TestClient, path: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+	fetched: List[Dict[str, Any]] = []
+	cursor = None
+	while True:
+		res = client.get(path, params = { **params, 'cursor': cursor } if cursor else params)
+		assert res.status_code == 200
+		fetched += res.json()['items']
+		cursor = res.json()['next_cursor']
+		if cursor is None:
+			return fetched
+
+def test_default_page_size(client: TestClient) -> None:
+	res = client.get('/items')
+	assert res.status_code == 200
+	assert len(res.json()['items']) == 10
+	assert res.json()['next_cursor'] is not None
+
+def test_walk_all_pages(client: TestClient) -> None:
+	assert fetch_all(client, '/items', { 'limit': 7 }) == [ asdict(i) for i in items ]
+
+def test_page_size_clamped(client: TestClient) -> None:
+	res = client.get('/bulk_items', params = { 'min_id': 0, 'limit': 1000 })
+	assert res.status_code == 200
+	assert len(res.json()['items']) == 10
+
+def test_invalid_limit(client: TestClient) -> None:
+	res = client.get('/items', params = { 'limit': 0 })
+	assert res.status_code == 400
+
+def test_tampered_cursor(client: TestClient) -> None:
+	cursor = client.get('/items').json()['next_cursor']
+	payload, sig = cursor.split('.')
+	res = client.get('/items', params = { 'cursor': f'{payload}x.{sig}' })
+	assert res.status_code == 400
+	res = client.get('/items', params = { 'cursor': 'garbage' })
+	assert res.status_code == 400
+
+def test_cursor_bound_to_route(client: TestClient) -> None:
+	cursor = client.get('/items').json()['next_cursor']
+	res = client.get('/bulk_items', params = { 'min_id': 0, 'cursor': cursor })
+	assert res.status_code == 400
+
+def test_stream_all_pages(client: TestClient) -> None:
+	params: Dict[str, Any] = { 'min_id': 3, 'all_pages': 'true' }
+	res = client.get('/bulk_items', params = params)
+	assert res.status_code == 200
+	assert res.headers['content-type'].startswith('application/x-ndjson')
+	streamed = [ json.loads(line) for line in res.text.splitlines() ]
+	assert streamed == [ asdict(i) for i in items if i.id >= 3 ]
+
+def test_page_schema(client: TestClient) -> None:
+	spec = client.get('/openapi/schema').json()['paths']['/items']['get']
+	assert { p['name'] for p in spec['parameters'] } == { 'cursor', 'limit' }
+	schema = spec['responses']['200']['content']['application/json']['schema']
+	assert set(schema['properties']) == { 'items', 'next_cursor' }
+
+def test_secret_from_environment(monkeypatch: Any) -> None:
+	monkeypatch.setenv(PAGINATION_SECRET_ENV, 'shared')
+	assert default_pagination_config().secret == b'shared'
+
+	monkeypatch.delenv(PAGINATION_SECRET_ENV)
+	assert default_pagination_config().secret != default_pagination_config().secret
+
+def test_warns_without_shared_secret(monkeypatch: Any) -> None:
+	def warnings(**app_kwargs: Any) -> List[str]:
+		stream = io.StringIO()
+		log_config = default_log_config()
+		log_config.stream = stream
+		with TestClient(create_app(PagedAPI(), log_config = log_config, **app_kwargs)):
+			pass
+		return [ r['event'] for r in map(json.loads, stream.getvalue().splitlines()) if r['level'] == 'warning' ]
+
+	# every worker would sign cursors with its own random secret, which the others reject
+	monkeypatch.delenv(PAGINATION_SECRET_ENV, raising = False)
+	assert warnings() == [ 'pagination_secret_not_configured' ]
+	assert warnings(pagination_config = default_pagination_config()) == []
+
+	monkeypatch.setenv(PAGINATION_SECRET_ENV, 'shared')
+	assert warnings() == []
@@ -0,0 +1,232 @@
+import asyncio
+from time import monotonic
+from typing import Any, List, Optional
+
+import pytest
+from govyn.app import create_app
+from govyn.asgi import ASGILifespan, asgi_request
+from govyn.auth import HeaderAuthBackend, Principal
+from govyn.deadline import Deadline
+from govyn.errors import GatewayTimeout, ServiceUnavailable
+from govyn.metrics import MetricsRegistry
+from govyn.priority import (PriorityConfig, PriorityScheduler,
+                            default_priority_config, priority)
+
+from .helpers import run_async
+
+
+def small_config(**changes: Any) -> PriorityConfig:
+	config = default_priority_config()
+	config.max_concurrent = 1
+	config.privilege_classes = { 'admin': 'high', 'batch': 'low' }
+	for name, value in changes.items():
+		setattr(config, name, value)
+	return config
+
+def test_class_for() -> None:
+	scheduler = PriorityScheduler(small_config(), MetricsRegistry())
+	assert scheduler.class_for(None, None) == 'default'
+	assert scheduler.class_for(None, Principal('a', { 'batch' })) == 'low'
+	assert scheduler.class_for(None, Principal('a', { 'batch', 'admin' })) == 'high'
+	assert scheduler.class_for('low', Principal('a', { 'admin' })) == 'low'
+
+	with pytest.raises(Exception):
+		PriorityScheduler(small_config(default_class = 'urgent'), MetricsRegistry())
+
+def test_weighted_admission() -> None:
+	scheduler = PriorityScheduler(small_config(max_queued = 100), MetricsRegistry())
+	order: List[str] = []
+
+	async def request(class_name: str, hold: Optional[asyncio.Event] = None) -> None:
+		async with scheduler.admit(class_name):
+			order.append(class_name)
+			if hold:
+				await hold.wait()
+			await asyncio.sleep(0)
+
+	async def scenario() -> None:
+		# the first holds the only slot, so everything after it queues
+		hold = asyncio.Event()
+		tasks = [ asyncio.ensure_future(request('default', hold)) ]
+		await asyncio.sleep(0)
+		tasks += [ asyncio.ensure_future(request(c)) for c in [ 'low' ] * 4 + [ 'high' ] * 8 ]
+		await asyncio.sleep(0)
+		hold.set()
+		await asyncio.gather(*tasks)
+
+	run_async(scenario())
+	assert order[0] == 'default'
+	# high requests take most of the slots while both are waiting, but low ones still get a turn
+	assert order[1] == 'high'
+	assert 'low' in order[1:9]
+	assert order[1:9].count('high') == 7
+	assert scheduler.running == 0 and scheduler.queued == 0
+
+def test_shedding() -> None:
+	metrics = MetricsRegistry()
+	scheduler = PriorityScheduler(small_config(max_queued = 2), metrics)
+
+	async def request(class_name: str, hold: Optional[asyncio.Event] = None) -> str:
+		try:
+			async with scheduler.admit(class_name):
+				if hold:
+					await hold.wait()
+			return 'ok'
+		except ServiceUnavailable:
+			return 'shed'
+
+	async def scenario() -> List[str]:
+		hold = asyncio.Event()
+		first = asyncio.ensure_future(request('default', hold))
+		await asyncio.sleep(0)
+		queued = [ asyncio.ensure_future(request(c)) for c in [ 'low', 'low' ] ]
+		await asyncio.sleep(0)
+		# a full queue makes room for a higher class by shedding the newest low request...
+		high = asyncio.ensure_future(request('high'))
+		await asyncio.sleep(0)
+		# ...but turns away anything that outranks nobody waiting
+		low = asyncio.ensure_future(request('low'))
+		await asyncio.sleep(0)
+		hold.set()
+		return await asyncio.gather(first, *queued, high, low)
+
+	assert run_async(scenario()) == [ 'ok', 'ok', 'shed', 'ok', 'shed' ]
+
+	collector = metrics._prom_svc.registry.get('api_priority_shed_requests')
+	assert { (labels['class'], labels['reason']): value for labels, value in collector.get_all() } == {
+		('low', 'displaced'): 1,
+		('low', 'queue_full'): 1,
+	}
+
+def test_wait_timeout_and_cancellation() -> None:
+	metrics = MetricsRegistry()
+	scheduler = PriorityScheduler(small_config(max_wait_secs = 0.01), metrics)
+
+	async def scenario() -> None:
+		hold = asyncio.Event()
+
+		async def holder() -> None:
+			async with scheduler.admit('default'):
+				await hold.wait()
+
+		first = asyncio.ensure_future(holder())
+		await asyncio.sleep(0)
+
+		# waiting too long for a slot means the server is overloaded...
+		with pytest.raises(ServiceUnavailable):
+			async with scheduler.admit('high'):
+				pass
+		# ...but the request's own deadline caps the wait when it's shorter, and runs out like any other timeout
+		with pytest.raises(GatewayTimeout):
+			async with scheduler.admit('high', Deadline(monotonic() + 0.005)):
+				pass
+		# and one that's already gone isn't queued at all
+		with pytest.raises(GatewayTimeout):
+			async with scheduler.admit('high', Deadline(monotonic() - 1)):
+				pass
+		assert scheduler.queued == 0
+
+		waiter = asyncio.ensure_future(holder())
+		await asyncio.sleep(0)
+		waiter.cancel()
+		with pytest.raises(asyncio.CancelledError):
+			await waiter
+		assert scheduler.queued == 0
+
+		hold.set()
+		await first
+		assert scheduler.running == 0
+
+	run_async(scenario())
+	collector = metrics._prom_svc.registry.get('api_priority_shed_requests')
+	assert { labels['reason']: value for labels, value in collector.get_all() } == { 'timeout': 1, 'deadline': 2 }
+
+def test_timeout_racing_handover(monkeypatch: Any) -> None:
+	scheduler = PriorityScheduler(small_config(), MetricsRegistry())
+	hold = asyncio.Event()
+
+	async def holder() -> None:
+		async with scheduler.admit('default'):
+			await hold.wait()
+
+	# the slot is handed over, then the timeout fires anyway, as wait_for can do from Python 3.12
+	async def wait_for(future: 'asyncio.Future[None]', timeout: Optional[float]) -> None:
+		hold.set()
+		await asyncio.wait([ future ])
+		raise asyncio.TimeoutError()
+
+	async def scenario() -> None:
+		first = asyncio.ensure_future(holder())
+		await asyncio.sleep(0)
+		monkeypatch.setattr(asyncio, 'wait_for', wait_for)
+		with pytest.raises(ServiceUnavailable):
+			async with scheduler.admit('default'):
+				pass
+		monkeypatch.undo()
+		await first
+
+		# the slot it was handed went back, so the next request is admitted straight away
+		assert scheduler.running == 0 and scheduler.queued == 0
+		async with scheduler.admit('default'):
+			assert scheduler.running == 1
+
+	run_async(scenario())
+
+class ReportAPI:
+	def __init__(self) -> None:
+		self.running = 0
+		self.max_running = 0
+		self.order: List[str] = []
+
+	async def _work(self, name: str) -> str:
+		self.running += 1
+		self.max_running = max(self.max_running, self.running)
+		await asyncio.sleep(0.01)
+		self.order.append(name)
+		self.running -= 1
+		return name
+
+	async def get_report(self, name: str) -> str:
+		return await self._work(name)
+
+	@priority('high')
+	async def get_status(self, name: str) -> str:
+		return await self._work(name)
+
+class TokenAuthBackend(HeaderAuthBackend):
+	header = 'User'
+
+	async def principal_from_header(self, value: str) -> Optional[Principal]:
+		return Principal(value, { value })
+
+def test_app() -> None:
+	srv = ReportAPI()
+	app = create_app(srv, auth_backend = TokenAuthBackend(), priority_config = small_config())
+
+	async def scenario() -> List[Any]:
+		lifespan = ASGILifespan(app)
+		await lifespan.startup()
+		first = asyncio.ensure_future(asgi_request(app, 'GET', '/report', 'name=first', { 'User': 'someone' }))
+		await asyncio.sleep(0.005)
+		rest = [
+			asyncio.ensure_future(asgi_request(app, 'GET', '/report', 'name=batch', { 'User': 'batch' })),
+			asyncio.ensure_future(asgi_request(app, 'GET', '/report', 'name=admin', { 'User': 'admin' })),
+			asyncio.ensure_future(asgi_request(app, 'GET', '/status', 'name=status', { 'User': 'batch' })),
+		]
+		results = await asyncio.gather(first, *rest)
+		await lifespan.shutdown()
+		return [ status for status, _ in results ]
+
+	assert run_async(scenario()) == [ 200 ] * 4
+	assert srv.max_running == 1
+	assert srv.order[0] == 'first'
+	assert srv.order[-1] == 'batch'
+
+def test_unknown_route_class() -> None:
+	class BadAPI:
+		@priority('urgent')
+		async def get_thing(self) -> str:
+			return ''
+
+	with pytest.raises(Exception):
+		create_app(BadAPI())
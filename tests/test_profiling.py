@@ -0,0 +1,88 @@
+import asyncio
+import time
+from dataclasses import replace
+from typing import Any, Dict, Optional
+
+from govyn.app import create_app
+from govyn.auth import HeaderAuthBackend, Principal
+from govyn.profiling import (DEBUG_PRIVILEGE, Profiler, _MeasuredCoroutine,
+                             default_profiling_config)
+from starlette.testclient import TestClient
+
+from .helpers import make_client, run_async
+
+
+def burn_cpu() -> int:
+	return sum(i * i for i in range(200000))
+
+class ProfiledAPI:
+	async def get_busy(self) -> int:
+		return burn_cpu()
+
+	async def get_idle(self) -> int:
+		await asyncio.sleep(0.05)
+		return 0
+
+class TokenAuthBackend(HeaderAuthBackend):
+	header = 'Token'
+
+	async def principal_from_header(self, value: str) -> Optional[Principal]:
+		return Principal(value, { DEBUG_PRIVILEGE } if value == 'admin' else set())
+
+client = make_client(ProfiledAPI, auth_backend = TokenAuthBackend(), profiling_config = replace(default_profiling_config(), route_cpu_stats = True))
+
+admin = { 'Token': 'admin' }
+
+def test_debug_routes_privileged(client: TestClient) -> None:
+	assert client.get('/debug/routes', headers = { 'Token': 'user' }).status_code == 403
+	assert client.get('/debug/routes').status_code == 401
+	assert client.get('/debug/routes', headers = admin).status_code == 200
+
+def test_debug_routes_not_in_schema(client: TestClient) -> None:
+	paths = client.get('/openapi/schema').json()['paths']
+	assert not any(p.startswith('/debug') for p in paths)
+
+def test_route_cpu_attribution(client: TestClient) -> None:
+	client.get('/busy', headers = admin)
+	client.get('/idle', headers = admin)
+
+	stats = { s['path']: s for s in client.get('/debug/routes', headers = admin).json() }
+	assert set(stats) == { '/busy', '/idle' }
+	assert stats['/busy']['calls'] == 1
+	assert stats['/busy']['cpu_secs'] > 0
+	# time spent suspended counts towards wall time but not CPU time
+	assert stats['/idle']['wall_secs'] >= 0.05
+	assert stats['/idle']['cpu_secs'] < stats['/idle']['wall_secs']
+
+def test_route_stats_off_by_default(monkeypatch: Any) -> None:
+	async def measure(*_: Any) -> Any:
+		raise AssertionError('handlers should not be measured')
+
+	monkeypatch.setattr(Profiler, 'measure', measure)
+	with TestClient(create_app(ProfiledAPI(), auth_backend = TokenAuthBackend())) as c:
+		assert c.get('/idle', headers = admin).json() == 0
+		assert c.get('/debug/routes', headers = admin).json() == []
+
+def test_profile(client: TestClient) -> None:
+	params: Dict[str, Any] = { 'seconds': 0.1, 'all_threads': 'true' }
+	res = client.get('/debug/profile', params = params, headers = admin)
+	assert res.status_code == 200
+	profile = res.json()
+	assert profile['samples'] > 0
+	lines = profile['collapsed'].splitlines()
+	assert all(int(line.rsplit(' ', 1)[1]) > 0 for line in lines)
+	assert sum(int(line.rsplit(' ', 1)[1]) for line in lines) == profile['samples']
+
+def test_timed_coroutine_propagates_errors() -> None:
+	async def fail() -> Any:
+		await asyncio.sleep(0)
+		raise ValueError('boom')
+
+	async def run() -> Any:
+		timed = _MeasuredCoroutine(fail(), time.thread_time)
+		try:
+			await timed
+		except ValueError as ex:
+			return str(ex)
+
+	assert run_async(run()) == 'boom'
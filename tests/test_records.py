@@ -0,0 +1,158 @@
+from collections import namedtuple
+from dataclasses import dataclass
+from datetime import date
+from enum import Enum
+from typing import (Any, Callable, Dict, FrozenSet, List, NamedTuple, Optional,
+                    Set, Tuple, TypedDict, TypeVar)
+
+import pytest
+from govyn.auth import Principal
+from govyn.deadline import Deadline
+from govyn.metrics import LabelUpdater
+from govyn.records import contains_namedtuple, decode_value, required_fields
+from govyn.route_def import make_arg_def, make_route_def
+
+from .helpers import make_client
+
+
+class Colour(Enum):
+	red = 'red'
+	blue = 'blue'
+
+class Point(NamedTuple):
+	x: int
+	y: int
+	label: Optional[str] = None
+
+class Tag(TypedDict):
+	name: str
+	colour: Colour
+
+class PartialTag(TypedDict, total = False):
+	name: str
+	weight: float
+
+@dataclass
+class Shape:
+	__slots__ = ( 'name', 'points', 'tags', 'created' )
+	name: str
+	points: List[Point]
+	tags: List[Tag]
+	created: date
+
+LegacyPair = namedtuple('LegacyPair', [ 'left', 'right' ])
+
+class ShapeAPI:
+	async def post_shape(self, shape: Shape) -> Shape:
+		assert isinstance(shape.points[0], Point)
+		return shape
+
+	async def post_point(self, point: Point) -> Point:
+		return point._replace(label = point.label or 'unlabelled')
+
+	async def post_tag(self, tag: Tag) -> Dict[str, Tag]:
+		return { tag['name']: tag }
+
+	async def post_partial(self, tag: PartialTag) -> PartialTag:
+		return tag
+
+	async def get_points(self, count: int) -> List[Point]:
+		return [ Point(i, -i) for i in range(count) ]
+
+	async def get_pair(self) -> LegacyPair:
+		return LegacyPair(1, 'two')
+
+client = make_client(ShapeAPI)
+
+SHAPE = {
+	'name': 'triangle',
+	'points': [ { 'x': 0, 'y': 0, 'label': 'origin' }, { 'x': 1, 'y': 0, 'label': None }, { 'x': 0, 'y': 1, 'label': None } ],
+	'tags': [ { 'name': 'small', 'colour': 'red' } ],
+	'created': '2021-03-04',
+}
+
+def test_round_trips(client: Any) -> None:
+	assert client.post('/shape', json = SHAPE).json() == SHAPE
+	assert client.post('/point', json = { 'x': 1, 'y': 2 }).json() == { 'x': 1, 'y': 2, 'label': 'unlabelled' }
+	assert client.post('/tag', json = { 'name': 'a', 'colour': 'blue' }).json() == { 'a': { 'name': 'a', 'colour': 'blue' } }
+	assert client.post('/partial', json = { 'weight': 2 }).json() == { 'weight': 2.0 }
+	assert client.get('/points', params = { 'count': 2 }).json() == [ { 'x': 0, 'y': 0, 'label': None }, { 'x': 1, 'y': -1, 'label': None } ]
+	assert client.get('/pair').json() == { 'left': 1, 'right': 'two' }
+
+def test_invalid_bodies(client: Any) -> None:
+	assert client.post('/point', json = { 'x': 1 }).status_code == 400
+	assert client.post('/point', json = { 'x': 1, 'y': 'two' }).status_code == 400
+	assert client.post('/tag', json = { 'name': 'a', 'colour': 'green' }).status_code == 400
+	assert client.post('/shape', json = { **SHAPE, 'points': [ { 'x': 0 } ] }).status_code == 400
+
+	res = client.post('/shape', json = { **SHAPE, 'tags': [ { 'name': 1, 'colour': 'red' } ] })
+	assert res.status_code == 400
+	assert 'tags[0].name' in res.json()['error_description']
+
+def test_columnar(client: Any) -> None:
+	res = client.get('/points', params = { 'count': 3, '_columnar': 'true' })
+	assert res.json() == { 'x': [ 0, 1, 2 ], 'y': [ 0, -1, -2 ], 'label': [ None, None, None ] }
+
+def test_schema(client: Any) -> None:
+	schemas = client.get('/openapi/schema').json()['paths']
+	point = schemas['/point']['post']['requestBody']['content']['application/json']['schema']
+	assert point['required'] == [ 'x', 'y' ]
+	assert point['properties']['x'] == { 'type': 'integer', 'format': None }
+
+	partial = schemas['/partial']['post']['requestBody']['content']['application/json']['schema']
+	assert partial['required'] == []
+	assert set(partial['properties']) == { 'name', 'weight' }
+
+def test_helpers() -> None:
+	assert required_fields(Point) == { 'x', 'y' }
+	assert required_fields(Tag) == { 'name', 'colour' }
+	assert contains_namedtuple(Shape)
+	assert contains_namedtuple(Optional[Dict[str, List[Point]]])
+	assert not contains_namedtuple(List[Tag])
+	assert decode_value(Optional[List[Point]], [ { 'x': 1, 'y': 2 } ]) == [ Point(1, 2) ]
+	with pytest.raises(ValueError):
+		decode_value(Point, [ 1, 2 ])
+
+def test_decode_collections() -> None:
+	assert decode_value(Tuple[int, str], [ 1, 'a' ]) == (1, 'a')
+	assert decode_value(Tuple[Point, ...], [ { 'x': 1, 'y': 2 }, { 'x': 3, 'y': 4 } ]) == (Point(1, 2), Point(3, 4))
+	assert decode_value(Tuple[()], []) == ()
+	assert decode_value(Set[Colour], [ 'red', 'blue', 'red' ]) == { Colour.red, Colour.blue }
+	assert decode_value(FrozenSet[int], [ 1, 2 ]) == frozenset([ 1, 2 ])
+
+	for py_type, raw in [
+		(Tuple[int, str], [ 1 ]),
+		(Tuple[int, str], [ 1, 2 ]),
+		(Tuple[int, ...], { 'a': 1 }),
+		(Set[int], 'abc'),
+		(Set[Dict[str, int]], [ { 'a': 1 } ]),
+	]:
+		with pytest.raises(ValueError):
+			decode_value(py_type, raw)
+
+	with pytest.raises(ValueError, match = 'wrong value type for field "points\\[1\\].x"'):
+		decode_value(Tuple[Point, ...], [ { 'x': 1, 'y': 2 }, { 'x': 'three', 'y': 4 } ], 'points')
+
+def test_decode_rejects_bools_as_numbers() -> None:
+	assert decode_value(int, 1) == 1
+	assert decode_value(float, 1) == 1.0
+	assert decode_value(bool, True) is True
+	for py_type in [ int, float ]:
+		with pytest.raises(ValueError):
+			decode_value(py_type, True)
+
+def test_decode_unsupported_type() -> None:
+	for py_type in [ TypeVar('T'), Callable[[ int ], int] ]:
+		with pytest.raises(ValueError, match = 'unsupported type'):
+			decode_value(py_type, 1)
+
+def test_query_args_cannot_be_records() -> None:
+	async def get_nearest(point: Point) -> Point:
+		return point
+
+	with pytest.raises(Exception):
+		make_route_def(get_nearest)
+
+def test_compact_framework_objects() -> None:
+	for obj in [ Principal('a', set()), Deadline(0.0), LabelUpdater({}), make_arg_def(int) ]:
+		assert not hasattr(obj, '__dict__')
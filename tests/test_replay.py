@@ -0,0 +1,149 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Any, List, Optional
+
+from govyn.app import create_app
+from govyn.auth import HeaderAuthBackend, Principal
+from govyn.capture import CaptureConfig, read_capture
+from govyn.replay import format_report, main, replay
+from starlette.testclient import TestClient
+
+from .helpers import run_async
+
+
+@dataclass
+class Sum:
+	total: int
+
+@dataclass
+class Numbers:
+	values: List[int]
+
+class MathAPI:
+	def __init__(self, offset: int = 0) -> None:
+		self.offset = offset
+
+	async def get_add(self, a: int, b: int) -> Sum:
+		return Sum(a + b + self.offset)
+
+	async def post_sum(self, numbers: Numbers) -> Sum:
+		return Sum(sum(numbers.values))
+
+class WhoAPI:
+	async def get_whoami(self, principal: Principal) -> str:
+		return principal.id
+
+class UserAuthBackend(HeaderAuthBackend):
+	header = 'User'
+
+	async def principal_from_header(self, value: str) -> Optional[Principal]:
+		return Principal(value, set())
+
+def capture_config(path: str) -> CaptureConfig:
+	return CaptureConfig(path = path, sample_rate = 1.0, max_body_bytes = 64, queue_size = 100, flush_interval_secs = 0.01)
+
+def make_app() -> Any:
+	return create_app(MathAPI(offset = 1))
+
+def make_who_app() -> Any:
+	return create_app(WhoAPI(), auth_backend = UserAuthBackend())
+
+def capture_traffic(path: str) -> None:
+	with TestClient(create_app(MathAPI(), auth_backend = UserAuthBackend(), capture_config = capture_config(path))) as c:
+		for i in range(3):
+			c.get('/add', params = { 'a': i, 'b': 2 }, headers = { 'User': 'alice' })
+		c.post('/sum', json = { 'values': [ 1, 2, 3 ] }, headers = { 'User': 'bob' })
+		c.post('/sum', json = { 'values': list(range(100)) }, headers = { 'User': 'bob' })
+		c.get('/health/live')
+
+def test_capture(tmp_path: Any) -> None:
+	path = str(tmp_path / 'capture.gz')
+	capture_traffic(path)
+	records = list(read_capture(path))
+
+	# the oversized body and the health check are skipped
+	assert [ (r.method, r.path) for r in records ] == [ ('GET', '/add') ] * 3 + [ ('POST', '/sum') ]
+	assert records[0].query == 'a=0&b=2'
+	assert records[0].principal == 'alice'
+	assert 'user' not in records[0].headers
+	assert json.loads(records[3].body_bytes()) == { 'values': [ 1, 2, 3 ] }
+	assert records[3].headers['content-type'] == 'application/json'
+	assert all(r.status == 200 for r in records)
+
+def test_replay_in_process(tmp_path: Any) -> None:
+	path = str(tmp_path / 'capture.gz')
+	capture_traffic(path)
+	records = list(read_capture(path))
+
+	async def run(app: Any) -> Any:
+		return await replay(records, app, speed = 0.0, extra_headers = { 'User': 'alice' })
+
+	report = run_async(run(create_app(MathAPI(), auth_backend = UserAuthBackend())))
+	assert report.requests == 4
+	routes = { r.path: r for r in report.routes }
+	assert routes['/add'].requests == 3
+	assert routes['/add'].body_changed == 0
+	assert routes['/sum'].status_changed == 0
+
+	# a regression in one route shows up as changed bodies for that route only
+	report = run_async(run(create_app(MathAPI(offset = 1))))
+	routes = { r.path: r for r in report.routes }
+	assert routes['/add'].body_changed == 3
+	assert routes['/sum'].body_changed == 0
+	assert '/add' in format_report(report)
+
+def test_replay_keeps_spacing(tmp_path: Any) -> None:
+	path = str(tmp_path / 'capture.gz')
+	capture_traffic(path)
+	records = list(read_capture(path))
+	records = [ replace(r, time = i * 0.1) for i, r in enumerate(records) ]
+
+	report = run_async(replay(records, make_app(), speed = 2.0))
+	assert report.duration_secs >= 0.15
+
+def test_cli(tmp_path: Any, capsys: Any) -> None:
+	path = str(tmp_path / 'capture.gz')
+	capture_traffic(path)
+
+	# main uses asyncio.run, which would leave this thread without the event loop the test clients expect
+	with ThreadPoolExecutor(1) as pool:
+		exit_code = pool.submit(main, [ path, '--app', 'tests.test_replay:make_app', '--factory', '--speed', '0', '--json' ]).result()
+	report = json.loads(capsys.readouterr().out)
+	assert exit_code == 0
+	assert report['requests'] == 4
+	assert { r['path']: r['body_changed'] for r in report['routes'] } == { '/add': 3, '/sum': 0 }
+
+def capture_who(path: str) -> None:
+	with TestClient(create_app(WhoAPI(), auth_backend = UserAuthBackend(), capture_config = capture_config(path))) as c:
+		for user in [ 'alice', 'bob' ]:
+			assert c.get('/whoami', headers = { 'User': user }).json() == user
+
+def test_replay_as_captured_principals(tmp_path: Any) -> None:
+	path = str(tmp_path / 'capture.gz')
+	capture_who(path)
+	records = list(read_capture(path))
+	assert [ r.principal for r in records ] == [ 'alice', 'bob' ]
+
+	def body_changes(**replay_kwargs: Any) -> int:
+		report = run_async(replay(records, make_who_app(), speed = 0.0, **replay_kwargs))
+		return report.routes[0].body_changed
+
+	# one identity for everything changes whatever the others saw...
+	assert body_changes(extra_headers = { 'User': 'alice' }) == 1
+	# ...while mapping principals to their own credentials replays each as itself
+	assert body_changes(extra_headers = { 'User': 'alice' }, principal_headers = { 'bob': { 'User': 'bob' } }) == 0
+
+def test_cli_principal_headers(tmp_path: Any, capsys: Any) -> None:
+	path = str(tmp_path / 'capture.gz')
+	capture_who(path)
+
+	def replay_cli(*args: str) -> Any:
+		with ThreadPoolExecutor(1) as pool:
+			pool.submit(main, [ path, '--app', 'tests.test_replay:make_who_app', '--factory', '--speed', '0', '--json', *args ]).result()
+		return json.loads(capsys.readouterr().out)['routes'][0]
+
+	# without credentials every request is turned away
+	assert replay_cli()['status_changed'] == 2
+	route = replay_cli('--principal-header', 'alice=User: alice', '--principal-header', 'bob=User:bob')
+	assert route['status_changed'] == route['body_changed'] == 0
@@ -0,0 +1,89 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Iterator, List, Tuple
+
+import pytest
+from govyn.app import create_app
+from govyn.metrics import MetricsRegistry
+from govyn.resources import ResourceRegistry
+from starlette.testclient import TestClient
+
+from .helpers import run_async
+
+
+class FakeConnection:
+	def __init__(self, id: int) -> None:
+		self.id = id
+		self.closed = False
+
+@dataclass
+class ConnectionInfo:
+	connection_id: int
+	session: str
+
+class ResourceAPI:
+	def __init__(self) -> None:
+		self.metrics = MetricsRegistry()
+		self.resources = ResourceRegistry()
+		self.created: List[FakeConnection] = []
+		self.db = self.resources.pool('db', self.connect, self.disconnect, min_size = 1, max_size = 2)
+		self.resources.shared('http_session', self.open_session)
+
+	async def connect(self) -> FakeConnection:
+		conn = FakeConnection(len(self.created))
+		self.created.append(conn)
+		return conn
+
+	async def disconnect(self, conn: FakeConnection) -> None:
+		conn.closed = True
+
+	async def open_session(self) -> str:
+		return 'session'
+
+	async def get_connection(self, db: FakeConnection, http_session: str) -> ConnectionInfo:
+		return ConnectionInfo(db.id, http_session)
+
+@pytest.fixture
+def api_client() -> Iterator[Tuple[ResourceAPI, TestClient]]:
+	api = ResourceAPI()
+	with TestClient(create_app(api), raise_server_exceptions = False) as c:
+		yield api, c
+
+def test_injection(api_client: Tuple[ResourceAPI, TestClient]) -> None:
+	_, client = api_client
+	res = client.get('/connection')
+	assert res.status_code == 200
+	assert res.json() == { 'connection_id': 0, 'session': 'session' }
+
+def test_connection_reused(api_client: Tuple[ResourceAPI, TestClient]) -> None:
+	api, client = api_client
+	for _ in range(3):
+		res = client.get('/connection')
+		assert res.json()['connection_id'] == 0
+
+	assert api.db.size == 1
+	assert api.db.in_use == 0
+
+def test_shutdown_closes_connections() -> None:
+	api = ResourceAPI()
+	with TestClient(create_app(api)) as client:
+		client.get('/connection')
+	assert api.created and all(c.closed for c in api.created)
+
+def test_pool_bounded() -> None:
+	async def run() -> None:
+		api = ResourceAPI()
+		await api.resources.startup()
+		async with api.db.checkout() as a, api.db.checkout() as b:
+			assert { a.id, b.id } == { 0, 1 }
+			waiter = asyncio.ensure_future(api.db.acquire())
+			await asyncio.sleep(0.01)
+			assert not waiter.done()
+
+		conn = await waiter
+		assert api.db.size == 2
+		await api.db.release(conn)
+		await api.resources.shutdown()
+		assert all(c.closed for c in api.created)
+
+	run_async(run())
@@ -0,0 +1,160 @@
+import asyncio
+from dataclasses import dataclass
+from time import perf_counter
+from typing import List, Optional
+
+import pytest
+from govyn.app import create_app
+from govyn.auth import HeaderAuthBackend, Principal
+from govyn.resources import ResourceRegistry
+from govyn.startup import WarmupRequest, default_warmup_config, startup_after
+from starlette.testclient import TestClient
+
+
+class BootAPI:
+	def __init__(self) -> None:
+		self.resources = ResourceRegistry()
+		self.resources.shared('db', self.connect)
+		self.started: List[str] = []
+
+	async def connect(self) -> str:
+		await asyncio.sleep(0.2)
+		self.started.append('db')
+		return 'connection'
+
+	# doesn't need the db, so doesn't wait for it
+	@startup_after()
+	async def startup_cache(self) -> None:
+		await asyncio.sleep(0.2)
+		self.started.append('cache')
+
+	@startup_after('logger')
+	async def startup_flags(self) -> None:
+		self.started.append('flags')
+
+	@startup_after('cache', 'flags')
+	async def startup(self) -> None:
+		self.started.append('service')
+
+def test_hooks_run_concurrently_in_order() -> None:
+	srv = BootAPI()
+	app = create_app(srv)
+	start_time = perf_counter()
+	with TestClient(app):
+		# the db and the cache each take 0.2s, but come up side by side
+		assert perf_counter() - start_time < 0.35
+
+	# the service waited for both of its dependencies, and flags only for the logger
+	assert srv.started[0] == 'flags'
+	assert srv.started[-1] == 'service'
+	assert set(srv.started) == { 'db', 'cache', 'flags', 'service' }
+
+	durations = getattr(app, 'state').startup_graph.durations
+	assert durations['resource:db'] >= 0.2
+	assert durations['cache'] >= 0.2
+	assert { 'logger', 'tracer', 'metrics', 'health', 'service' } <= set(durations)
+
+class AuthedBootAPI:
+	def __init__(self) -> None:
+		self.started: List[str] = []
+
+	async def startup(self) -> None:
+		await asyncio.sleep(0.05)
+		self.started.append('service')
+
+class RecordingAuthBackend(HeaderAuthBackend):
+	header = 'User'
+
+	def __init__(self, srv: AuthedBootAPI) -> None:
+		self.srv = srv
+
+	async def startup(self) -> None:
+		self.srv.started.append('auth')
+
+	async def principal_from_header(self, value: str) -> Optional[Principal]:
+		return Principal(value, set())
+
+def test_builtin_hooks_wait_for_service() -> None:
+	srv = AuthedBootAPI()
+	app = create_app(srv, auth_backend = RecordingAuthBackend(srv))
+	with TestClient(app):
+		pass
+	assert srv.started == [ 'service', 'auth' ]
+
+class UnknownDependencyAPI:
+	@startup_after('nope')
+	async def startup(self) -> None:
+		pass
+
+class CycleAPI:
+	@startup_after('b')
+	async def startup_a(self) -> None:
+		pass
+
+	@startup_after('a')
+	async def startup_b(self) -> None:
+		pass
+
+def test_bad_dependencies_fail_at_creation() -> None:
+	with pytest.raises(Exception, match = 'unknown hook nope'):
+		create_app(UnknownDependencyAPI())
+	with pytest.raises(Exception, match = 'depend on each other'):
+		create_app(CycleAPI())
+
+class FailingAPI:
+	def __init__(self) -> None:
+		self.slow_finished = False
+
+	async def startup_broken(self) -> None:
+		raise RuntimeError('cannot connect')
+
+	async def startup_slow(self) -> None:
+		await asyncio.sleep(1)
+		self.slow_finished = True
+
+def test_failure_fails_startup() -> None:
+	srv = FailingAPI()
+	with pytest.raises(RuntimeError, match = 'cannot connect'):
+		with TestClient(create_app(srv)):
+			pass
+	assert not srv.slow_finished
+
+@dataclass
+class Greeting:
+	text: str
+
+class WarmAPI:
+	def __init__(self) -> None:
+		self.calls: List[str] = []
+
+	async def get_index(self, page: Optional[int] = None) -> Greeting:
+		self.calls.append('index')
+		return Greeting('hi')
+
+	async def get_greet(self, name: str) -> Greeting:
+		self.calls.append(f'greet {name}')
+		return Greeting(f'hello {name}')
+
+	async def get_broken(self) -> Greeting:
+		raise RuntimeError('broken')
+
+def test_warmup() -> None:
+	srv = WarmAPI()
+	config = default_warmup_config([ WarmupRequest('/greet', query = 'name=warm') ])
+	config.rounds = 2
+	app = create_app(srv, warmup_config = config)
+	with TestClient(app, raise_server_exceptions = False) as c:
+		# argless routes and the listed request are both warmed, before any real traffic
+		assert sorted(srv.calls) == sorted([ 'index', 'greet warm' ] * 2)
+		assert c.get('/health/ready').status_code == 200
+
+def test_warmup_failure() -> None:
+	config = default_warmup_config([ WarmupRequest('/broken') ])
+	config.argless_routes = False
+	with TestClient(create_app(WarmAPI(), warmup_config = config), raise_server_exceptions = False) as c:
+		assert c.get('/health/ready').status_code == 200
+
+	config.fail_on_error = True
+	with pytest.raises(Exception, match = 'warmup requests failed'):
+		with TestClient(create_app(WarmAPI(), warmup_config = config), raise_server_exceptions = False):
+			pass
@@ -0,0 +1,119 @@
+import asyncio
+import json
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, List, Optional
+
+import pytest
+from govyn.app import create_app
+from govyn.auth import HeaderAuthBackend, Principal, privileged
+from govyn.subscriptions import SubscriptionConfig
+from starlette.applications import Starlette
+from starlette.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+
+@dataclass
+class Tick:
+	n: int
+
+class StreamAPI:
+	async def sub_ticks(self, count: int) -> AsyncIterator[Tick]:
+		for i in range(count):
+			yield Tick(i)
+
+	async def sub_slow_ticks(self) -> AsyncIterator[Tick]:
+		await asyncio.sleep(0.05)
+		yield Tick(0)
+
+	@privileged('admin')
+	async def sub_admin_ticks(self, principal: Optional[Principal]) -> AsyncIterator[Tick]:
+		assert principal
+		yield Tick(len(principal.id))
+
+	async def get_ping(self) -> str:
+		return 'pong'
+
+class UserAuthBackend(HeaderAuthBackend):
+	header = 'User'
+
+	async def principal_from_header(self, value: str) -> Optional[Principal]:
+		return Principal(value, { 'admin' } if value == 'root' else set())
+
+def make_app(**kwargs: Any) -> Starlette:
+	config = SubscriptionConfig(max_connections = 10, heartbeat_secs = 0.01, send_timeout_secs = 1.0)
+	return create_app(StreamAPI(), subscription_config = config, **kwargs)
+
+def make_client(**kwargs: Any) -> TestClient:
+	return TestClient(make_app(**kwargs), raise_server_exceptions = False)
+
+def parse_sse(text: str) -> List[Any]:
+	return [ json.loads(line[len('data: '):]) for line in text.splitlines() if line.startswith('data: ') ]
+
+@pytest.fixture
+def client() -> Any:
+	with make_client() as c:
+		yield c
+
+def test_sse(client: TestClient) -> None:
+	res = client.get('/ticks', params = { 'count': 3 })
+	assert res.status_code == 200
+	assert res.headers['content-type'].startswith('text/event-stream')
+	assert parse_sse(res.text) == [ { 'n': 0 }, { 'n': 1 }, { 'n': 2 } ]
+	assert 'id: 3' in res.text
+
+def test_sse_heartbeat(client: TestClient) -> None:
+	res = client.get('/slow_ticks')
+	assert res.text.startswith(': heartbeat')
+	assert parse_sse(res.text) == [ { 'n': 0 } ]
+
+def test_sse_invalid_args(client: TestClient) -> None:
+	assert client.get('/ticks').status_code == 400
+
+def test_websocket(client: TestClient) -> None:
+	with client.websocket_connect('/ticks?count=2') as ws:
+		assert ws.receive_json() == { 'n': 0 }
+		assert ws.receive_json() == { 'n': 1 }
+		assert ws.receive()['code'] == 1000
+
+def test_websocket_heartbeat(client: TestClient) -> None:
+	with client.websocket_connect('/slow_ticks') as ws:
+		assert ws.receive_text() == ''
+		message = ''
+		while message == '':
+			message = ws.receive_text()
+		assert json.loads(message) == { 'n': 0 }
+
+def test_connection_limit() -> None:
+	config = SubscriptionConfig(max_connections = 0, heartbeat_secs = 1.0, send_timeout_secs = 1.0)
+	with TestClient(create_app(StreamAPI(), subscription_config = config), raise_server_exceptions = False) as c:
+		assert c.get('/ticks', params = { 'count': 1 }).status_code == 503
+		with pytest.raises(WebSocketDisconnect) as ex:
+			with c.websocket_connect('/ticks?count=1') as ws:
+				ws.receive_json()
+		assert ex.value.code == 1013
+
+def test_privileges() -> None:
+	with make_client(auth_backend = UserAuthBackend()) as c:
+		assert c.get('/admin_ticks').status_code == 401
+		assert c.get('/admin_ticks', headers = { 'User': 'bob' }).status_code == 403
+		assert parse_sse(c.get('/admin_ticks', headers = { 'User': 'root' }).text) == [ { 'n': 4 } ]
+
+		with pytest.raises(WebSocketDisconnect) as ex:
+			with c.websocket_connect('/admin_ticks', headers = { 'User': 'bob' }) as ws:
+				ws.receive_json()
+		assert ex.value.code == 1008
+
+		with c.websocket_connect('/admin_ticks', headers = { 'User': 'root' }) as ws:
+			assert ws.receive_json() == { 'n': 4 }
+
+def test_drain_closes_subscriptions() -> None:
+	app = make_app()
+	with TestClient(app, raise_server_exceptions = False) as c:
+		getattr(app, 'state').health_monitor.begin_drain()
+		assert c.get('/ticks', params = { 'count': 1 }).status_code == 503
+
+def test_schema(client: TestClient) -> None:
+	spec = client.get('/openapi/schema').json()['paths']['/ticks']['get']
+	assert [ p['name'] for p in spec['parameters'] ] == [ 'count' ]
+	schema = spec['responses']['200']['content']['text/event-stream']['schema']
+	assert set(schema['properties']) == { 'n' }
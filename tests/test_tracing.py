@@ -0,0 +1,104 @@
+import asyncio
+import json
+from typing import Any, Dict, List
+
+from govyn.app import create_app
+from govyn.tracing import (FileSpanSink, InMemorySpanSink, Span,
+                           TracingConfig, parse_traceparent, span,
+                           traceparent_header)
+from starlette.testclient import TestClient
+
+
+class TracedAPI:
+	async def get_work(self) -> str:
+		with span('lookup', table = 'users') as s:
+			s.set_attribute('rows', 3)
+			await asyncio.sleep(0)
+		return traceparent_header() or ''
+
+	async def get_slow(self) -> str:
+		with span('sleep'):
+			await asyncio.sleep(0.05)
+		return 'done'
+
+def traced_client(sample_rate: float = 1.0, slow_request_secs: Any = None) -> Any:
+	sink = InMemorySpanSink()
+	config = TracingConfig(sample_rate = sample_rate, slow_request_secs = slow_request_secs, sink = sink)
+	return TestClient(create_app(TracedAPI(), tracing_config = config), raise_server_exceptions = False), sink
+
+def by_name(spans: List[Span]) -> Dict[str, Span]:
+	return { s.name: s for s in spans }
+
+def test_request_spans() -> None:
+	client, sink = traced_client()
+	with client as c:
+		assert c.get('/work').status_code == 200
+
+	spans = by_name(list(sink.spans))
+	assert set(spans) == { 'request', 'parse', 'handler', 'lookup', 'serialize' }
+	assert len({ s.trace_id for s in spans.values() }) == 1
+
+	root = spans['request']
+	assert root.parent_id is None
+	assert root.attributes['status'] == 200
+	assert spans['handler'].parent_id == root.span_id
+	assert spans['lookup'].parent_id == spans['handler'].span_id
+	assert spans['lookup'].attributes == { 'table': 'users', 'rows': 3 }
+
+def test_unsampled_records_nothing() -> None:
+	client, sink = traced_client(sample_rate = 0.0)
+	with client as c:
+		assert c.get('/work').status_code == 200
+	assert len(sink.spans) == 0
+
+def test_traceparent_propagation() -> None:
+	trace_id = '4bf92f3577b34da6a3ce929d0e0e4736'
+	client, sink = traced_client(sample_rate = 0.0)
+	with client as c:
+		res = c.get('/work', headers = { 'traceparent': f'00-{trace_id}-00f067aa0ba902b7-01' })
+
+	spans = by_name(list(sink.spans))
+	assert spans['request'].trace_id == trace_id
+	assert spans['request'].parent_id == '00f067aa0ba902b7'
+
+	# handlers can pass the trace on, with their own span as the parent
+	downstream = parse_traceparent(res.json())
+	assert downstream == { 'trace_id': trace_id, 'parent_id': spans['handler'].span_id, 'sampled': True }
+
+def test_unsampled_parent_propagated() -> None:
+	trace_id = '4bf92f3577b34da6a3ce929d0e0e4736'
+	client, sink = traced_client(sample_rate = 0.0)
+	with client as c:
+		res = c.get('/work', headers = { 'traceparent': f'00-{trace_id}-00f067aa0ba902b7-00' })
+
+	assert len(sink.spans) == 0
+	assert res.json() == f'00-{trace_id}-00f067aa0ba902b7-00'
+
+def test_invalid_traceparent_ignored() -> None:
+	assert parse_traceparent('garbage') is None
+	assert parse_traceparent(f'00-{"0" * 32}-00f067aa0ba902b7-01') is None
+
+	client, sink = traced_client()
+	with client as c:
+		assert c.get('/work', headers = { 'traceparent': 'garbage' }).status_code == 200
+	assert by_name(list(sink.spans))['request'].parent_id is None
+
+def test_tail_sampling_keeps_slow_requests() -> None:
+	client, sink = traced_client(sample_rate = 0.0, slow_request_secs = 0.04)
+	with client as c:
+		c.get('/work')
+		c.get('/slow')
+
+	traces = sink.traces()
+	assert len(traces) == 1
+	assert 'sleep' in by_name(next(iter(traces.values())))
+
+def test_file_sink(tmp_path: Any) -> None:
+	path = str(tmp_path / 'spans.jsonl')
+	config = TracingConfig(sample_rate = 1.0, slow_request_secs = None, sink = FileSpanSink(path))
+	with TestClient(create_app(TracedAPI(), tracing_config = config)) as c:
+		c.get('/work')
+
+	with open(path) as f:
+		spans = [ json.loads(line) for line in f ]
+	assert { s['name'] for s in spans } == { 'request', 'parse', 'handler', 'lookup', 'serialize' }